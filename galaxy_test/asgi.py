@@ -13,4 +13,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'galaxy_test.settings')
 
+# Servir con un servidor ASGI (uvicorn galaxy_test.asgi:application) para que
+# las conexiones SSE de pipeline_app no ocupen un hilo cada una
 application = get_asgi_application()
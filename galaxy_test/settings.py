@@ -14,12 +14,106 @@ from pathlib import Path
 from decouple import config
 
 import os
+import tempfile
 
 
 
 GALAXY_URL=config("GALAXY_URL", default="https://usegalaxy.eu")
 GALAXY_API_KEY = config("GALAXY_API_KEY")
 
+# Conexiones reutilizables hacia Galaxy
+GALAXY_POOL_SIZE = config("GALAXY_POOL_SIZE", default=10, cast=int)
+GALAXY_POOL_IDLE_SEGUNDOS = config("GALAXY_POOL_IDLE_SEGUNDOS", default=300, cast=int)
+GALAXY_TIMEOUT = config("GALAXY_TIMEOUT", default=120, cast=float)
+
+# Limite de peticiones a Galaxy por servidor y API key, compartido por todos
+# los procesos de la maquina (token bucket en un archivo SQLite)
+GALAXY_LIMITE_POR_SEGUNDO = config("GALAXY_LIMITE_POR_SEGUNDO", default=10, cast=float)
+GALAXY_LIMITE_RAFAGA = config("GALAXY_LIMITE_RAFAGA", default=20, cast=int)
+GALAXY_MAX_EN_VUELO = config("GALAXY_MAX_EN_VUELO", default=8, cast=int)
+GALAXY_LIMITE_DB = config(
+    "GALAXY_LIMITE_DB", default=os.path.join(tempfile.gettempdir(), "galaxy_test_limites.sqlite3")
+)
+# Reintentos ante 429 y 5xx, con backoff exponencial y jitter (segundos)
+GALAXY_REINTENTOS = config("GALAXY_REINTENTOS", default=5, cast=int)
+GALAXY_ESPERA_BASE = config("GALAXY_ESPERA_BASE", default=1, cast=float)
+GALAXY_ESPERA_MAXIMA = config("GALAXY_ESPERA_MAXIMA", default=60, cast=float)
+
+# Histogramas de /metrics, compartidos por los procesos web y los workers
+PIPELINE_METRICAS_DB = config(
+    "PIPELINE_METRICAS_DB", default=os.path.join(tempfile.gettempdir(), "galaxy_test_metricas.sqlite3")
+)
+# Cada cuantos segundos vuelca cada proceso lo acumulado en memoria
+PIPELINE_METRICAS_VOLCADO = config("PIPELINE_METRICAS_VOLCADO", default=5, cast=float)
+
+# Traza de llamadas a Galaxy por peticion: se avisa en el log de las que
+# tardan mas de GALAXY_TRAZA_LENTA segundos y de los endpoints llamados
+# GALAXY_TRAZA_REPETIDAS veces o mas en la misma peticion (N+1)
+GALAXY_TRAZA_LENTA = config("GALAXY_TRAZA_LENTA", default=1.0, cast=float)
+GALAXY_TRAZA_REPETIDAS = config("GALAXY_TRAZA_REPETIDAS", default=5, cast=int)
+
+# Esquemas de las herramientas (show_tool con io_details) guardados en disco
+# por servidor, id y version, para validar los parametros antes de run_tool
+GALAXY_ESQUEMAS_DIR = config(
+    "GALAXY_ESQUEMAS_DIR", default=os.path.join(tempfile.gettempdir(), "galaxy_test_esquemas")
+)
+GALAXY_VALIDAR_INPUTS = config("GALAXY_VALIDAR_INPUTS", default=True, cast=bool)
+
+# Tamano de cada PATCH tus al subir archivos a Galaxy
+GALAXY_TUS_CHUNK = config("GALAXY_TUS_CHUNK", default=10 * 1024 * 1024, cast=int)
+# Archivos que el navegador sube a la vez en la subida masiva
+GALAXY_SUBIDAS_PARALELAS = config("GALAXY_SUBIDAS_PARALELAS", default=4, cast=int)
+# Revision de los FASTQ mientras se suben: un archivo danado no se registra en
+# la historia; con calidad media (Phred) menor que PIPELINE_FASTQ_CALIDAD_MINIMA
+# o mas de esa fraccion de lecturas solo N se avisa
+PIPELINE_FASTQ_CALIDAD_MINIMA = config("PIPELINE_FASTQ_CALIDAD_MINIMA", default=20, cast=float)
+PIPELINE_FASTQ_MAX_TODO_N = config("PIPELINE_FASTQ_MAX_TODO_N", default=0.1, cast=float)
+
+# Cache del listado de historias: vigencia sin consultar a Galaxy y cada
+# cuanto se hace un listado completo en lugar de pedir solo los cambios
+GALAXY_CACHE_HISTORIAS_TTL = config("GALAXY_CACHE_HISTORIAS_TTL", default=30, cast=int)
+GALAXY_CACHE_HISTORIAS_COMPLETO = config("GALAXY_CACHE_HISTORIAS_COMPLETO", default=600, cast=int)
+GALAXY_CACHE_CONTENIDOS_TTL = config("GALAXY_CACHE_CONTENIDOS_TTL", default=15, cast=int)
+GALAXY_CACHE_CONTENIDOS_COMPLETO = config("GALAXY_CACHE_CONTENIDOS_COMPLETO", default=900, cast=int)
+# Datasets que todavia pueden cambiar de estado (los terminados no vencen),
+# cuantos se piden a la vez y cuantos se aceptan en una consulta masiva
+GALAXY_CACHE_DATASETS_TTL = config("GALAXY_CACHE_DATASETS_TTL", default=5, cast=int)
+GALAXY_DATASETS_PARALELOS = config("GALAXY_DATASETS_PARALELOS", default=8, cast=int)
+GALAXY_DATASETS_MAXIMO = config("GALAXY_DATASETS_MAXIMO", default=200, cast=int)
+# Tamano de pagina de los listados JSON (historias, jobs) si no se pide otro, y tope
+GALAXY_PAGINA_DEFECTO = config("GALAXY_PAGINA_DEFECTO", default=100, cast=int)
+GALAXY_PAGINA_MAXIMA = config("GALAXY_PAGINA_MAXIMA", default=1000, cast=int)
+
+# Cola de ejecuciones del pipeline
+PIPELINE_WORKERS = config("PIPELINE_WORKERS", default=4, cast=int)
+PIPELINE_LEASE_SEGUNDOS = config("PIPELINE_LEASE_SEGUNDOS", default=300, cast=int)
+PIPELINE_MAX_INTENTOS = config("PIPELINE_MAX_INTENTOS", default=3, cast=int)
+PIPELINE_INTERVALO_SONDEO = config("PIPELINE_INTERVALO_SONDEO", default=5, cast=int)
+PIPELINE_HILOS_POR_WORKER = config("PIPELINE_HILOS_POR_WORKER", default=4, cast=int)
+# Ejecuciones simultaneas por defecto de un lote creado desde una hoja de muestras
+PIPELINE_LOTE_CONCURRENCIA = config("PIPELINE_LOTE_CONCURRENCIA", default=8, cast=int)
+# Tope de lo que se puede pedir en el formulario: cada ejecucion del lote
+# ocupa un hilo de worker y envia jobs con la misma API key
+PIPELINE_LOTE_MAX_CONCURRENCIA = config("PIPELINE_LOTE_MAX_CONCURRENCIA", default=32, cast=int)
+# Reutilizar salidas de jobs con la misma herramienta y las mismas entradas
+PIPELINE_MEMO = config("PIPELINE_MEMO", default=True, cast=bool)
+# "dag": un run_tool por paso. "workflow": los pasos hasta QUAST se envian
+# como una sola invocacion de un workflow de Galaxy
+PIPELINE_MODO = config("PIPELINE_MODO", default="dag")
+PIPELINE_INVOCACION_SONDEO = config("PIPELINE_INVOCACION_SONDEO", default=5, cast=int)
+# Eleccion del ensamblaje: "despues" la hace con N50/L50 calculados localmente
+# sobre los contigs y QUAST corre en paralelo; "antes" espera a QUAST; "no"
+# no corre QUAST. Los contigs mas cortos que PIPELINE_CONTIG_MINIMO no cuentan
+PIPELINE_QUAST = config("PIPELINE_QUAST", default="despues")
+PIPELINE_CONTIG_MINIMO = config("PIPELINE_CONTIG_MINIMO", default=500, cast=int)
+# Eventos en vivo (SSE): cada cuanto se leen los eventos nuevos y cada cuanto
+# se manda un keepalive a los clientes
+PIPELINE_SSE_INTERVALO = config("PIPELINE_SSE_INTERVALO", default=1.0, cast=float)
+PIPELINE_SSE_KEEPALIVE = config("PIPELINE_SSE_KEEPALIVE", default=15, cast=int)
+# Bajo WSGI cada conexion SSE ocupa un hilo: se corta a los tantos segundos y
+# el navegador se reconecta solo desde el ultimo evento
+PIPELINE_SSE_DURACION_WSGI = config("PIPELINE_SSE_DURACION_WSGI", default=300, cast=int)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,11 +140,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     "user_app.apps.UserAppConfig",
+    "pipeline_app.apps.PipelineAppConfig",
     
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pipeline_app.middleware.TrazaGalaxyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,6 +182,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Los workers escriben desde varios hilos: las transacciones toman el
+        # lock de escritura al empezar y esperan en lugar de fallar con
+        # "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+# Cache compartida por los procesos web y los workers: las invalidaciones de
+# historias, las sesiones tus para retomar, los datasets terminados y los
+# resumenes de FASTQ tienen que verse desde cualquier proceso y sobrevivir a
+# un reinicio. Por defecto en archivos en la maquina (como los limites y las
+# metricas); con varias maquinas, CACHE_BACKEND=...RedisCache y CACHE_LOCATION=redis://...
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.filebased.FileBasedCache"),
+        'LOCATION': config("CACHE_LOCATION", default=os.path.join(tempfile.gettempdir(), "galaxy_test_cache")),
+        'OPTIONS': {
+            # Los datasets terminados y las firmas de jobs no vencen: mas entradas
+            # que las 300 por defecto antes de descartar
+            'MAX_ENTRIES': config("CACHE_MAX_ENTRIES", default=50000, cast=int),
+        },
     }
 }
 
@@ -133,5 +253,6 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+LOGIN_URL = '/user/login/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
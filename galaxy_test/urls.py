@@ -1,21 +1,27 @@
 from django.contrib import admin
 from django.urls import path, include
 from . import views
+from pipeline_app import views as pipeline_views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.index, name='index'),
+    path("metrics", pipeline_views.metricas, name="metricas"),
     path("listar_historias/", views.listar_historias, name="listar_historias"),
     path('crear_historia/', views.crear_historia, name="crear_historia"),
     path("subir_archivo/", views.subir_archivo, name="subir_archivo"),
+    path("subir_lote/", views.subir_lote, name="subir_lote"),
+    path("subir_lote/archivo/", views.subir_lote_archivo, name="subir_lote_archivo"),
+    path("subir_lote/emparejar/", views.emparejar_lote, name="emparejar_lote"),
     path('ejecutar_workflow/', views.ejecutar_workflow, name='ejecutar_workflow'),
     path('show_dataset/<str:id>/', views.show_dataset, name='show_dataset'),
+    path('show_datasets/', views.show_datasets, name='show_datasets'),
     path('get_jobs/<str:id>', views.get_jobs, name="get_jobs"),
     path('get_jobs_history/<str:id>', views.get_jobs_history, name="get_jobs_history"),
     # path('probar_trimmomatic/', views.probar_trimmomatic, name='probar_trimmomatic'),
     path("user/", include('user_app.urls')),
-    path("ejecutar_augustus_view/", views.ejecutar_augustus, name="ejecutar_augustus_view"),
+    path("pipeline/", include('pipeline_app.urls')),
 
     
     # URLS Para desarollo
@@ -1,46 +1,66 @@
 import json
-import os
-import tempfile
 import re
 import time
-import pandas as pd
 from django.conf import settings
 from django.http import HttpResponse, JsonResponse
-from bioblend.galaxy import GalaxyInstance
 from django.shortcuts import render
+from django.utils.dateparse import parse_date
 from decouple import config
 import requests
 from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from bs4 import BeautifulSoup
+from pipeline_app import cache as galaxy_cache
+from pipeline_app.galaxy_client import obtener_cliente_sesion
+from pipeline_app.esquemas import obtener_esquema
+from pipeline_app.fastq import guardar_calidad, obtener_calidad, problemas_par
+from pipeline_app.eventos import registrar_evento
+from pipeline_app.models import PipelineRun
+from pipeline_app.paginacion import ParametroInvalido, etag_items, leer_pagina, respuesta_paginada
+from pipeline_app.pares import emparejar_lecturas
+from pipeline_app.uploads import GalaxyTusUploadHandler
+from pipeline_app.pipeline import esperar_finalizacion
 
 GALAXY_URL = settings.GALAXY_URL
-GALAXY_API_KEY = settings.GALAXY_API_KEY
-
-headers = {
-    "x-api-key": GALAXY_API_KEY
-}
 
 def index(request):
     
     return render(request, 'index.html', {})
 
-def obtener_historias():
+def obtener_historias(request):
     
-    #Crear conexion con galaxy
-    gi = GalaxyInstance(settings.GALAXY_URL, key=settings.GALAXY_API_KEY)
+    #Crear conexion con galaxy con la API key del usuario
+    gi = obtener_cliente_sesion(request)
     
-    # Filtrar los parametros que se requieren
-    historias = gi.histories.get_histories(keys=['id', 'name', 'count', 'update_time'])
+    # Listado cacheado por usuario; solo se consulta a Galaxy al vencer
+    historias = galaxy_cache.obtener_historias(gi)
     
     return historias
 
 def listar_historias(request):
+    # Paginado con ?limit=&offset=; filtros ?update_time_min=, ?update_time_max=
+    # (ISO 8601) y ?nombre= (parte del nombre)
+    try:
+        limite, offset = leer_pagina(request)
+    except ParametroInvalido as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    # Obtener historias con metodo auxiliar; el listado ya esta en cache,
+    # asi que se filtra y pagina aca en lugar de pedirlo de nuevo a Galaxy
+    historias = obtener_historias(request)
     
-    # Obtener historias con metodo auxiliar
-    historias = obtener_historias()
+    desde = request.GET.get("update_time_min")
+    hasta = request.GET.get("update_time_max")
+    nombre = request.GET.get("nombre", "").lower()
+    if desde:
+        historias = [h for h in historias if h.get("update_time", "") >= desde]
+    if hasta:
+        historias = [h for h in historias if h.get("update_time", "") <= hasta]
+    if nombre:
+        historias = [h for h in historias if nombre in h.get("name", "").lower()]
     
-    # Conertimos a Json para facilitar su manipulacion
-    return JsonResponse(historias, safe=False)
+    pagina = historias[offset:offset + limite]
+    return respuesta_paginada(request, pagina, limite, offset, etag_items(pagina))
 
 def crear_historia(request):
     if request.method == "POST":
@@ -48,8 +68,9 @@ def crear_historia(request):
         #Obtener parametro del POST
         nombre_historia = request.POST.get('nombre_historia')
         
-        gi = GalaxyInstance(settings.GALAXY_URL, settings.GALAXY_API_KEY)
+        gi = obtener_cliente_sesion(request)
         nueva_historia = gi.histories.create_history(nombre_historia)
+        galaxy_cache.invalidar_historias(gi)
         context = {
             'nueva_historia': nueva_historia
         }
@@ -58,264 +79,121 @@ def crear_historia(request):
         
     return render(request, 'crear_historia.html')
 
+def registrar_subida(gi, archivo, history_id):
+    # Registrar en la historia el archivo que ya esta en la sesion tus
+    respuesta = gi.tools.post_to_fetch(
+        archivo.name,
+        history_id,
+        archivo.session_id,
+        file_name=archivo.name
+    )
+    galaxy_cache.invalidar_historias(gi)
+    galaxy_cache.invalidar_contenidos(gi, history_id)
+    return respuesta["outputs"][0] if respuesta.get("outputs") else {}
+
+@csrf_exempt
 def subir_archivo(request):
+    # El archivo se envia a Galaxy mientras se lee el cuerpo de la peticion,
+    # por eso el handler se cambia antes de que CSRF lea request.POST
+    request.upload_handlers = [GalaxyTusUploadHandler(request)]
+    return _subir_archivo(request)
+
+@csrf_protect
+def _subir_archivo(request):
     
     if request.method == "POST":
         archivo = request.FILES["archivo"]
         history_id = request.POST["history_id"]
         
-        # Crear la ruta temporal 
-        temp_dir = tempfile.gettempdir()
-        
-        # Une la ruta correctamente
-        ruta_temp = os.path.join(temp_dir, archivo.name)
-        
-        # Guardar el archivo temporalmente en el sistema
-        with open(ruta_temp, "wb+") as destino:
-            for chunk in archivo.chunks():
-                destino.write(chunk)
-                
-        # Crear la instancia de Galaxy
-        gi = GalaxyInstance(settings.GALAXY_URL, settings.GALAXY_API_KEY)
-
-        # Subir el archivo a Galaxy
-        dataset = gi.tools.upload_file(
-            path=ruta_temp,
-            history_id=history_id,
-            file_name=archivo.name
-        )
-        
-        context = {
-            'dataset': dataset
-        }
+        if archivo.errores:
+            # FASTQ danado: no se registra en la historia
+            return render(request, "error.html", {
+                "mensaje": f"{archivo.name} no es un FASTQ valido: " + "; ".join(archivo.errores)
+            })
 
-        # Eliminar el archivo temporal despues de subirlo
-        os.remove(ruta_temp)
+        gi = obtener_cliente_sesion(request)
+        dataset = registrar_subida(gi, archivo, history_id)
+        if archivo.calidad and dataset.get("id"):
+            guardar_calidad(gi, dataset["id"], archivo.calidad)
         
         return redirect('subir_archivo')
     
-    historias = obtener_historias()
+    historias = obtener_historias(request)
     context = {
         'historias': historias
     }
     
     return render(request, "subir_archivo.html", context)
 
-def esperar_finalizacion(gi, job_id, intervalo=10):
-    while True:
-        job = gi.jobs.show_job(job_id)
-        estado = job.get("state")
-        if estado in ["ok", "error"]:
-            break
-        time.sleep(intervalo)
-
-def ejecutar_fastqc(history_id, datsets):
-
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
-    
-    results = {}
-
-    for dataset in datsets:
-        tool_inputs = {
-            "input_file": {"src": "hda", "id": dataset}
-        }
-
-        job = gi.tools.run_tool(
-            history_id=history_id,
-            tool_id="toolshed.g2.bx.psu.edu/repos/devteam/fastqc/fastqc/0.72",
-            tool_inputs=tool_inputs,
-        )
-
-        job_id = job["jobs"][0]["id"]
-        esperar_finalizacion(gi, job_id)
-        info = gi.jobs.show_job(job_id)
-
-        outputs = info.get("outputs", {})
-        output_datasets = list(outputs.values())
-
-        results[dataset] = {"job_id": job_id, "output_datasets": output_datasets}
-
-    return results
-
-def ejecutar_trimmomatic(history_id, unaligned_R1, unaligned_R2):    
-
-    gi = GalaxyInstance(url= GALAXY_URL, key=GALAXY_API_KEY)  
-
-    tool_inputs = {
-        "readtype|single_or_paired": "pair_of_files",
-        "readtype|fastq_r1_in": {"src": "hda", "id": unaligned_R1},
-        "readtype|fastq_r2_in": {"src": "hda", "id": unaligned_R2},
-        "illuminaclip|do_illuminaclip": "no",
-        }
-    
-    job = gi.tools.run_tool(
-        history_id=history_id,
-        tool_id="toolshed.g2.bx.psu.edu/repos/pjbriggs/trimmomatic/trimmomatic/0.39+galaxy2",
-        tool_inputs=tool_inputs,
-    )
-
-    job_id = job["jobs"][0]["id"]
-    esperar_finalizacion(gi, job_id)
-    info = gi.jobs.show_job(job_id)
-
-    outputs = info.get("outputs", {})
-    output_datasets = list(outputs.values())
-
-    paired_R1 = outputs.get("fastq_out_r1_paired", {}).get("id")
-    paired_R2 = outputs.get("fastq_out_r2_paired", {}).get("id")
-
-    return job_id, output_datasets, paired_R1, paired_R2
-
-def ejecutar_bowtie(history_id, datasetID_R1, datasetID_R2, genomaId):
-
-    gi = GalaxyInstance(url= GALAXY_URL, key=GALAXY_API_KEY)  
-
-    tool_inputs = {
-        "library|type": "paired",
-        "library|input_1": {"src": "hda", "id": datasetID_R1},
-        "library|input_2": {"src": "hda", "id": datasetID_R2},
-        "library|unaligned_file": "true",     
-        "library|aligned_file": "true",       
-
-        "library|paired_options|paired_options_selector": "no",
-
-        "reference_genome|source": "history",
-        "reference_genome|own_file": {"src": "hda", "id": genomaId},
+def subir_lote(request):
+    # Pagina de subida masiva: el navegador sube varios archivos a la vez,
+    # cada uno en su propia peticion a subir_lote_archivo
+    context = {
+        'historias': obtener_historias(request),
+        'subidas_paralelas': settings.GALAXY_SUBIDAS_PARALELAS,
     }
+    return render(request, "subir_lote.html", context)
+
+@csrf_exempt
+def subir_lote_archivo(request):
+    request.upload_handlers = [GalaxyTusUploadHandler(request)]
+    return _subir_lote_archivo(request)
+
+@csrf_protect
+def _subir_lote_archivo(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Metodo no permitido"}, status=405)
+
+    archivo = request.FILES.get("archivo")
+    history_id = request.POST.get("history_id")
+    if archivo is None or not history_id:
+        return JsonResponse({"error": "Falta el archivo o la historia"}, status=400)
+
+    if archivo.errores:
+        return JsonResponse({
+            "error": f"{archivo.name} no es un FASTQ valido",
+            "errores": archivo.errores,
+            "calidad": archivo.calidad,
+        }, status=422)
+
+    gi = obtener_cliente_sesion(request)
+    dataset = registrar_subida(gi, archivo, history_id)
+    if archivo.calidad and dataset.get("id"):
+        guardar_calidad(gi, dataset["id"], archivo.calidad)
+
+    return JsonResponse({
+        "nombre": archivo.name,
+        "tamano": archivo.size,
+        "dataset_id": dataset.get("id"),
+        "hid": dataset.get("hid"),
+        "calidad": archivo.calidad,
+        "avisos": archivo.calidad["warnings"] if archivo.calidad else [],
+    })
 
-    job = gi.tools.run_tool(
-        history_id=history_id,
-        tool_id="toolshed.g2.bx.psu.edu/repos/devteam/bowtie2/bowtie2/2.5.3+galaxy0",
-        tool_inputs=tool_inputs,
-        )
-
-
-    job_id = job["jobs"][0]["id"]
-    esperar_finalizacion(gi, job_id)
-    info = gi.jobs.show_job(job_id)
-
-    outputs = info.get("outputs", {})
-    output_datasets = list(outputs.values())
-
-
-    unaligned_R1 = outputs.get("output_unaligned_reads_r", {}).get("id")
-    unaligned_R2 = outputs.get("output_unaligned_reads_l", {}).get("id")
-
-    return job_id, output_datasets, unaligned_R1, unaligned_R2
-
-def ejecutar_shovill(history_id, paired_R1, paired_R2, type_assembler):
+def emparejar_lote(request):
+    # Recibe los archivos subidos ([{"name", "id"}]) y devuelve los pares R1/R2
+    if request.method != "POST":
+        return JsonResponse({"error": "Metodo no permitido"}, status=405)
 
-    gi = GalaxyInstance(url= GALAXY_URL, key=GALAXY_API_KEY)  
+    try:
+        datasets = json.loads(request.body)["datasets"]
+    except (ValueError, KeyError):
+        return JsonResponse({"error": "Cuerpo invalido"}, status=400)
 
-    tool_inputs = {
-        "library|lib_type": "paired",
-        "library|R1": {"src": "hda", "id": paired_R1,},
-        "library|R2": {"src": "hda", "id": paired_R2,},
-        "assembler": type_assembler
-    }
+    pares, sueltos = emparejar_lecturas(datasets)
 
-    job = gi.tools.run_tool(
-        history_id=history_id,
-        tool_id="toolshed.g2.bx.psu.edu/repos/iuc/shovill/shovill/1.1.0+galaxy2",
-        tool_inputs=tool_inputs,
+    # R1 y R2 con distinta cantidad de lecturas o nombres distintos
+    gi = obtener_cliente_sesion(request)
+    for par in pares:
+        par["problemas"] = problemas_par(
+            obtener_calidad(gi, par["r1"].get("id")), obtener_calidad(gi, par["r2"].get("id"))
         )
-
-    job_id = job["jobs"][0]["id"]
-    esperar_finalizacion(gi, job_id)
-    info = gi.jobs.show_job(job_id)
-
-    outputs = info.get("outputs", {})
-    output_datasets = list(outputs.values())
-
-    shovill = outputs.get("contigs", {}).get("id")
-
-    return job_id, output_datasets, shovill
-
-def ejecutar_quast(history_id, contigs):
-    
-    gi = GalaxyInstance(url= GALAXY_URL, key=GALAXY_API_KEY)
-
-    results = {}
-    datasets_calidad = {}
-    winner = None
-
-    for contigId in contigs:
-        tool_inputs = {
-            "mode|mode": "individual",
-            "mode|in|custom": "false",
-            "mode|in|inputs": {"src": "hda","id": contigId},
-            "output_files": ["tabular"]
-        }
-
-        job = gi.tools.run_tool(
-            history_id=history_id,
-            tool_id="toolshed.g2.bx.psu.edu/repos/iuc/quast/quast/5.3.0+galaxy1",
-            tool_inputs=tool_inputs,
-            )
-
-        job_id = job["jobs"][0]["id"]
-        esperar_finalizacion(gi, job_id)
-
-        info = gi.jobs.show_job(job_id)
-
-        outputs = info.get("outputs", {})
-        output_datasets = list(outputs.values())
-
-        id_tsv = outputs['report_tabular']['id']
-        ruta = '/tmp/report.tsv'
-
-        gi.datasets.download_dataset(id_tsv, file_path=ruta, use_default_filename=False)
-
-        data_tsv = pd.read_csv(ruta, sep="\t", index_col=0)
-
-        n50 = data_tsv.loc["N50"].values[0]
-        l50 = data_tsv.loc["L50"].values[0]
-
-        datasets_calidad[contigId] = {'N50':n50, 'L50': l50}
-
-        os.remove(ruta)
-
-        results[contigId] = {"job_id": job_id, "output_datasets": output_datasets}
-
-        if len(datasets_calidad) == 2:
-
-            if datasets_calidad[contigs[0]]['N50'] > datasets_calidad[contigs[1]]['N50'] and datasets_calidad[contigs[0]]['L50'] < datasets_calidad[contigs[1]]['L50'] :
-                winner = contigs[0]
-
-            elif datasets_calidad[contigs[0]]['N50'] > datasets_calidad[contigs[1]]['N50']:
-                winner = contigs[0]
-
-            else:
-                winner = contigs[1]
-
-    return results, winner
-
-def ejecutar_augustus(history_id, shovill):
-    gi = GalaxyInstance(url = GALAXY_URL, key = GALAXY_API_KEY)
-
-    tool_inputs = {
-        "input_genome" : {"src": "hda", "id": shovill}
-    }
-
-    job = gi.tools.run_tool(
-    history_id=history_id,
-    tool_id="toolshed.g2.bx.psu.edu/repos/bgruening/augustus/augustus/3.5.0+galaxy0",
-    tool_inputs=tool_inputs,
-    )
-
-    job_id = job["jobs"][0]["id"]
-    esperar_finalizacion(gi, job_id)
-    info = gi.datasets.show_dataset(job_id)
-    outputs = info.get("outputs", {}) 
-
-    return job_id, outputs
+    return JsonResponse({"pares": pares, "sueltos": sueltos})
 
 # Metodo el proceso completo
 def ejecutar_workflow(request):
 
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
-
-    histories = gi.histories.get_histories()
+    gi = obtener_cliente_sesion(request)
 
     #Entrada del nombre de la historia
     if request.method == 'POST':
@@ -323,12 +201,8 @@ def ejecutar_workflow(request):
         if not nameHistory:
             return render(request, "error.html", {"mensaje": "No se seleccionó ninguna historia."})
 
-        # Buscar historia seleccionada
-        history_id = None
-        for history in histories:
-            if history["name"] == nameHistory:
-                history_id = history["id"]
-                break
+        # Buscar historia seleccionada en el indice por nombre
+        history_id = galaxy_cache.buscar_historia(gi, nameHistory)
 
         if not history_id:
             return render(request, "error.html", {"mensaje": "Historia no encontrada."})
@@ -338,19 +212,10 @@ def ejecutar_workflow(request):
         idDataset2 = request.POST.get('id_dataset2')
         idGenoma = request.POST.get('id_genoma')
         
-        datasets_raw = gi.histories.show_history(history_id, contents=True)
-        datasets = [
-            d for d in datasets_raw
-            if (not d.get("deleted", False)) and d.get("visible", True)
-        ]
-        datasets_fastq = [
-            d for d in datasets 
-            if d["name"].lower().endswith((".fastq", ".fq", ".fastq.gz"))
-        ]
-        genomas = [
-            d for d in datasets 
-            if d["name"].lower().endswith(".fasta")
-        ]
+        contenidos = galaxy_cache.obtener_contenidos(gi, history_id)
+        datasets = contenidos.datasets
+        datasets_fastq = contenidos.por_tipo(galaxy_cache.EXTENSIONES_FASTQ, galaxy_cache.SUFIJOS_FASTQ)
+        genomas = contenidos.por_tipo(galaxy_cache.EXTENSIONES_FASTA, galaxy_cache.SUFIJOS_FASTA)
 
         if not (idDataset and idDataset2 and idGenoma):
             # Mostrar datasets disponibles si no se seleccionó ninguno
@@ -363,119 +228,51 @@ def ejecutar_workflow(request):
             })
 
         # Buscar dataset seleccionado
-        datasetID = None
-        datasetID2 =None
-        genomaId = None
-
-        for dataset in datasets:
-            if dataset['id'] == idDataset:
-                datasetID = idDataset
-            elif dataset['id'] == idDataset2:
-                datasetID2 = idDataset2
-            elif dataset['id'] == idGenoma:
-                genomaId = idGenoma
+        datasetID = idDataset if contenidos.buscar(idDataset) else None
+        datasetID2 = idDataset2 if contenidos.buscar(idDataset2) else None
+        genomaId = idGenoma if contenidos.buscar(idGenoma) else None
 
         if not (datasetID and datasetID2 and genomaId):
             return render(request, "error.html", {"mensaje": "Dataset no encontrado."})
+
+        # Un par que no se corresponde no se envia a Galaxy
+        problemas = problemas_par(obtener_calidad(gi, datasetID), obtener_calidad(gi, datasetID2))
+        if problemas:
+            return render(request, "error.html", {"mensaje": "Las lecturas no forman un par: " + "; ".join(problemas)})
         
-        results = {}
-
-        #Ejecución de los procesos 
-        try:            
-            fasqc_results_inicial = ejecutar_fastqc(history_id, [datasetID, datasetID2])
-            results["fastqc_inicial"] = {
-                "fastqc_id1" : fasqc_results_inicial[datasetID]["job_id"],
-                "fastqc_outputs1" : fasqc_results_inicial[datasetID]["output_datasets"],
-                "fastqc_id2" : fasqc_results_inicial[datasetID2]["job_id"],
-                "fastqc_outputs2" : fasqc_results_inicial[datasetID2]["output_datasets"]
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar FastQC inicial: {str(e)}"})
-
-        try:
-            bowtie_id, bowtie_outputs, unaligned_R1, unaligned_R2 = ejecutar_bowtie(history_id, datasetID, datasetID2, genomaId)
-            results["bowtie"] = {
-                "bowtie_id": bowtie_id,
-                "bowtie_outputs":bowtie_outputs,
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar Bowtie2: {str(e)}"})
-        
-        try:
-            trimmomatic_id, trimmomatic_outputs, paired_R1, paired_R2 = ejecutar_trimmomatic(history_id, unaligned_R1, unaligned_R2)
-            results["trimmomatic"] = {
-                "trimmomatic_id": trimmomatic_id,
-                "trimmomatic_output": trimmomatic_outputs
-            }
-        except Exception as e: 
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar Trimmomatic: {str(e)}"})
-
-        try:
-            fasqc_results_final = ejecutar_fastqc(history_id, [paired_R1, paired_R2])
-            results["fastqc_final"] = {
-                "fastqc_id1" : fasqc_results_final[paired_R1]["job_id"],
-                "fastqc_outputs1" : fasqc_results_final[paired_R1]["output_datasets"],
-                "fastqc_id2" : fasqc_results_final[paired_R2]["job_id"],
-                "fastqc_outputs2" : fasqc_results_final[paired_R2]["output_datasets"]
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar FastQC final: {str(e)}"})
-
-        try:
-            spades_id, spades_outputs, spades_contigs = ejecutar_shovill(history_id, paired_R1, paired_R2, "spades")
-            results["spades"] = {
-                "spades_id": spades_id,
-                "spades_outputs": spades_outputs
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar SPAdes: {str(e)}"})
-
-        try:
-            velvet_id, velvet_outputs, velvet_contigs = ejecutar_shovill(history_id, paired_R1, paired_R2, "velvet")
-            results["velvet"] = {
-                "velvet_id": velvet_id,
-                "velvet_outputs": velvet_outputs
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar velvet: {str(e)}"})
-
-        try: 
-            quast_results, winner = ejecutar_quast(history_id, [spades_contigs, velvet_contigs])
-
-            results["quast"] = {
-                "reporteSpades": {"spades_contigs": spades_contigs,
-                "job_id": quast_results[spades_contigs]["job_id"],
-                "output_datasets": quast_results[spades_contigs]["output_datasets"]
-                },
-                
-                "reporteVelvet": {"velvet_contigs": velvet_contigs,
-                "job_id": quast_results[velvet_contigs]["job_id"],
-                "output_datasets": quast_results[velvet_contigs]["output_datasets"]
-                } 
-            }
-        except Exception as e:
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar Quast: {str(e)}"})
-        
-        try: 
-            augustus_id, augustus_outputs = ejecutar_augustus(history_id, winner)
-            results["augustus"]= {
-                "augustus_id": augustus_id,
-                "augustus_outputs": augustus_outputs
-            }
+        inputs = {
+            "dataset_r1": datasetID,
+            "dataset_r2": datasetID2,
+            "genoma": genomaId,
+        }
 
-        except Exception as e: 
-            return render(request, "error.html", {"mensaje": f"Error al ejecutar Augustus: {str(e)}"})
+        # Un reenvio del formulario no lanza otra ejecucion igual a una en curso
+        run = PipelineRun.objects.filter(
+            user=request.user if request.user.is_authenticated else None,
+            history_id=history_id,
+            inputs=inputs,
+            state__in=[PipelineRun.QUEUED, PipelineRun.RUNNING],
+        ).first()
+
+        if run is None:
+            # Encolar la ejecucion; un worker la procesa en segundo plano
+            run = PipelineRun.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                history_id=history_id,
+                history_name=nameHistory,
+                inputs=inputs,
+            )
+            registrar_evento(run.pk, "", PipelineRun.QUEUED)
 
-        return render(request, "resultado_fastqc.html",{
-            "history_id": history_id, 
-            "job_results" : results
-        })
+        return redirect('estado_ejecucion', run_id=run.pk)
+
+    histories = galaxy_cache.obtener_historias(gi)
 
     return render(request, "ejecutar_herramienta/ejecutar_workflow.html", {"histories": histories})
 
 """
 def probar_trimmomatic(request):
-    gi = GalaxyInstance(url=GALAXY_URL, key=GALAXY_API_KEY)
+    gi = obtener_cliente_sesion(request)
     histories = gi.histories.get_histories()
 
     if request.method == "POST":
@@ -499,23 +296,16 @@ def probar_trimmomatic(request):
     })
 """
 def ejecutar_trimmomatic_single(request,history_id):
-    gi = GalaxyInstance(url=GALAXY_URL, key=GALAXY_API_KEY)
+    gi = obtener_cliente_sesion(request)
     
     history_info = gi.histories.show_history(history_id, keys=["name"])
     nameHistory = history_info["name"]
     idDataset = request.POST.get('id_dataset')
     idDataset2 = request.POST.get('id_dataset2')
     
-    datasets_raw = gi.histories.show_history(history_id, contents=True)
-    datasets = [
-        d for d in datasets_raw
-        if (not d.get("deleted", False)) and d.get("visible", True)
-    ]
-    
-    datasets_fastq = [
-        d for d in datasets 
-        if d["name"].lower().endswith((".fastq", ".fq", ".fastq.gz"))
-    ]
+    contenidos = galaxy_cache.obtener_contenidos(gi, history_id)
+    datasets = contenidos.datasets
+    datasets_fastq = contenidos.por_tipo(galaxy_cache.EXTENSIONES_FASTQ, galaxy_cache.SUFIJOS_FASTQ)
 
 
     if not (idDataset and idDataset2):
@@ -528,14 +318,8 @@ def ejecutar_trimmomatic_single(request,history_id):
         })
 
     # Buscar dataset seleccionado
-    datasetID = None
-    datasetID2 =None
-
-    for dataset in datasets:
-        if dataset['id'] == idDataset:
-            datasetID = idDataset
-        elif dataset['id'] == idDataset2:
-            datasetID2 = idDataset2
+    datasetID = idDataset if contenidos.buscar(idDataset) else None
+    datasetID2 = idDataset2 if contenidos.buscar(idDataset2) else None
 
     if not (datasetID and datasetID2):
         return render(request, "error.html", {"mensaje": "Dataset no encontrado."})
@@ -555,7 +339,7 @@ def ejecutar_trimmomatic_single(request,history_id):
         tool_inputs=tool_inputs,
     )
     job_id = job["jobs"][0]["id"]
-    esperar_finalizacion(gi, job_id)
+    esperar_finalizacion(gi, job_id, history_id)
     info = gi.jobs.show_job(job_id)
     print("params:", info.get("params"))
     print("outputs:", info.get("outputs"))
@@ -567,7 +351,7 @@ def ejecutar_trimmomatic_single(request,history_id):
 """    
 def ejecutar_bowtie2_single(request, history_id):
     
-    gi = GalaxyInstance(url= GALAXY_URL, key=GALAXY_API_KEY)  
+    gi = obtener_cliente_sesion(request)  
 
     history_info = gi.histories.show_history(history_id, keys=["name"])
     nameHistory = history_info["name"]
@@ -649,36 +433,73 @@ def ejecutar_bowtie2_single(request, history_id):
 
 def show_dataset(request, id):
     
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
-    dataset_info = gi.datasets.show_dataset(id)
+    gi = obtener_cliente_sesion(request)
+    dataset_info = galaxy_cache.obtener_datasets(gi, [id])[id]
+    if "error" in dataset_info:
+        return JsonResponse(dataset_info, status=404)
     
     return JsonResponse(dataset_info)
+
+def show_datasets(request):
+    # Varios datasets en una sola peticion: ?ids=a,b,c (o id=a&id=b)
+    ids = [i for valor in request.GET.getlist("ids") for i in valor.split(",") if i]
+    ids += request.GET.getlist("id")
+    if not ids:
+        return JsonResponse({"error": "Faltan los ids de los datasets"}, status=400)
+    if len(ids) > settings.GALAXY_DATASETS_MAXIMO:
+        return JsonResponse(
+            {"error": f"Se aceptan hasta {settings.GALAXY_DATASETS_MAXIMO} datasets por consulta"}, status=400
+        )
+
+    gi = obtener_cliente_sesion(request)
+    return JsonResponse({"datasets": galaxy_cache.obtener_datasets(gi, ids)})
     
 def get_jobs(request, id):
     
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
+    gi = obtener_cliente_sesion(request)
     jobs = gi.jobs.get_outputs(id)
     
     return JsonResponse(jobs, safe=False)
 
 def get_jobs_history(request, id):
+    # Paginado con ?limit=&offset=, que pasan a Galaxy igual que los filtros
+    # ?state=ok,error, ?date_range_min= y ?date_range_max= (AAAA-MM-DD)
+    try:
+        limite, offset = leer_pagina(request)
+    except ParametroInvalido as e:
+        return JsonResponse({"error": str(e)}, status=400)
     
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
-    jobs = gi.jobs.get_jobs(history_id=id)
+    filtros = {}
+    if request.GET.get("state"):
+        filtros["state"] = request.GET["state"].split(",")
+    for clave in ("date_range_min", "date_range_max"):
+        if request.GET.get(clave):
+            try:
+                valida = parse_date(request.GET[clave])
+            except ValueError:
+                valida = None
+            if valida is None:
+                return JsonResponse({"error": f"{clave} debe tener el formato AAAA-MM-DD"}, status=400)
+            filtros[clave] = request.GET[clave]
+    if request.GET.get("order_by") in ("create_time", "update_time"):
+        filtros["order_by"] = request.GET["order_by"]
     
-    return JsonResponse(jobs, safe=False)
+    gi = obtener_cliente_sesion(request)
+    jobs = gi.jobs.get_jobs(history_id=id, limit=limite, offset=offset, **filtros)
+    
+    return respuesta_paginada(request, jobs, limite, offset, etag_items(jobs, ("id", "state", "update_time")))
 
 def get_inputs_job(request, id):
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
+    gi = obtener_cliente_sesion(request)
     inputs = gi.jobs.get_inputs(job_id=id)
     return JsonResponse(inputs, safe=False)
 
 def get_outputs_job(request, id):
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
+    gi = obtener_cliente_sesion(request)
     inputs = gi.jobs.get_outputs(job_id=id)
     return JsonResponse(inputs, safe=False)
 
 def ver_parametros_permitidos_tool(request, id_tool):
-    gi = GalaxyInstance(url=GALAXY_URL, key= GALAXY_API_KEY)
-    info_tool = gi.tools.show_tool(tool_id=id_tool, io_details=True)
+    gi = obtener_cliente_sesion(request)
+    info_tool = obtener_esquema(gi, id_tool)
     return JsonResponse(info_tool)
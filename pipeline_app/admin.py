@@ -0,0 +1,25 @@
+from django.contrib import admin
+from .models import PipelineBatch, PipelineRun, PipelineStep, ToolRunCache
+
+
+class PipelineStepInline(admin.TabularInline):
+    model = PipelineStep
+    extra = 0
+
+
+@admin.register(PipelineRun)
+class PipelineRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "history_name", "sample", "batch", "user", "state", "worker_id", "created_at", "finished_at")
+    list_filter = ("state",)
+    inlines = [PipelineStepInline]
+
+
+@admin.register(ToolRunCache)
+class ToolRunCacheAdmin(admin.ModelAdmin):
+    list_display = ("tool_id", "tool_version", "job_id", "hits", "created_at", "last_used_at")
+    search_fields = ("tool_id", "job_id", "key")
+
+
+@admin.register(PipelineBatch)
+class PipelineBatchAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "history_name", "user", "concurrency", "created_at")
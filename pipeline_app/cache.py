@@ -0,0 +1,250 @@
+import contextvars
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bioblend import ConnectionError
+from django.conf import settings
+from django.core.cache import cache
+
+CAMPOS_HISTORIA = ['id', 'name', 'count', 'update_time']
+
+
+def huella_usuario(gi):
+    # Identifica servidor y API key (es decir, el usuario) sin guardar la key
+    return hashlib.sha256(f"{gi.base_url}|{gi.key}".encode()).hexdigest()[:16]
+
+def _clave(prefijo, gi, *partes):
+    # Las entradas son por servidor y por API key (es decir, por usuario)
+    return ":".join([prefijo, huella_usuario(gi), *partes])
+
+# Historias
+
+def _refrescar_historias(gi, entrada):
+    ahora = time.time()
+    completo = (
+        entrada is None
+        or ahora - entrada["completo"] > settings.GALAXY_CACHE_HISTORIAS_COMPLETO
+    )
+
+    if completo:
+        # Listado completo: tambien descarta las historias borradas
+        historias = gi.histories.get_histories(keys=CAMPOS_HISTORIA)
+        entrada = {"historias": {h["id"]: h for h in historias}, "completo": ahora}
+        borradas = []
+    else:
+        # Solo las historias modificadas desde la ultima consulta. Galaxy
+        # devuelve las borradas solo si se piden aparte
+        cambiadas = gi.histories.get_histories(
+            keys=CAMPOS_HISTORIA, update_time_min=entrada["cursor"]
+        )
+        borradas = gi.histories.get_histories(
+            keys=CAMPOS_HISTORIA, deleted=True, update_time_min=entrada["cursor"]
+        )
+        for historia in cambiadas:
+            entrada["historias"][historia["id"]] = historia
+        for historia in borradas:
+            entrada["historias"].pop(historia["id"], None)
+
+    ordenadas = sorted(
+        entrada["historias"].values(), key=lambda h: h["update_time"] or "", reverse=True
+    )
+    entrada["orden"] = [h["id"] for h in ordenadas]
+    # Indice nombre -> id; con nombres repetidos gana la mas reciente
+    entrada["por_nombre"] = {}
+    for historia in ordenadas:
+        entrada["por_nombre"].setdefault(historia["name"], historia["id"])
+    # Una borrada puede ser lo ultimo modificado: tambien mueve el cursor
+    entrada["cursor"] = max(
+        (h["update_time"] for h in ordenadas[:1] + borradas if h["update_time"]), default=None
+    )
+    entrada["refrescado"] = ahora
+    entrada["vencida"] = False
+    return entrada
+
+def _entrada_historias(gi):
+    clave = _clave("historias", gi)
+    entrada = cache.get(clave)
+
+    vigente = (
+        entrada is not None
+        and not entrada["vencida"]
+        and time.time() - entrada["refrescado"] < settings.GALAXY_CACHE_HISTORIAS_TTL
+    )
+    if not vigente:
+        if entrada is not None and entrada["cursor"] is None:
+            entrada = None
+        entrada = _refrescar_historias(gi, entrada)
+        cache.set(clave, entrada, None)
+
+    return entrada
+
+def obtener_historias(gi):
+    # Mas recientes primero, igual que el listado de Galaxy
+    entrada = _entrada_historias(gi)
+    return [entrada["historias"][history_id] for history_id in entrada["orden"]]
+
+def buscar_historia(gi, nombre):
+    return _entrada_historias(gi)["por_nombre"].get(nombre)
+
+def invalidar_historias(gi):
+    # La siguiente lectura pide a Galaxy solo lo que cambio
+    clave = _clave("historias", gi)
+    entrada = cache.get(clave)
+    if entrada is not None:
+        entrada["vencida"] = True
+        cache.set(clave, entrada, None)
+
+# Contenido de una historia
+
+EXTENSIONES_FASTQ = [
+    "fastqsanger", "fastqsanger.gz", "fastqsanger.bz2", "fastq", "fastq.gz",
+    "fastqillumina", "fastqsolexa", "fastqcssanger",
+]
+EXTENSIONES_FASTA = ["fasta", "fasta.gz"]
+SUFIJOS_FASTQ = (".fastq", ".fq", ".fastq.gz")
+SUFIJOS_FASTA = (".fasta",)
+
+TAMANO_PAGINA = 500
+
+
+class ContenidosHistoria:
+    # Datasets visibles y no borrados de una historia, con indices por id y
+    # por tipo de dato
+
+    def __init__(self, entrada):
+        self._por_id = entrada["por_id"]
+        self._por_tipo = entrada["por_tipo"]
+        self.datasets = [self._por_id[dataset_id] for dataset_id in entrada["orden"]]
+
+    def buscar(self, dataset_id):
+        return self._por_id.get(dataset_id)
+
+    def por_tipo(self, extensiones, sufijos=()):
+        ids = set()
+        for extension in extensiones:
+            ids.update(self._por_tipo.get(extension, ()))
+        # Tambien por nombre, para datasets subidos con un tipo generico
+        return [
+            d for d in self.datasets
+            if d["id"] in ids or (sufijos and d["name"].lower().endswith(sufijos))
+        ]
+
+def _paginar(consulta, **filtros):
+    offset = 0
+    while True:
+        pagina = consulta(limit=TAMANO_PAGINA, offset=offset, **filtros)
+        yield from pagina
+        if len(pagina) < TAMANO_PAGINA:
+            return
+        offset += TAMANO_PAGINA
+
+def _es_visible(item):
+    return (
+        item.get("history_content_type", "dataset") == "dataset"
+        and not item.get("deleted", False)
+        and item.get("visible", True)
+    )
+
+def _refrescar_contenidos(gi, history_id, entrada):
+    ahora = time.time()
+    completo = (
+        entrada is None
+        or entrada["cursor"] is None
+        or ahora - entrada["completo"] > settings.GALAXY_CACHE_CONTENIDOS_COMPLETO
+    )
+
+    if completo:
+        # Galaxy filtra los borrados y ocultos
+        items = _paginar(gi.datasets.get_datasets, history_id=history_id, deleted=False, visible=True)
+        por_id = {item["id"]: item for item in items if _es_visible(item)}
+        entrada = {"por_id": por_id, "completo": ahora}
+    else:
+        # Sin filtro de estado para enterarse de los que se borraron u ocultaron
+        cambiados = _paginar(
+            gi.datasets.get_datasets, history_id=history_id, update_time_min=entrada["cursor"]
+        )
+        for item in cambiados:
+            if _es_visible(item):
+                entrada["por_id"][item["id"]] = item
+            else:
+                entrada["por_id"].pop(item["id"], None)
+
+    ordenados = sorted(entrada["por_id"].values(), key=lambda d: d.get("hid") or 0)
+    entrada["orden"] = [d["id"] for d in ordenados]
+    entrada["por_tipo"] = {}
+    for dataset in ordenados:
+        entrada["por_tipo"].setdefault(dataset.get("extension"), []).append(dataset["id"])
+    entrada["cursor"] = max((d["update_time"] for d in ordenados), default=None)
+    entrada["refrescado"] = ahora
+    entrada["vencida"] = False
+    return entrada
+
+def obtener_contenidos(gi, history_id):
+    clave = _clave("contenidos", gi, history_id)
+    entrada = cache.get(clave)
+
+    vigente = (
+        entrada is not None
+        and not entrada["vencida"]
+        and time.time() - entrada["refrescado"] < settings.GALAXY_CACHE_CONTENIDOS_TTL
+    )
+    if not vigente:
+        entrada = _refrescar_contenidos(gi, history_id, entrada)
+        cache.set(clave, entrada, None)
+
+    return ContenidosHistoria(entrada)
+
+def invalidar_contenidos(gi, history_id):
+    clave = _clave("contenidos", gi, history_id)
+    entrada = cache.get(clave)
+    if entrada is not None:
+        entrada["vencida"] = True
+        cache.set(clave, entrada, None)
+
+# Datasets sueltos
+
+# Un dataset en estos estados ya no cambia: se guarda sin vencimiento
+ESTADOS_TERMINALES = {"ok", "error", "failed_metadata", "discarded"}
+
+def _pedir_dataset(gi, dataset_id):
+    try:
+        return gi.datasets.show_dataset(dataset_id)
+    except ConnectionError as e:
+        # Uno inexistente o ajeno no hace fallar a los demas
+        if e.status_code in (400, 403, 404):
+            return {"id": dataset_id, "error": f"Galaxy respondio {e.status_code}"}
+        raise
+
+def obtener_datasets(gi, ids):
+    # {id: dataset}. Los que no estan en cache se piden a Galaxy en paralelo
+    # (el limitador de peticiones sigue aplicando)
+    ids = list(dict.fromkeys(ids))
+    claves = {dataset_id: _clave("dataset", gi, dataset_id) for dataset_id in ids}
+    en_cache = cache.get_many(claves.values())
+    datasets = {dataset_id: en_cache[clave] for dataset_id, clave in claves.items() if clave in en_cache}
+
+    faltantes = [dataset_id for dataset_id in ids if dataset_id not in datasets]
+    if faltantes:
+        # Cada hilo con una copia del contexto, para que la traza de la
+        # peticion tambien vea estas llamadas
+        with ThreadPoolExecutor(max_workers=min(settings.GALAXY_DATASETS_PARALELOS, len(faltantes))) as pool:
+            pedidos = [
+                pool.submit(contextvars.copy_context().run, _pedir_dataset, gi, dataset_id)
+                for dataset_id in faltantes
+            ]
+            nuevos = dict(zip(faltantes, (pedido.result() for pedido in pedidos)))
+
+        terminales = {
+            claves[dataset_id]: dataset for dataset_id, dataset in nuevos.items()
+            if dataset.get("state") in ESTADOS_TERMINALES
+        }
+        pendientes = {
+            claves[dataset_id]: dataset for dataset_id, dataset in nuevos.items()
+            if "error" not in dataset and claves[dataset_id] not in terminales
+        }
+        cache.set_many(terminales, None)
+        cache.set_many(pendientes, settings.GALAXY_CACHE_DATASETS_TTL)
+        datasets.update(nuevos)
+
+    return {dataset_id: datasets[dataset_id] for dataset_id in ids}
@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import Future
+
+from bioblend.galaxy.dataset_collections import (
+    CollectionDescription,
+    CollectionElement,
+    HistoryDatasetElement,
+)
+
+
+def es_coleccion(valor):
+    return isinstance(valor, dict) and valor.get("src") == "hdca"
+
+def referencia(valor):
+    # Entrada de un parametro de dataset: un id suelto es un hda; una
+    # coleccion se mapea, un job por elemento, en el mismo run_tool
+    if es_coleccion(valor):
+        return {"batch": True, "values": [{"src": "hdca", "id": valor["id"]}]}
+    return {"src": "hda", "id": valor}
+
+def referencia_pares(valor):
+    # Parametro de tipo coleccion "paired" mapeado sobre una list:paired
+    return {"batch": True, "values": [{"src": "hdca", "id": valor["id"], "map_over_type": "paired"}]}
+
+def crear_coleccion_pares(gi, history_id, muestras, nombre):
+    # muestras: [(muestra, r1, r2)] -> {"src": "hdca", "id"} de una list:paired
+    descripcion = CollectionDescription(
+        name=nombre,
+        type="list:paired",
+        elements=[
+            CollectionElement(
+                name=muestra,
+                type="paired",
+                elements=[
+                    HistoryDatasetElement(name="forward", id=r1),
+                    HistoryDatasetElement(name="reverse", id=r2),
+                ],
+            )
+            for muestra, r1, r2 in muestras
+        ],
+    )
+    hdca = gi.histories.create_dataset_collection(history_id, descripcion)
+    return {"src": "hdca", "id": hdca["id"]}
+
+def crear_coleccion_lista(gi, history_id, datasets, nombre):
+    # datasets: {identificador: dataset_id} -> {"src": "hdca", "id"} de una list
+    descripcion = CollectionDescription(
+        name=nombre,
+        type="list",
+        elements=[HistoryDatasetElement(name=nombre_elemento, id=dataset_id)
+                  for nombre_elemento, dataset_id in datasets.items()],
+    )
+    hdca = gi.histories.create_dataset_collection(history_id, descripcion)
+    return {"src": "hdca", "id": hdca["id"]}
+
+def elementos_coleccion(gi, hdca_id):
+    # {identificador: dataset_id} de una coleccion list
+    coleccion = gi.dataset_collections.show_dataset_collection(hdca_id)
+    return {
+        elemento["element_identifier"]: elemento["object"]["id"]
+        for elemento in coleccion.get("elements", [])
+    }
+
+def salidas_envio(respuesta):
+    # Salidas de un run_tool mapeado: las colecciones implicitas (una por
+    # salida de la herramienta) en lugar de los datasets de cada job
+    return {
+        coleccion["output_name"]: {"src": "hdca", "id": coleccion["id"]}
+        for coleccion in respuesta.get("implicit_collections", []) + respuesta.get("output_collections", [])
+    }
+
+def esperar_todos(futuros):
+    # Future que se resuelve cuando terminan todos los jobs de un envio
+    # mapeado: "ok" si todos terminaron bien, si no el primer estado distinto
+    combinado = Future()
+    pendientes = [len(futuros)]
+    lock = threading.Lock()
+    resumenes = []
+
+    def al_terminar(futuro):
+        with lock:
+            resumenes.append(futuro.result())
+            pendientes[0] -= 1
+            if pendientes[0]:
+                return
+        fallido = next((r for r in resumenes if r.get("state") != "ok"), None)
+        if fallido:
+            combinado.set_result(fallido)
+            return
+        # El paso va desde el primer job creado hasta el ultimo terminado
+        def extremo(funcion, clave):
+            valores = [r[clave] for r in resumenes if r.get(clave)]
+            return funcion(valores) if valores else None
+        combinado.set_result({
+            "state": "ok",
+            "jobs": len(resumenes),
+            "create_time": extremo(min, "create_time"),
+            "running_since": extremo(min, "running_since"),
+            "update_time": extremo(max, "update_time"),
+            "observed_at": extremo(max, "observed_at"),
+        })
+
+    for futuro in futuros:
+        futuro.add_done_callback(al_terminar)
+    return combinado
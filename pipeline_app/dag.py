@@ -0,0 +1,286 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.utils import timezone
+
+from .colecciones import esperar_todos, salidas_envio
+from .esquemas import preparar_inputs
+from .poller import obtener_poller, tiempos_job
+
+log = logging.getLogger(__name__)
+
+# Cada cuanto se revisa, mientras se esperan jobs, si la ejecucion se cancelo
+INTERVALO_CANCELACION = 5
+
+
+class Paso:
+    # Nodo del pipeline. Un paso de herramienta envia un job a Galaxy;
+    # un paso local solo combina resultados de sus dependencias.
+
+    def __init__(self, nombre, dependencias=(), herramienta=None, recoger=None, local=None):
+        self.nombre = nombre
+        self.dependencias = tuple(dependencias)
+        # herramienta(ctx) -> (tool_id, tool_inputs)
+        self.herramienta = herramienta
+        # recoger(gi, outputs, ctx) -> dict con los valores que usan los pasos siguientes
+        self.recoger = recoger
+        # local(gi, ctx) -> dict
+        self.local = local
+
+    def __repr__(self):
+        return f"Paso({self.nombre})"
+
+
+def validar_dag(pasos):
+    nombres = {paso.nombre for paso in pasos}
+    for paso in pasos:
+        faltantes = set(paso.dependencias) - nombres
+        if faltantes:
+            raise ValueError(f"El paso {paso.nombre} depende de pasos inexistentes: {sorted(faltantes)}")
+
+    # Orden topologico para detectar ciclos
+    resueltos = set()
+    pendientes = list(pasos)
+    while pendientes:
+        listos = [p for p in pendientes if set(p.dependencias) <= resueltos]
+        if not listos:
+            raise ValueError(f"Ciclo en el pipeline: {[p.nombre for p in pendientes]}")
+        resueltos.update(p.nombre for p in listos)
+        pendientes = [p for p in pendientes if p.nombre not in resueltos]
+
+
+class EjecutorDag:
+    # Envia a Galaxy todos los pasos cuyas dependencias ya terminaron, de modo
+    # que las ramas independientes quedan en cola al mismo tiempo.
+
+    def __init__(self, gi, history_id, pasos, ctx=None, poller=None, memo=None, hechos=None,
+                 al_enviar=None, al_estado=None, al_terminar=None, al_fallar=None,
+                 al_reutilizar=None, cancelado=None):
+        validar_dag(pasos)
+        self.gi = gi
+        self.history_id = history_id
+        self.pasos = {paso.nombre: paso for paso in pasos}
+        self.ctx = ctx if ctx is not None else {}
+        self.poller = poller or obtener_poller(gi)
+        # MemoHerramientas opcional para reutilizar jobs ya corridos
+        self.memo = memo
+        self.al_enviar = al_enviar
+        self.al_estado = al_estado
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.al_reutilizar = al_reutilizar
+        # threading.Event: el worker perdio el lease y no debe enviar nada mas
+        self.cancelado = cancelado
+
+        self.terminados = set()
+        # Pasos que ya terminaron en un intento anterior: {nombre: salida}
+        for nombre, salida in (hechos or {}).items():
+            if nombre in self.pasos:
+                self.ctx[nombre] = salida
+                self.terminados.add(nombre)
+        # job_id -> nombre del paso
+        self.en_curso = {}
+        # Future del poller -> job_id
+        self.futuros = {}
+        # job_id -> firma del memo, para guardarlo al terminar
+        self.firmas = {}
+        # job_id -> (colecciones de salida, jobs) de los envios mapeados
+        self.mapeados = {}
+        self.errores = []
+
+    def listos(self):
+        enviados = set(self.en_curso.values())
+        return [
+            paso for nombre, paso in self.pasos.items()
+            if nombre not in self.terminados
+            and nombre not in enviados
+            and set(paso.dependencias) <= self.terminados
+        ]
+
+    def firmar(self, tool_id, tool_inputs):
+        # Sin memo el pipeline funciona igual, solo que sin reutilizar
+        try:
+            return self.memo.firmar(tool_id, tool_inputs)
+        except Exception as e:
+            log.warning("No se pudo calcular la firma de %s: %s", tool_id, e)
+            return None
+
+    def reutilizar(self, paso, firma):
+        try:
+            previo = self.memo.buscar(firma)
+        except Exception as e:
+            log.warning("No se pudo consultar el memo para %s: %s", paso.nombre, e)
+            return False
+        if previo is None:
+            return False
+
+        log.info("Paso %s reutiliza las salidas del job %s", paso.nombre, previo.job_id)
+        if self.al_reutilizar:
+            self.al_reutilizar(paso.nombre, previo.job_id)
+        self.recoger(paso, previo.job_id, previo.outputs)
+        return True
+
+    def enviar(self, paso):
+        tool_id, tool_inputs = paso.herramienta(self.ctx)
+        # Un parametro mal escrito falla aqui y no despues de la cola de Galaxy
+        tool_inputs = preparar_inputs(self.gi, tool_id, tool_inputs)
+
+        firma = self.firmar(tool_id, tool_inputs) if self.memo else None
+        if firma and self.reutilizar(paso, firma):
+            return
+
+        # Antes de run_tool: el create_time de Galaxy cae dentro del envio
+        enviado = timezone.now()
+        job = self.gi.tools.run_tool(
+            history_id=self.history_id,
+            tool_id=tool_id,
+            tool_inputs=tool_inputs,
+        )
+        # Sobre una coleccion Galaxy crea un job por elemento; el paso se
+        # identifica con el primero y termina cuando terminan todos
+        jobs = [j["id"] for j in job["jobs"]]
+        job_id = jobs[0]
+        self.en_curso[job_id] = paso.nombre
+        colecciones = salidas_envio(job)
+        if colecciones:
+            self.mapeados[job_id] = (colecciones, jobs)
+        if firma:
+            self.firmas[job_id] = firma
+        log.info("Paso %s enviado como job %s (%s jobs)", paso.nombre, job_id, len(jobs))
+        if self.al_enviar:
+            self.al_enviar(paso.nombre, job_id, enviado)
+
+        al_cambiar = None
+        if self.al_estado:
+            al_cambiar = lambda job_id, estado, nombre=paso.nombre: self.al_estado(nombre, job_id, estado)
+        futuros = [self.poller.seguir(j, self.history_id, al_cambiar=al_cambiar) for j in jobs]
+        futuro = futuros[0] if len(futuros) == 1 else esperar_todos(futuros)
+        self.futuros[futuro] = job_id
+
+    def completar(self, nombre, salida):
+        self.ctx[nombre] = salida
+        self.terminados.add(nombre)
+        if self.al_terminar:
+            self.al_terminar(nombre, salida)
+
+    def fallar(self, nombre, error):
+        self.errores.append((nombre, error))
+        if self.al_fallar:
+            self.al_fallar(nombre, error)
+
+    def ejecutar_local(self, paso):
+        try:
+            salida = paso.local(self.gi, self.ctx)
+        except Exception as e:
+            self.fallar(paso.nombre, e)
+        else:
+            self.completar(paso.nombre, salida)
+
+    def job_terminado(self, job_id, resumen):
+        nombre = self.en_curso.pop(job_id)
+        paso = self.pasos[nombre]
+        firma = self.firmas.pop(job_id, None)
+        colecciones, jobs = self.mapeados.pop(job_id, (None, None))
+
+        if resumen.get("state") != "ok":
+            fallido = resumen.get("id", job_id)
+            mensaje = f"El job {fallido} termino en estado {resumen.get('state')}"
+            if resumen.get("error"):
+                # El poller no pudo consultarlo (por ejemplo, un job purgado)
+                mensaje += f": {resumen['error']}"
+            self.fallar(nombre, Exception(mensaje))
+            return
+
+        if colecciones:
+            # Las salidas de un envio mapeado son sus colecciones implicitas
+            outputs = colecciones
+        else:
+            try:
+                # El resumen del poller no trae las salidas del job
+                outputs = self.gi.jobs.show_job(job_id).get("outputs", {})
+            except Exception as e:
+                self.fallar(nombre, e)
+                return
+
+        if firma:
+            try:
+                self.memo.guardar(firma, job_id, outputs)
+            except Exception as e:
+                log.warning("No se pudo memorizar el paso %s: %s", nombre, e)
+
+        self.recoger(paso, job_id, outputs, jobs, tiempos_job(resumen))
+
+    def recoger(self, paso, job_id, outputs, jobs=None, tiempos=None):
+        salida = {
+            "job_id": job_id,
+            "outputs": outputs,
+            "output_datasets": list(outputs.values()),
+        }
+        if jobs:
+            salida["jobs"] = jobs
+        if tiempos:
+            salida["tiempos"] = tiempos
+        try:
+            if paso.recoger:
+                salida.update(paso.recoger(self.gi, outputs, self.ctx))
+        except Exception as e:
+            self.fallar(paso.nombre, e)
+        else:
+            self.completar(paso.nombre, salida)
+
+    def comprobar_cancelado(self):
+        if self.cancelado is not None and self.cancelado.is_set():
+            raise EjecucionCancelada()
+
+    def esperar(self):
+        timeout = INTERVALO_CANCELACION if self.cancelado is not None else None
+        terminados, _ = wait(list(self.futuros), timeout=timeout, return_when=FIRST_COMPLETED)
+        self.comprobar_cancelado()
+        for futuro in terminados:
+            job_id = self.futuros.pop(futuro)
+            self.job_terminado(job_id, futuro.result())
+
+    def despachar(self):
+        # Despues de un error no se envian pasos nuevos, pero se esperan
+        # los que ya estan en Galaxy para no perder su resultado
+        listos = self.listos()
+        while listos and not self.errores:
+            for paso in listos:
+                self.comprobar_cancelado()
+                try:
+                    if paso.local:
+                        self.ejecutar_local(paso)
+                    else:
+                        self.enviar(paso)
+                except Exception as e:
+                    self.fallar(paso.nombre, e)
+
+            # Un paso local puede desbloquear otros en la misma vuelta
+            listos = self.listos()
+
+    def ejecutar(self):
+        while True:
+            self.despachar()
+
+            if not self.en_curso:
+                break
+
+            self.esperar()
+
+        if self.errores:
+            nombre, error = self.errores[0]
+            raise PasoFallido(nombre, error)
+
+        return self.ctx
+
+
+class EjecucionCancelada(Exception):
+    def __init__(self):
+        super().__init__("La ejecucion se cancelo: el worker perdio el lease")
+
+
+class PasoFallido(Exception):
+    def __init__(self, nombre, error):
+        self.nombre = nombre
+        self.error = error
+        super().__init__(f"{nombre}: {error}")
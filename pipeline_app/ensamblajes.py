@@ -0,0 +1,114 @@
+from array import array
+from itertools import accumulate
+
+from bioblend import ConnectionError
+from django.conf import settings
+
+# Trozos en los que se lee el FASTA de contigs que manda Galaxy
+TAMANO_TROZO = 1024 * 1024
+
+
+class LectorFasta:
+    # Recorre un FASTA en trozos de bytes sin guardarlo: solo quedan el largo
+    # y el conteo de bases G/C y A/C/G/T de cada contig (arrays compactos)
+
+    def __init__(self):
+        self.largos = array("Q")
+        self.gc = array("Q")
+        self.acgt = array("Q")
+        self._largo = None
+        self._gc = 0
+        self._acgt = 0
+        self._resto = b""
+
+    def _cerrar_contig(self):
+        if self._largo is not None:
+            self.largos.append(self._largo)
+            self.gc.append(self._gc)
+            self.acgt.append(self._acgt)
+        self._largo = None
+
+    def _linea(self, linea):
+        if linea.startswith(b">"):
+            self._cerrar_contig()
+            self._largo = 0
+            self._gc = 0
+            self._acgt = 0
+            return
+        linea = linea.strip()
+        if self._largo is None:
+            if linea:
+                raise ValueError("El FASTA no empieza con una cabecera '>'")
+            return
+        self._largo += len(linea)
+        gc = linea.count(b"G") + linea.count(b"C") + linea.count(b"g") + linea.count(b"c")
+        self._gc += gc
+        self._acgt += gc + linea.count(b"A") + linea.count(b"T") + linea.count(b"a") + linea.count(b"t")
+
+    def agregar(self, trozo):
+        lineas = (self._resto + trozo).split(b"\n")
+        self._resto = lineas.pop()
+        for linea in lineas:
+            self._linea(linea)
+
+    def terminar(self):
+        if self._resto:
+            self._linea(self._resto)
+            self._resto = b""
+        self._cerrar_contig()
+        return self.largos
+
+
+def _nx(ordenados, acumulados, total, fraccion):
+    # (Nx, Lx): largo del contig con el que se llega a la fraccion del total,
+    # y cuantos contigs hacen falta
+    objetivo = total * fraccion
+    for indice, suma in enumerate(acumulados):
+        if suma >= objetivo:
+            return ordenados[indice], indice + 1
+    return None, None
+
+def estadisticas_largos(largos, gc=None, acgt=None, minimo=0):
+    # Mismas metricas que el report.tsv de QUAST, contando solo los contigs
+    # de al menos `minimo` bases (QUAST usa 500 por defecto). gc y acgt son
+    # los conteos de cada contig, en el mismo orden que largos
+    incluidos = [indice for indice, largo in enumerate(largos) if largo >= minimo]
+    ordenados = sorted((largos[indice] for indice in incluidos), reverse=True)
+    gc = sum(gc[indice] for indice in incluidos) if gc is not None else 0
+    acgt = sum(acgt[indice] for indice in incluidos) if acgt is not None else 0
+    total = sum(ordenados)
+    acumulados = list(accumulate(ordenados))
+    n50, l50 = _nx(ordenados, acumulados, total, 0.5)
+    n90, l90 = _nx(ordenados, acumulados, total, 0.9)
+    return {
+        "# contigs": len(ordenados),
+        "Total length": total,
+        "Largest contig": ordenados[0] if ordenados else 0,
+        "N50": n50,
+        "L50": l50,
+        "N90": n90,
+        "L90": l90,
+        # Sobre los mismos contigs, como QUAST; las N no cuentan
+        "GC (%)": round(100 * gc / acgt, 2) if acgt else None,
+    }
+
+def estadisticas_fasta(trozos, minimo=0):
+    lector = LectorFasta()
+    for trozo in trozos:
+        lector.agregar(trozo)
+    return estadisticas_largos(lector.terminar(), lector.gc, lector.acgt, minimo)
+
+def estadisticas_dataset(gi, dataset_id):
+    # Lee el FASTA de Galaxy en streaming, sin bajarlo entero a memoria ni a disco
+    r = gi.peticion(
+        "GET", f"{gi.url}/datasets/{dataset_id}/display", headers=gi.json_headers, stream=True
+    )
+    try:
+        if r.status_code != 200:
+            raise ConnectionError(
+                f"No se pudo leer el dataset {dataset_id}: {r.status_code}",
+                body=r.text, status_code=r.status_code,
+            )
+        return estadisticas_fasta(r.iter_content(TAMANO_TROZO), settings.PIPELINE_CONTIG_MINIMO)
+    finally:
+        r.close()
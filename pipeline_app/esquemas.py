@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import requests
+from bioblend import ConnectionError
+from django.conf import settings
+
+from .memo import version_herramienta
+
+log = logging.getLogger(__name__)
+
+# Tipos de parametro que se completan con su valor por defecto si faltan; los
+# demas (data_column, genomebuild...) dependen de los datos y los resuelve Galaxy
+TIPOS_CON_DEFECTO = {"select", "boolean", "integer", "float", "text", "hidden"}
+FUENTES_DATASET = {"hda", "ldda", "hdca", "dce"}
+BOOLEANOS = {"true": True, "false": False}
+
+
+class EntradasInvalidas(ValueError):
+    def __init__(self, tool_id, errores):
+        self.tool_id = tool_id
+        self.errores = errores
+        super().__init__(f"Parametros invalidos para {tool_id}: " + "; ".join(errores))
+
+
+# Esquemas en disco
+
+_memoria = {}
+_memoria_lock = threading.Lock()
+
+def _ruta_esquema(base_url, tool_id, version):
+    nombre = hashlib.sha256(f"{base_url}|{tool_id}|{version}".encode()).hexdigest()
+    return os.path.join(settings.GALAXY_ESQUEMAS_DIR, f"{nombre}.json")
+
+def _guardar_esquema(ruta, esquema):
+    os.makedirs(settings.GALAXY_ESQUEMAS_DIR, exist_ok=True)
+    # Escritura atomica: otro proceso puede estar leyendo el mismo archivo
+    descriptor, temporal = tempfile.mkstemp(dir=settings.GALAXY_ESQUEMAS_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(esquema, f)
+        os.replace(temporal, ruta)
+    except OSError:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def obtener_esquema(gi, tool_id):
+    # show_tool(io_details=True) por id y version de herramienta. Una version
+    # no cambia sus parametros, asi que el archivo no vence
+    version = version_herramienta(gi, tool_id)
+    ruta = _ruta_esquema(gi.base_url, tool_id, version)
+
+    with _memoria_lock:
+        esquema = _memoria.get(ruta)
+    if esquema is not None:
+        return esquema
+
+    try:
+        with open(ruta) as f:
+            esquema = json.load(f)
+    except (OSError, ValueError):
+        esquema = gi.tools.show_tool(tool_id=tool_id, io_details=True)
+        try:
+            _guardar_esquema(ruta, esquema)
+        except OSError as e:
+            # Sin disco el esquema sirve igual; queda solo en memoria
+            log.warning("No se pudo guardar el esquema de %s: %s", tool_id, e)
+
+    with _memoria_lock:
+        _memoria[ruta] = esquema
+    return esquema
+
+# Validacion de tool_inputs planos ("seccion|condicional|parametro")
+
+def _es_dataset(valor, fuentes=FUENTES_DATASET):
+    if not isinstance(valor, dict):
+        return False
+    if valor.get("batch"):
+        # Mapeo sobre una coleccion: cada valor es un dataset o una coleccion
+        return bool(valor.get("values")) and all(_es_dataset(v) for v in valor["values"])
+    return valor.get("src") in fuentes and bool(valor.get("id"))
+
+def _texto(valor):
+    # Galaxy compara las opciones y los casos como texto
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    return str(valor)
+
+def _validar_valor(parametro, clave, valor, errores):
+    tipo = parametro.get("type")
+    if tipo == "data":
+        valores = valor if isinstance(valor, list) else [valor]
+        if not all(_es_dataset(v) for v in valores):
+            errores.append(f"{clave}: se esperaba un dataset {{'src', 'id'}}")
+    elif tipo == "data_collection":
+        if not _es_dataset(valor, {"hdca", "dce"}):
+            errores.append(f"{clave}: se esperaba una coleccion {{'src': 'hdca', 'id'}}")
+    elif tipo == "select":
+        # Las opciones dinamicas (tablas de datos) pueden venir vacias
+        opciones = {_texto(opcion[1]) for opcion in parametro.get("options") or []}
+        valores = valor if isinstance(valor, list) else [valor]
+        if len(valores) > 1 and not parametro.get("multiple"):
+            errores.append(f"{clave}: admite un solo valor")
+        invalidos = [v for v in valores if opciones and _texto(v) not in opciones]
+        if invalidos:
+            errores.append(f"{clave}: {invalidos} no esta entre {sorted(opciones)}")
+    elif tipo == "boolean":
+        if _texto(valor).lower() not in BOOLEANOS:
+            errores.append(f"{clave}: se esperaba true o false, no {valor!r}")
+    elif tipo in ("integer", "float"):
+        try:
+            numero = int(valor) if tipo == "integer" else float(valor)
+        except (TypeError, ValueError):
+            errores.append(f"{clave}: se esperaba un numero ({tipo}), no {valor!r}")
+            return
+        minimo, maximo = parametro.get("min"), parametro.get("max")
+        if minimo not in (None, "") and numero < float(minimo):
+            errores.append(f"{clave}: {numero} es menor que el minimo {minimo}")
+        if maximo not in (None, "") and numero > float(maximo):
+            errores.append(f"{clave}: {numero} es mayor que el maximo {maximo}")
+
+def _hoja(parametro, clave, inputs, completos, errores):
+    if clave in inputs:
+        valor = inputs[clave]
+        if valor is None or valor == "":
+            if not parametro.get("optional") and parametro.get("type") in ("data", "data_collection"):
+                errores.append(f"{clave}: falta el dataset")
+            return
+        _validar_valor(parametro, clave, valor, errores)
+        return
+
+    if parametro.get("type") in ("data", "data_collection"):
+        if not parametro.get("optional"):
+            errores.append(f"{clave}: falta el dataset")
+        return
+    defecto = parametro.get("value")
+    if parametro.get("type") in TIPOS_CON_DEFECTO and defecto is not None:
+        completos[clave] = defecto
+
+def _recorrer(parametros, prefijo, inputs, completos, errores, conocidas):
+    for parametro in parametros:
+        clave = prefijo + parametro["name"]
+        tipo = parametro.get("type")
+
+        if tipo == "conditional":
+            selector = parametro["test_param"]
+            clave_selector = f"{clave}|{selector['name']}"
+            conocidas.add(clave_selector)
+            _hoja(selector, clave_selector, inputs, completos, errores)
+            valor = completos.get(clave_selector)
+            caso = next(
+                (c for c in parametro.get("cases", []) if _texto(c.get("value")).lower() == _texto(valor).lower()),
+                None,
+            )
+            if caso is None:
+                if valor is not None:
+                    errores.append(f"{clave_selector}: no hay un caso para {valor!r}")
+                continue
+            _recorrer(caso.get("inputs", []), f"{clave}|", inputs, completos, errores, conocidas)
+
+        elif tipo == "section":
+            _recorrer(parametro.get("inputs", []), f"{clave}|", inputs, completos, errores, conocidas)
+
+        elif tipo == "repeat":
+            # Repeticiones "nombre_0|...", "nombre_1|..."; al menos las minimas
+            indices = {
+                int(k[len(clave) + 1:].split("|", 1)[0])
+                for k in inputs
+                if k.startswith(f"{clave}_") and k[len(clave) + 1:].split("|", 1)[0].isdigit()
+            }
+            total = max(max(indices, default=-1) + 1, int(parametro.get("min") or 0))
+            for indice in range(total):
+                _recorrer(parametro.get("inputs", []), f"{clave}_{indice}|", inputs, completos, errores, conocidas)
+
+        else:
+            conocidas.add(clave)
+            _hoja(parametro, clave, inputs, completos, errores)
+
+def validar_inputs(esquema, tool_inputs):
+    # Devuelve tool_inputs con los valores por defecto de lo que falta, o
+    # lanza EntradasInvalidas con todos los problemas encontrados
+    completos = dict(tool_inputs)
+    errores = []
+    conocidas = set()
+    _recorrer(esquema.get("inputs", []), "", tool_inputs, completos, errores, conocidas)
+
+    # Un parametro que no esta en el esquema es un error de tipeo o de otro
+    # caso del condicional; Galaxy lo ignoraria en silencio
+    for clave in tool_inputs:
+        if clave not in conocidas:
+            errores.append(f"{clave}: no existe en la version {esquema.get('version', '')} de la herramienta")
+
+    if errores:
+        raise EntradasInvalidas(esquema.get("id", ""), errores)
+    return completos
+
+def preparar_inputs(gi, tool_id, tool_inputs):
+    # Valida y completa los parametros antes de run_tool, para que un error
+    # falle en el momento y no despues de pasar por la cola de Galaxy
+    if not settings.GALAXY_VALIDAR_INPUTS:
+        return tool_inputs
+    try:
+        esquema = obtener_esquema(gi, tool_id)
+    except (ConnectionError, requests.exceptions.RequestException, OSError) as e:
+        if isinstance(e, ConnectionError) and e.status_code in (400, 404):
+            raise EntradasInvalidas(tool_id, [f"la herramienta no esta instalada en {gi.base_url}"])
+        # Sin esquema (Galaxy caido despues de los reintentos, timeout, disco
+        # lleno) se envia igual; Galaxy hara su propia validacion
+        log.warning("No se pudo obtener el esquema de %s: %s", tool_id, e)
+        return tool_inputs
+    return validar_inputs(esquema, tool_inputs)
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import PipelineEvent, PipelineRun
+
+log = logging.getLogger(__name__)
+
+ESTADOS_FINALES = {PipelineRun.OK, PipelineRun.ERROR}
+# Eventos que se leen como maximo en cada vuelta del difusor
+LIMITE_LECTURA = 500
+
+
+def registrar_evento(run_id, paso, estado, **datos):
+    # paso vacio = evento de la ejecucion completa. datos debe ser serializable
+    PipelineEvent.objects.create(run_id=run_id, step=paso, state=estado, data=datos)
+
+def serializar_evento(evento):
+    return {
+        "id": evento.pk,
+        "run_id": evento.run_id,
+        "step": evento.step,
+        "state": evento.state,
+        "time": evento.created_at.isoformat(),
+        **evento.data,
+    }
+
+def formato_sse(evento):
+    tipo = "paso" if evento.step else "ejecucion"
+    return f"id: {evento.pk}\nevent: {tipo}\ndata: {json.dumps(serializar_evento(evento))}\n\n"
+
+# Evento y no comentario SSE: la pagina lo ve y sabe que la conexion sigue viva
+KEEPALIVE = "event: keepalive\ndata: {}\n\n"
+
+def es_final(evento):
+    return not evento.step and evento.state in ESTADOS_FINALES
+
+def _leer_eventos(run_ids, desde):
+    return list(
+        PipelineEvent.objects.filter(run_id__in=run_ids, id__gt=desde).order_by("id")[:LIMITE_LECTURA]
+    )
+
+def _historial(run_id, desde):
+    # Eventos ya registrados y el estado actual de la ejecucion, en una sola llamada
+    eventos = list(PipelineEvent.objects.filter(run_id=run_id, id__gt=desde).order_by("id"))
+    estado = PipelineRun.objects.filter(pk=run_id).values_list("state", flat=True).first()
+    return eventos, estado
+
+
+class Suscripcion:
+    def __init__(self, run_id, desde):
+        self.run_id = run_id
+        self.desde = desde
+        self.cola = asyncio.Queue()
+
+
+class Difusor:
+    # Lee los eventos nuevos de todas las ejecuciones observadas con una sola
+    # consulta por intervalo y los reparte a cada suscripcion: mil clientes
+    # mirando cuestan lo mismo que uno.
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        # run_id -> set de Suscripcion
+        self.suscripciones = {}
+        self.cursor = None
+        self.tarea = None
+
+    def suscribir(self, run_id, desde=0):
+        suscripcion = Suscripcion(run_id, desde)
+        self.suscripciones.setdefault(run_id, set()).add(suscripcion)
+        if self.tarea is None or self.tarea.done():
+            self.tarea = asyncio.get_running_loop().create_task(self.bucle())
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        suscripciones = self.suscripciones.get(suscripcion.run_id)
+        if suscripciones is not None:
+            suscripciones.discard(suscripcion)
+            if not suscripciones:
+                del self.suscripciones[suscripcion.run_id]
+
+    def repartir(self, eventos):
+        for evento in eventos:
+            self.cursor = evento.pk
+            for suscripcion in self.suscripciones.get(evento.run_id, ()):
+                suscripcion.cola.put_nowait(evento)
+
+    async def bucle(self):
+        # Se arranca desde lo que ya vieron los suscriptores y no desde el
+        # ultimo evento de la tabla, que podria saltear alguno que aun no leyeron
+        if self.cursor is None:
+            self.cursor = min(
+                suscripcion.desde
+                for suscripciones in self.suscripciones.values()
+                for suscripcion in suscripciones
+            )
+
+        while self.suscripciones:
+            await asyncio.sleep(self.intervalo)
+            if not self.suscripciones:
+                break
+            try:
+                eventos = await sync_to_async(_leer_eventos)(list(self.suscripciones), self.cursor)
+            except Exception:
+                log.exception("No se pudieron leer los eventos de las ejecuciones")
+                continue
+            self.repartir(eventos)
+
+
+# Un difusor por event loop (uno solo bajo ASGI)
+_difusores = weakref.WeakKeyDictionary()
+
+def obtener_difusor():
+    loop = asyncio.get_running_loop()
+    difusor = _difusores.get(loop)
+    if difusor is None:
+        difusor = Difusor(settings.PIPELINE_SSE_INTERVALO)
+        _difusores[loop] = difusor
+    return difusor
+
+async def flujo_eventos(run_id, desde=0):
+    # Generador SSE: primero el historial desde Last-Event-ID y luego los
+    # eventos en vivo, hasta que la ejecucion termina
+    difusor = obtener_difusor()
+    # Se suscribe antes de leer el historial para no perder nada entre medio
+    suscripcion = difusor.suscribir(run_id, desde)
+    try:
+        eventos, estado = await sync_to_async(_historial)(run_id, desde)
+        ultimo = desde
+        for evento in eventos:
+            yield formato_sse(evento)
+            ultimo = evento.pk
+        if estado is None or estado in ESTADOS_FINALES:
+            return
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(
+                    suscripcion.cola.get(), timeout=settings.PIPELINE_SSE_KEEPALIVE
+                )
+            except asyncio.TimeoutError:
+                # Para que los proxies no corten la conexion
+                yield KEEPALIVE
+                continue
+
+            # Ya enviado con el historial
+            if evento.pk <= ultimo:
+                continue
+            yield formato_sse(evento)
+            ultimo = evento.pk
+            if es_final(evento):
+                return
+    finally:
+        difusor.cancelar(suscripcion)
+
+def flujo_eventos_wsgi(run_id, desde=0):
+    # Lo mismo que flujo_eventos para un servidor WSGI, que con un generador
+    # async juntaria toda la respuesta antes de mandarla: consulta los eventos
+    # nuevos en el hilo de la peticion y corta a los PIPELINE_SSE_DURACION_WSGI
+    # segundos para liberarlo
+    eventos, estado = _historial(run_id, desde)
+    ultimo = desde
+    for evento in eventos:
+        yield formato_sse(evento)
+        ultimo = evento.pk
+    if estado is None or estado in ESTADOS_FINALES:
+        return
+
+    fin = time.monotonic() + settings.PIPELINE_SSE_DURACION_WSGI
+    keepalive = time.monotonic() + settings.PIPELINE_SSE_KEEPALIVE
+    while time.monotonic() < fin:
+        time.sleep(settings.PIPELINE_SSE_INTERVALO)
+        for evento in _leer_eventos([run_id], ultimo):
+            yield formato_sse(evento)
+            ultimo = evento.pk
+            keepalive = time.monotonic() + settings.PIPELINE_SSE_KEEPALIVE
+            if es_final(evento):
+                return
+        if time.monotonic() >= keepalive:
+            yield KEEPALIVE
+            keepalive = time.monotonic() + settings.PIPELINE_SSE_KEEPALIVE
@@ -0,0 +1,226 @@
+import bz2
+import hashlib
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import _clave
+
+SUFIJOS_FASTQ = (".fastq", ".fq", ".fastq.gz", ".fq.gz", ".fastq.bz2", ".fq.bz2")
+# Cuanto se descomprime por vez
+TAMANO_DESCOMPRIMIDO = 4 * 1024 * 1024
+# Errores de formato que se guardan; despues solo se cuentan
+MAX_ERRORES = 5
+# Una linea mas larga (ni las lecturas ultra largas llegan) es un binario o
+# un archivo sin saltos de linea; se corta ahi para no acumularla en memoria
+LARGO_MAXIMO_LINEA = 10 * 1024 * 1024
+# Lo que se recuerda el resumen de un dataset subido para revisar sus pares
+VIGENCIA_CALIDAD = 7 * 24 * 60 * 60
+
+
+def es_fastq(nombre):
+    return nombre.lower().endswith(SUFIJOS_FASTQ)
+
+def _nombre_lectura(cabecera):
+    # "@M01:1:1 1:N:0:1" y "@M01:1:1/1" -> b"M01:1:1", igual en R1 y R2
+    nombre = cabecera[1:].split(None, 1)[0] if len(cabecera) > 1 else b""
+    if nombre.endswith((b"/1", b"/2")):
+        nombre = nombre[:-2]
+    return nombre
+
+
+class _Descompresor:
+    # gzip (tambien varios miembros seguidos, como bgzip) o bzip2, en trozos
+    # acotados para no inflar un trozo entero en memoria
+
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self._nuevo()
+
+    def _nuevo(self):
+        self.objeto = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.tipo == "gzip" else bz2.BZ2Decompressor()
+
+    @property
+    def completo(self):
+        return self.objeto.eof
+
+    def descomprimir(self, datos):
+        while True:
+            salida = self.objeto.decompress(datos, TAMANO_DESCOMPRIMIDO)
+            if self.tipo == "gzip":
+                datos = self.objeto.unconsumed_tail
+                pendiente = bool(datos)
+            else:
+                datos = b""
+                pendiente = not self.objeto.eof and not self.objeto.needs_input
+            if salida:
+                yield salida
+            if self.objeto.eof:
+                # Lo que sigue al final de un miembro es otro miembro
+                datos = self.objeto.unused_data
+                if not datos:
+                    return
+                self._nuevo()
+            elif not pendiente:
+                return
+
+
+class _Ignorar:
+    # Reemplaza al descompresor despues de un error: descarta el resto
+    tipo = None
+
+    def descomprimir(self, datos):
+        return ()
+
+
+class AnalizadorFastq:
+    # Estadisticas de un FASTQ calculadas sobre los trozos que se suben, en
+    # una sola pasada y con memoria constante: lecturas, largos, calidad media,
+    # lecturas todo N y una huella de los nombres para comparar R1 con R2
+
+    def __init__(self):
+        self.descompresor = None
+        self.inicio = True
+        self.lecturas = 0
+        self.bases = 0
+        self.suma_calidad = 0
+        self.todo_n = 0
+        self.largos = Counter()
+        self.errores = []
+        self.total_errores = 0
+        self.huella = hashlib.sha256()
+        self._resto = bytearray()
+        self._registro = []
+
+    def _error(self, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append(mensaje)
+
+    @property
+    def fatal(self):
+        return bool(self.total_errores)
+
+    def _procesar_registro(self, cabecera, secuencia, separador, calidad):
+        numero = self.lecturas + 1
+        if not cabecera.startswith(b"@"):
+            self._error(f"Lectura {numero}: la cabecera no empieza con '@'")
+        if not separador.startswith(b"+"):
+            self._error(f"Lectura {numero}: falta la linea '+'")
+        if len(secuencia) != len(calidad):
+            self._error(f"Lectura {numero}: la secuencia y la calidad tienen largos distintos")
+        elif calidad and min(calidad) < 33:
+            self._error(f"Lectura {numero}: calidad fuera de Phred+33")
+
+        self.lecturas = numero
+        self.bases += len(secuencia)
+        self.largos[len(secuencia)] += 1
+        self.suma_calidad += sum(calidad) - 33 * len(calidad)
+        if secuencia and secuencia.count(b"N") + secuencia.count(b"n") == len(secuencia):
+            self.todo_n += 1
+        self.huella.update(_nombre_lectura(cabecera) + b"\n")
+
+    def _texto(self, datos):
+        corte = datos.rfind(b"\n")
+        if corte < 0:
+            self._resto += datos
+            if len(self._resto) > LARGO_MAXIMO_LINEA:
+                self._error(f"Linea {self.lecturas * 4 + len(self._registro) + 1} de mas de "
+                            f"{LARGO_MAXIMO_LINEA} bytes: no parece un FASTQ")
+                self._resto = bytearray()
+            return
+        self._resto += datos[:corte]
+        lineas = bytes(self._resto).split(b"\n")
+        self._resto = bytearray(datos[corte + 1:])
+        for linea in lineas:
+            self._registro.append(linea.rstrip(b"\r"))
+            if len(self._registro) == 4:
+                self._procesar_registro(*self._registro)
+                self._registro = []
+
+    def agregar(self, trozo):
+        # Con un error fatal el archivo se rechaza: no hace falta seguir leyendo
+        if self.fatal:
+            return
+        if self.inicio and trozo:
+            self.inicio = False
+            if trozo.startswith(b"\x1f\x8b"):
+                self.descompresor = _Descompresor("gzip")
+            elif trozo.startswith(b"BZh"):
+                self.descompresor = _Descompresor("bzip2")
+        if self.descompresor is None:
+            self._texto(trozo)
+            return
+        try:
+            for datos in self.descompresor.descomprimir(trozo):
+                self._texto(datos)
+                if self.fatal:
+                    return
+        except (zlib.error, OSError, EOFError) as e:
+            self._error(f"El archivo comprimido esta danado: {e}")
+            # Sin un flujo valido no tiene sentido seguir leyendo
+            self.descompresor = _Ignorar()
+
+    def terminar(self):
+        if self.fatal:
+            # Se dejo de leer en el primer error: el resto no se reviso
+            return self.resumen()
+        if isinstance(self.descompresor, _Descompresor) and not self.descompresor.completo:
+            self._error("El archivo comprimido esta truncado")
+        if self._resto.strip():
+            self._registro.append(bytes(self._resto).rstrip(b"\r"))
+            self._resto = bytearray()
+            if len(self._registro) == 4:
+                self._procesar_registro(*self._registro)
+                self._registro = []
+        if any(linea.strip() for linea in self._registro):
+            self._error(f"El archivo termina a mitad de la lectura {self.lecturas + 1}")
+        if not self.lecturas and not self.total_errores:
+            self._error("El archivo no tiene lecturas")
+        elif self.lecturas and self.todo_n == self.lecturas:
+            self._error("Todas las lecturas son solo N")
+        return self.resumen()
+
+    def resumen(self):
+        avisos = []
+        calidad_media = round(self.suma_calidad / self.bases, 2) if self.bases else None
+        if calidad_media is not None and calidad_media < settings.PIPELINE_FASTQ_CALIDAD_MINIMA:
+            avisos.append(f"Calidad media baja: {calidad_media}")
+        if self.lecturas and self.todo_n / self.lecturas > settings.PIPELINE_FASTQ_MAX_TODO_N:
+            avisos.append(f"{self.todo_n} de {self.lecturas} lecturas son solo N")
+        return {
+            "reads": self.lecturas,
+            "bases": self.bases,
+            "min_length": min(self.largos) if self.largos else None,
+            "max_length": max(self.largos) if self.largos else None,
+            "mean_length": round(self.bases / self.lecturas, 2) if self.lecturas else None,
+            "length_distribution": {str(largo): n for largo, n in sorted(self.largos.items())},
+            "mean_quality": calidad_media,
+            "all_n_reads": self.todo_n,
+            "compression": self.descompresor.tipo if isinstance(self.descompresor, _Descompresor) else None,
+            "names_fingerprint": self.huella.hexdigest(),
+            "errors": self.errores,
+            "error_count": self.total_errores,
+            "warnings": avisos,
+        }
+
+
+def problemas_par(r1, r2):
+    # Errores de una pareja R1/R2 segun los resumenes de su subida; sin
+    # resumen (subidos por otro medio) no se puede comprobar nada
+    if not (r1 and r2):
+        return []
+    problemas = []
+    if r1["reads"] != r2["reads"]:
+        problemas.append(f"R1 tiene {r1['reads']} lecturas y R2 {r2['reads']}")
+    elif r1["names_fingerprint"] != r2["names_fingerprint"]:
+        problemas.append("Los nombres de las lecturas de R1 y R2 no coinciden o estan en otro orden")
+    return problemas
+
+def guardar_calidad(gi, dataset_id, resumen):
+    cache.set(_clave("calidad_fastq", gi, dataset_id), resumen, VIGENCIA_CALIDAD)
+
+def obtener_calidad(gi, dataset_id):
+    return cache.get(_clave("calidad_fastq", gi, dataset_id))
@@ -0,0 +1,222 @@
+import json
+import logging
+import threading
+import time
+
+import requests
+from bioblend import ConnectionError
+from bioblend.galaxy import GalaxyInstance
+from bioblend.util import FileStream
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+
+from user_app.models import GalaxyProfile
+
+from .limitador import clave_limite, espera_reintento, obtener_limitador
+from .metricas import obtener_registro, ruta_api
+from .trazas import registrar_llamada, tamano_cuerpo
+
+log = logging.getLogger(__name__)
+
+# Clave de la sesion donde se guarda la API key ya resuelta del usuario
+CLAVE_SESION_API_KEY = "galaxy_api_key"
+
+# Un 5xx de estos se reintenta solo si repetir la peticion no tiene efectos
+# (un POST repetido podria lanzar dos veces el mismo job); un 429 siempre que
+# el cuerpo se pueda volver a enviar
+ESTADOS_REINTENTABLES = {502, 503, 504}
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class PooledGalaxyInstance(GalaxyInstance):
+    # GalaxyInstance que reutiliza una sesion de requests con conexiones
+    # keep-alive en lugar de abrir una conexion (y un handshake TLS) por
+    # cada llamada a la API.
+
+    def __init__(self, url, key, pool_size=10, timeout=None):
+        super().__init__(url=url, key=key)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.ultimo_uso = time.monotonic()
+        self.clave_limite = clave_limite(url, key)
+
+    def peticion(self, metodo, url, **kwargs):
+        # Toda llamada pasa por el limitador compartido entre procesos; los
+        # 429 y 5xx se reintentan con backoff en lugar de cortar la ejecucion
+        self.ultimo_uso = time.monotonic()
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        limitador = obtener_limitador()
+        registro = obtener_registro()
+        ruta = ruta_api(url)
+        reintentos = settings.GALAXY_REINTENTOS
+        enviados = tamano_cuerpo(kwargs.get("data"))
+        # Un cuerpo en stream (el multipart con archivos) se consume al
+        # enviarlo: un reintento mandaria un cuerpo vacio
+        reenviable = not hasattr(kwargs.get("data"), "read")
+
+        for intento in range(reintentos + 1):
+            inicio = time.monotonic()
+            permiso = limitador.adquirir(self.clave_limite)
+            enviado = time.monotonic()
+            registro.observar("galaxy_api_limiter_wait_seconds", enviado - inicio)
+            try:
+                r = self.session.request(metodo, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                registro.observar("galaxy_api_request_duration_seconds", time.monotonic() - enviado,
+                                  method=metodo, endpoint=ruta, status="error")
+                registrar_llamada(metodo, ruta, time.monotonic() - enviado, enviado - inicio,
+                                  enviados, estado="error")
+                if metodo not in METODOS_IDEMPOTENTES or intento == reintentos:
+                    raise
+                registro.contar("galaxy_api_retries_total", method=metodo, endpoint=ruta, status="error")
+                espera = espera_reintento(intento)
+                log.warning("%s %s fallo (%s), reintento en %.1f s", metodo, url, e, espera)
+                time.sleep(espera)
+                continue
+            finally:
+                limitador.liberar(permiso)
+            registro.observar("galaxy_api_request_duration_seconds", time.monotonic() - enviado,
+                              method=metodo, endpoint=ruta, status=str(r.status_code))
+            # Las descargas en stream no se leen aqui: se cuenta lo que anuncia Galaxy
+            recibidos = int(r.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(r.content)
+            registrar_llamada(metodo, ruta, time.monotonic() - enviado, enviado - inicio,
+                              enviados, recibidos, str(r.status_code))
+
+            reintentable = reenviable and (r.status_code == 429 or (
+                r.status_code in ESTADOS_REINTENTABLES and metodo in METODOS_IDEMPOTENTES
+            ))
+            retry_after = r.headers.get("Retry-After")
+            espera = espera_reintento(intento, retry_after)
+            if r.status_code == 429 or (reintentable and retry_after):
+                # Los demas hilos y procesos con la misma key tambien esperan
+                limitador.pausar(self.clave_limite, espera)
+            if not reintentable or intento == reintentos:
+                return r
+
+            registro.contar("galaxy_api_retries_total", method=metodo, endpoint=ruta, status=str(r.status_code))
+            log.warning("%s %s respondio %s, reintento en %.1f s", metodo, url, r.status_code, espera)
+            r.close()
+            time.sleep(espera)
+
+    def _decodificar(self, r):
+        if r.status_code == 200:
+            try:
+                return r.json()
+            except Exception as e:
+                raise ConnectionError(
+                    f"Request was successful, but cannot decode the response content: {e}",
+                    body=r.content,
+                    status_code=r.status_code,
+                )
+        raise ConnectionError(
+            f"Unexpected HTTP status code: {r.status_code}",
+            body=r.text,
+            status_code=r.status_code,
+        )
+
+    def make_get_request(self, url, **kwargs):
+        return self.peticion("GET", url, headers=self.json_headers, **kwargs)
+
+    def make_post_request(self, url, payload=None, params=None, files_attached=False):
+        if files_attached:
+            # Igual que bioblend: los archivos se envian como multipart
+            payload_copy = payload.copy() if payload is not None else {}
+            if params:
+                payload_copy.update(params)
+            campos = {
+                k: v if isinstance(v, (FileStream, str, bytes)) else json.dumps(v)
+                for k, v in payload_copy.items()
+            }
+            data = MultipartEncoder(fields=campos)
+            headers = self.json_headers.copy()
+            headers["Content-Type"] = data.content_type
+            params = None
+        else:
+            data = json.dumps(payload) if payload is not None else None
+            headers = self.json_headers
+
+        r = self.peticion("POST", url, params=params, data=data, headers=headers, allow_redirects=False)
+        return self._decodificar(r)
+
+    def make_delete_request(self, url, payload=None, params=None):
+        data = json.dumps(payload) if payload is not None else None
+        return self.peticion(
+            "DELETE", url, params=params, data=data, headers=self.json_headers, allow_redirects=False
+        )
+
+    def make_put_request(self, url, payload=None, params=None):
+        data = json.dumps(payload) if payload is not None else None
+        r = self.peticion(
+            "PUT", url, params=params, data=data, headers=self.json_headers, allow_redirects=False
+        )
+        return self._decodificar(r)
+
+    def make_patch_request(self, url, payload=None, params=None):
+        data = json.dumps(payload) if payload is not None else None
+        r = self.peticion(
+            "PATCH", url, params=params, data=data, headers=self.json_headers, allow_redirects=False
+        )
+        return self._decodificar(r)
+
+    def cerrar(self):
+        self.session.close()
+
+
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+def _desalojar_inactivos(ahora):
+    inactividad = settings.GALAXY_POOL_IDLE_SEGUNDOS
+    for clave, cliente in list(_clientes.items()):
+        if ahora - cliente.ultimo_uso > inactividad:
+            log.debug("Cerrando cliente de Galaxy inactivo para %s", clave[0])
+            cliente.cerrar()
+            del _clientes[clave]
+
+def obtener_cliente(url=None, api_key=None):
+    # Cliente compartido por todo el proceso para cada servidor y API key
+    url = url or settings.GALAXY_URL
+    if api_key is None:
+        api_key = settings.GALAXY_API_KEY
+    clave = (url, api_key)
+
+    with _clientes_lock:
+        ahora = time.monotonic()
+        _desalojar_inactivos(ahora)
+
+        cliente = _clientes.get(clave)
+        if cliente is None:
+            cliente = PooledGalaxyInstance(
+                url,
+                api_key,
+                pool_size=settings.GALAXY_POOL_SIZE,
+                timeout=settings.GALAXY_TIMEOUT,
+            )
+            _clientes[clave] = cliente
+        cliente.ultimo_uso = ahora
+        return cliente
+
+def api_key_usuario(user):
+    # API key del perfil de Galaxy del usuario; None si no tiene una propia
+    if user is None or not user.is_authenticated:
+        return None
+    api_key = GalaxyProfile.objects.filter(user=user).values_list("galaxy_api_key", flat=True).first()
+    return api_key or None
+
+def obtener_cliente_usuario(user):
+    # Cada usuario usa su propia cuenta (y su cuota de jobs) y su propio pool
+    # de conexiones; sin API key propia se usa la de settings
+    return obtener_cliente(api_key=api_key_usuario(user))
+
+def obtener_cliente_sesion(request):
+    # Como obtener_cliente_usuario, pero la API key se busca una sola vez por sesion
+    if not request.user.is_authenticated:
+        return obtener_cliente()
+    if CLAVE_SESION_API_KEY not in request.session:
+        request.session[CLAVE_SESION_API_KEY] = api_key_usuario(request.user) or ""
+    return obtener_cliente(api_key=request.session[CLAVE_SESION_API_KEY] or None)
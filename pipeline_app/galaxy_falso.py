@@ -0,0 +1,638 @@
+import hashlib
+import json
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .metricas import ruta_api
+
+# (segundos en cola, segundos corriendo) de cada herramienta por defecto
+DURACION_DEFECTO = (1.0, 2.0)
+
+# Salidas de cada herramienta que usa el pipeline, por nombre corto
+SALIDAS_HERRAMIENTAS = {
+    "fastqc": ["html_file", "text_file"],
+    "bowtie2": ["output", "output_unaligned_reads_l", "output_unaligned_reads_r"],
+    "trimmomatic": ["fastq_out_r1_paired", "fastq_out_r2_paired", "fastq_out_r1_unpaired", "fastq_out_r2_unpaired"],
+    "shovill": ["contigs", "contigs_graph", "shovill_std_log"],
+    "quast": ["report_tabular", "report_html"],
+    "augustus": ["output"],
+}
+EXTENSIONES_SALIDAS = {
+    "html_file": "html", "text_file": "txt", "output": "bam",
+    "output_unaligned_reads_l": "fastqsanger", "output_unaligned_reads_r": "fastqsanger",
+    "fastq_out_r1_paired": "fastqsanger", "fastq_out_r2_paired": "fastqsanger",
+    "fastq_out_r1_unpaired": "fastqsanger", "fastq_out_r2_unpaired": "fastqsanger",
+    "contigs": "fasta", "contigs_graph": "txt", "shovill_std_log": "txt",
+    "report_tabular": "tabular", "report_html": "html",
+}
+
+# Esquemas (show_tool con io_details) reducidos a los parametros que usa el
+# pipeline, con la misma forma que los de Galaxy
+
+def _dato(nombre, optional=False, multiple=False):
+    return {"name": nombre, "type": "data", "optional": optional, "multiple": multiple}
+
+def _coleccion(nombre, tipo):
+    return {"name": nombre, "type": "data_collection", "collection_types": [tipo], "optional": False}
+
+def _opciones(nombre, valores, defecto=None, multiple=False):
+    return {"name": nombre, "type": "select", "multiple": multiple, "optional": False,
+            "value": defecto if defecto is not None else valores[0],
+            "options": [[valor, valor, valor == defecto] for valor in valores]}
+
+def _booleano(nombre, defecto=False):
+    return {"name": nombre, "type": "boolean", "optional": False, "value": defecto}
+
+def _entero(nombre, defecto, minimo=None):
+    return {"name": nombre, "type": "integer", "optional": False, "value": defecto, "min": minimo}
+
+def _condicional(nombre, selector, casos):
+    return {"name": nombre, "type": "conditional", "test_param": selector,
+            "cases": [{"value": valor, "inputs": inputs} for valor, inputs in casos.items()]}
+
+_BOWTIE_LECTURAS = [_booleano("unaligned_file"), _booleano("aligned_file"),
+                    _condicional("paired_options", _opciones("paired_options_selector", ["no", "yes"]),
+                                 {"no": [], "yes": [_entero("I", 0, 0), _entero("X", 500, 0)]})]
+
+ESQUEMAS_HERRAMIENTAS = {
+    "fastqc": [_dato("input_file"), _dato("contaminants", optional=True), _entero("kmers", 7, 2)],
+    "bowtie2": [
+        _condicional("library", _opciones("type", ["single", "paired", "paired_collection"]), {
+            "single": [_dato("input_1"), _booleano("unaligned_file"), _booleano("aligned_file")],
+            "paired": [_dato("input_1"), _dato("input_2"), *_BOWTIE_LECTURAS],
+            "paired_collection": [_coleccion("input_1", "paired"), *_BOWTIE_LECTURAS],
+        }),
+        _condicional("reference_genome", _opciones("source", ["indexed", "history"]), {
+            "indexed": [_opciones("index", ["hg38", "mm10"])],
+            "history": [_dato("own_file")],
+        }),
+        _booleano("save_mapping_stats"),
+    ],
+    "trimmomatic": [
+        _condicional("readtype", _opciones("single_or_paired", ["se", "pair_of_files", "collection"]), {
+            "se": [_dato("fastq_in")],
+            "pair_of_files": [_dato("fastq_r1_in"), _dato("fastq_r2_in")],
+            "collection": [_coleccion("fastq_pair", "paired")],
+        }),
+        _condicional("illuminaclip", _opciones("do_illuminaclip", ["yes", "no"], "no"), {
+            "yes": [_opciones("adapter_fasta", ["TruSeq3-PE.fa", "NexteraPE-PE.fa"])],
+            "no": [],
+        }),
+        {"name": "operations", "type": "repeat", "min": 0, "inputs": [
+            _condicional("operation", _opciones("name", ["SLIDINGWINDOW", "MINLEN"]), {
+                "SLIDINGWINDOW": [_entero("window_size", 4, 1), _entero("required_quality", 20, 0)],
+                "MINLEN": [_entero("minlen", 36, 1)],
+            }),
+        ]},
+        _booleano("output_err"),
+    ],
+    "shovill": [
+        _condicional("library", _opciones("lib_type", ["paired", "paired_collection"]), {
+            "paired": [_dato("R1"), _dato("R2")],
+            "paired_collection": [_coleccion("input1", "paired")],
+        }),
+        _opciones("assembler", ["spades", "skesa", "velvet", "megahit"], "spades"),
+        _booleano("trim"),
+    ],
+    "quast": [
+        _condicional("mode", _opciones("mode", ["individual", "co"]), {
+            "individual": [_condicional("in", _booleano("custom"), {
+                "false": [_dato("inputs", multiple=True)],
+                "true": [_dato("inputs", multiple=True), _opciones("labels", [""])],
+            })],
+            "co": [_dato("inputs", multiple=True)],
+        }),
+        _opciones("output_files", ["html", "pdf", "tabular", "log"], "html", multiple=True),
+        _entero("min_contig", 500, 0),
+    ],
+    "augustus": [_dato("input_genome"), _opciones("organism", ["human", "arabidopsis", "E_coli_K12"], "human")],
+}
+
+
+def _ahora():
+    return time.time()
+
+def _iso(marca):
+    # Como Galaxy: UTC sin zona horaria
+    return datetime.fromtimestamp(marca, timezone.utc).replace(tzinfo=None).isoformat()
+
+def nombre_corto(tool_id):
+    return tool_id.rsplit("/", 2)[-2] if "/repos/" in tool_id else tool_id
+
+def generar_fastq(semilla, lecturas=50, largo=100):
+    bases = "ACGT"
+    lineas = []
+    for i in range(lecturas):
+        secuencia = "".join(bases[(semilla + i * 7 + j * 13) % 4] for j in range(largo))
+        lineas += [f"@lectura_{i}", secuencia, "+", "I" * largo]
+    return ("\n".join(lineas) + "\n").encode()
+
+def generar_fasta(semilla, contigs=20):
+    bases = "ACGT"
+    lineas = []
+    for i in range(contigs):
+        largo = 200 + (semilla * 31 + i * 97) % 5000
+        lineas += [f">contig_{i}", "".join(bases[(semilla + j) % 4] for j in range(largo))]
+    return ("\n".join(lineas) + "\n").encode()
+
+def _reporte_quast(semilla):
+    return (
+        "Assembly\tcontigs\n"
+        f"# contigs\t{20 + semilla % 30}\n"
+        f"Total length\t{100000 + semilla % 50000}\n"
+        f"N50\t{1000 + semilla % 9000}\n"
+        f"L50\t{1 + semilla % 20}\n"
+        "GC (%)\t50.1\n"
+    ).encode()
+
+
+class EstadoGalaxyFalso:
+    # Historias, datasets, colecciones y jobs en memoria. Los jobs avanzan
+    # solos segun el reloj: new -> queued -> running -> ok (o error)
+
+    def __init__(self, duraciones=None, errores=()):
+        self.duraciones = duraciones or {}
+        self.errores = set(errores)
+        self.lock = threading.RLock()
+        self.historias = {}
+        self.datasets = {}
+        self.colecciones = {}
+        self.jobs = {}
+        self.sesiones_tus = {}
+        self.llamadas = Counter()
+
+    def nuevo_id(self):
+        return secrets.token_hex(8)
+
+    # Historias y datasets
+
+    def crear_historia(self, nombre):
+        with self.lock:
+            history_id = self.nuevo_id()
+            marca = _ahora()
+            self.historias[history_id] = {
+                "id": history_id, "name": nombre, "deleted": False, "purged": False,
+                "create_time": _iso(marca), "update_time": _iso(marca), "hid_counter": 1,
+                "url": f"/api/histories/{history_id}",
+            }
+            return self.historias[history_id]
+
+    def _tocar_historia(self, history_id):
+        self.historias[history_id]["update_time"] = _iso(_ahora())
+
+    def crear_dataset(self, history_id, nombre, contenido=b"", extension="data", job=None):
+        with self.lock:
+            historia = self.historias[history_id]
+            dataset_id = self.nuevo_id()
+            marca = _ahora()
+            self.datasets[dataset_id] = {
+                "id": dataset_id,
+                "name": nombre,
+                "history_id": history_id,
+                "hid": historia["hid_counter"],
+                "extension": extension,
+                "file_ext": extension,
+                "file_size": len(contenido),
+                "deleted": False,
+                "purged": False,
+                "visible": True,
+                "history_content_type": "dataset",
+                "model_class": "HistoryDatasetAssociation",
+                "uuid": self.nuevo_id() + self.nuevo_id(),
+                "hashes": [{"hash_function": "SHA-256", "hash_value": hashlib.sha256(contenido).hexdigest()}],
+                "create_time": _iso(marca),
+                "update_time": _iso(marca),
+                "download_url": f"/api/histories/{history_id}/contents/{dataset_id}/display",
+                "_contenido": contenido,
+                "_job": job,
+            }
+            historia["hid_counter"] += 1
+            self._tocar_historia(history_id)
+            return dataset_id
+
+    def vista_dataset(self, dataset_id):
+        dataset = self.datasets[dataset_id]
+        estado = "ok"
+        if dataset["_job"]:
+            estado = {"error": "error", "ok": "ok"}.get(self.estado_job(dataset["_job"])[0], "queued")
+        vista = {clave: valor for clave, valor in dataset.items() if not clave.startswith("_")}
+        vista["state"] = estado
+        return vista
+
+    def crear_coleccion(self, history_id, nombre, tipo, elementos):
+        # elementos: [{"name", "src": "hda"|"new_collection", "id"|"element_identifiers"}]
+        def armar(elementos):
+            resultado = []
+            for elemento in elementos:
+                if elemento.get("src") == "new_collection":
+                    objeto = {
+                        "id": self.nuevo_id(),
+                        "model_class": "DatasetCollection",
+                        "collection_type": elemento.get("collection_type", "paired"),
+                        "elements": armar(elemento["element_identifiers"]),
+                    }
+                else:
+                    objeto = {"id": elemento["id"], "model_class": "HistoryDatasetAssociation"}
+                resultado.append({"element_identifier": elemento["name"], "object": objeto})
+            return resultado
+
+        with self.lock:
+            hdca_id = self.nuevo_id()
+            self.colecciones[hdca_id] = {
+                "id": hdca_id,
+                "name": nombre,
+                "history_id": history_id,
+                "collection_type": tipo,
+                "populated_state": "ok",
+                "deleted": False,
+                "history_content_type": "dataset_collection",
+                "model_class": "HistoryDatasetCollectionAssociation",
+                "elements": armar(elementos),
+            }
+            self._tocar_historia(history_id)
+            return self.colecciones[hdca_id]
+
+    def contenido(self, dataset_id):
+        return self.datasets[dataset_id]["_contenido"]
+
+    # Jobs
+
+    def estado_job(self, job_id):
+        # (estado, marca del ultimo cambio) segun el tiempo transcurrido
+        job = self.jobs[job_id]
+        cola, ejecucion = job["duracion"]
+        transcurrido = _ahora() - job["creado"]
+        if transcurrido < cola:
+            return "queued", job["creado"]
+        if transcurrido < cola + ejecucion:
+            return "running", job["creado"] + cola
+        return ("error" if job["falla"] else "ok"), job["creado"] + cola + ejecucion
+
+    def vista_job(self, job_id):
+        job = self.jobs[job_id]
+        estado, cambio = self.estado_job(job_id)
+        return {
+            "id": job_id,
+            "tool_id": job["tool_id"],
+            "history_id": job["history_id"],
+            "state": estado,
+            "create_time": _iso(job["creado"]),
+            "update_time": _iso(cambio),
+            "outputs": job["outputs"],
+            "inputs": job["inputs"],
+            "params": {},
+        }
+
+    def _contenido_salida(self, herramienta, salida, semilla):
+        extension = EXTENSIONES_SALIDAS.get(salida, "txt")
+        if salida == "report_tabular":
+            return _reporte_quast(semilla), extension
+        if extension == "fasta":
+            return generar_fasta(semilla), extension
+        if extension == "fastqsanger":
+            return generar_fastq(semilla), extension
+        return f"{herramienta} {salida}\n".encode(), extension
+
+    def _crear_job(self, history_id, tool_id, inputs):
+        herramienta = nombre_corto(tool_id)
+        job_id = self.nuevo_id()
+        semilla = int(hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:8], 16)
+        self.jobs[job_id] = {
+            "tool_id": tool_id,
+            "history_id": history_id,
+            "creado": _ahora(),
+            "duracion": self.duraciones.get(herramienta, DURACION_DEFECTO),
+            "falla": herramienta in self.errores,
+            "inputs": inputs,
+            "outputs": {},
+        }
+        for salida in SALIDAS_HERRAMIENTAS.get(herramienta, ["output"]):
+            contenido, extension = self._contenido_salida(herramienta, salida, semilla)
+            dataset_id = self.crear_dataset(
+                history_id, f"{herramienta} on data: {salida}", contenido, extension, job=job_id
+            )
+            self.jobs[job_id]["outputs"][salida] = {"id": dataset_id, "src": "hda", "uuid": None}
+        return job_id
+
+    def _unidades(self, valor):
+        # Elementos sobre los que se mapea una entrada en lote:
+        # [(identificador, valor para el job)]
+        referencia = valor["values"][0]
+        if referencia.get("src") != "hdca":
+            return [(str(i), v) for i, v in enumerate(valor["values"])]
+        coleccion = self.colecciones[referencia["id"]]
+        if referencia.get("map_over_type"):
+            return [
+                (e["element_identifier"], {"src": "dce", "id": e["object"]["id"]})
+                for e in coleccion["elements"]
+            ]
+        unidades = []
+        pendientes = [(e["element_identifier"], e) for e in coleccion["elements"]]
+        while pendientes:
+            identificador, elemento = pendientes.pop(0)
+            objeto = elemento["object"]
+            if "elements" in objeto:
+                pendientes += [(f"{identificador}_{e['element_identifier']}", e) for e in objeto["elements"]]
+            else:
+                unidades.append((identificador, {"src": "hda", "id": objeto["id"]}))
+        return unidades
+
+    def ejecutar_herramienta(self, history_id, tool_id, inputs):
+        with self.lock:
+            lotes = {
+                clave: self._unidades(valor) for clave, valor in inputs.items()
+                if isinstance(valor, dict) and valor.get("batch")
+            }
+            if not lotes:
+                job_id = self._crear_job(history_id, tool_id, inputs)
+                return {
+                    "jobs": [self.vista_job(job_id)],
+                    "outputs": [
+                        {**self.vista_dataset(s["id"]), "output_name": nombre}
+                        for nombre, s in self.jobs[job_id]["outputs"].items()
+                    ],
+                    "implicit_collections": [],
+                    "output_collections": [],
+                }
+
+            # Las entradas en lote se recorren juntas, elemento a elemento
+            identificadores = [identificador for identificador, _ in next(iter(lotes.values()))]
+            jobs = []
+            for indice in range(len(identificadores)):
+                inputs_job = {**inputs, **{clave: unidades[indice][1] for clave, unidades in lotes.items()}}
+                jobs.append(self._crear_job(history_id, tool_id, inputs_job))
+
+            implicitas = []
+            for salida in SALIDAS_HERRAMIENTAS.get(nombre_corto(tool_id), ["output"]):
+                coleccion = self.crear_coleccion(history_id, f"{nombre_corto(tool_id)} {salida}", "list", [
+                    {"name": identificador, "src": "hda", "id": self.jobs[job_id]["outputs"][salida]["id"]}
+                    for identificador, job_id in zip(identificadores, jobs)
+                ])
+                implicitas.append({"id": coleccion["id"], "output_name": salida})
+            return {
+                "jobs": [self.vista_job(job_id) for job_id in jobs],
+                "outputs": [],
+                "implicit_collections": implicitas,
+                "output_collections": [],
+            }
+
+
+def _filtrar(items, params):
+    # Los filtros q/qv que usa bioblend, mas history_id, state, limit y offset
+    filtros = dict(zip(params.get("q", []), params.get("qv", [])))
+    estados = {e for valor in params.get("state", []) for e in valor.split(",")}
+    resultado = []
+    for item in items:
+        if "history_id" in params and item.get("history_id") != params["history_id"][0]:
+            continue
+        if estados and item.get("state") not in estados:
+            continue
+        if "name" in filtros and item.get("name") != filtros["name"]:
+            continue
+        if "update_time-ge" in filtros and item.get("update_time", "") < filtros["update_time-ge"]:
+            continue
+        if "deleted" in filtros and str(item.get("deleted", False)) != filtros["deleted"]:
+            continue
+        if "visible" in filtros and str(item.get("visible", True)) != filtros["visible"]:
+            continue
+        resultado.append(item)
+    offset = int(params.get("offset", ["0"])[0])
+    limite = int(params.get("limit", [str(len(resultado))])[0])
+    return resultado[offset:offset + limite]
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    RUTAS = [
+        ("GET", r"/api/histories", "listar_historias"),
+        ("POST", r"/api/histories", "crear_historia"),
+        ("GET", r"/api/histories/(\w+)", "ver_historia"),
+        ("GET", r"/api/histories/(\w+)/contents", "contenidos_historia"),
+        ("POST", r"/api/histories/(\w+)/contents", "crear_contenido"),
+        ("GET", r"/api/histories/(\w+)/contents/(\w+)/display", "descargar"),
+        ("GET", r"/api/datasets", "listar_datasets"),
+        ("GET", r"/api/datasets/(\w+)", "ver_dataset"),
+        ("GET", r"/api/datasets/(\w+)/display", "descargar_dataset"),
+        ("GET", r"/api/dataset_collections/(\w+)", "ver_coleccion"),
+        ("POST", r"/api/tools", "ejecutar_herramienta"),
+        ("POST", r"/api/tools/fetch", "registrar_subida"),
+        ("GET", r"/api/tools/([^?]+)", "ver_herramienta"),
+        ("GET", r"/api/jobs", "listar_jobs"),
+        ("GET", r"/api/jobs/(\w+)", "ver_job"),
+        ("GET", r"/api/jobs/(\w+)/outputs", "salidas_job"),
+        ("GET", r"/api/jobs/(\w+)/inputs", "entradas_job"),
+        ("GET", r"/api/users/current", "usuario_actual"),
+        ("POST", r"/api/upload/resumable_upload/?", "crear_sesion_tus"),
+        ("HEAD", r"/api/upload/resumable_upload/(\w+)", "offset_tus"),
+        ("PATCH", r"/api/upload/resumable_upload/(\w+)", "enviar_tus"),
+    ]
+
+    def log_message(self, formato, *args):
+        pass
+
+    @property
+    def estado(self):
+        return self.server.estado
+
+    def _responder(self, cuerpo=None, estado=200, headers=None, crudo=None):
+        datos = crudo if crudo is not None else json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        for clave, valor in (headers or {}).items():
+            self.send_header(clave, valor)
+        self.send_header("Content-Length", str(len(datos) if self.command != "HEAD" else 0))
+        if crudo is None:
+            self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(datos)
+
+    def _cuerpo(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(largo) if largo else b""
+
+    def _json(self):
+        cuerpo = self._cuerpo()
+        if not cuerpo:
+            return {}
+        if self.headers.get("Content-Type", "").startswith("multipart/"):
+            raise ValueError("multipart no soportado")
+        return json.loads(cuerpo)
+
+    def _despachar(self):
+        partes = urlsplit(self.path)
+        params = parse_qs(partes.query)
+        if self.server.demora:
+            time.sleep(self.server.demora)
+        with self.estado.lock:
+            self.estado.llamadas[f"{self.command} {ruta_api(partes.path)}"] += 1
+        for metodo, patron, accion in self.RUTAS:
+            coincidencia = re.fullmatch(patron, partes.path)
+            if metodo == self.command and coincidencia:
+                try:
+                    getattr(self, accion)(params, *coincidencia.groups())
+                except KeyError as e:
+                    self._responder({"err_msg": f"No encontrado: {e}"}, 404)
+                return
+        self._responder({"err_msg": f"Ruta no implementada: {self.command} {partes.path}"}, 404)
+
+    do_GET = do_POST = do_HEAD = do_PATCH = _despachar
+
+    # Historias
+
+    def listar_historias(self, params):
+        historias = sorted(self.estado.historias.values(), key=lambda h: h["update_time"], reverse=True)
+        self._responder(_filtrar(historias, params))
+
+    def crear_historia(self, params):
+        self._responder(self.estado.crear_historia(self._json().get("name", "Unnamed history")))
+
+    def ver_historia(self, params, history_id):
+        self._responder(self.estado.historias[history_id])
+
+    def contenidos_historia(self, params, history_id):
+        datasets = [self.estado.vista_dataset(d) for d, v in self.estado.datasets.items()
+                    if v["history_id"] == history_id]
+        self._responder(datasets)
+
+    def crear_contenido(self, params, history_id):
+        datos = self._json()
+        coleccion = self.estado.crear_coleccion(
+            history_id, datos.get("name", ""), datos.get("collection_type", "list"), datos.get("element_identifiers", [])
+        )
+        self._responder(coleccion)
+
+    def descargar(self, params, history_id, dataset_id):
+        self._responder(crudo=self.estado.contenido(dataset_id))
+
+    # Datasets y colecciones
+
+    def listar_datasets(self, params):
+        datasets = [self.estado.vista_dataset(d) for d in self.estado.datasets]
+        self._responder(_filtrar(datasets, params))
+
+    def ver_dataset(self, params, dataset_id):
+        self._responder(self.estado.vista_dataset(dataset_id))
+
+    def descargar_dataset(self, params, dataset_id):
+        self._responder(crudo=self.estado.contenido(dataset_id))
+
+    def ver_coleccion(self, params, hdca_id):
+        self._responder(self.estado.colecciones[hdca_id])
+
+    # Herramientas
+
+    def ejecutar_herramienta(self, params):
+        datos = self._json()
+        inputs = datos["inputs"]
+        if isinstance(inputs, str):
+            inputs = json.loads(inputs)
+        self._responder(self.estado.ejecutar_herramienta(datos["history_id"], datos["tool_id"], inputs))
+
+    def registrar_subida(self, params):
+        datos = self._json()
+        archivo = next((v for k, v in datos.items() if k.endswith("file_data")), {})
+        contenido = self.estado.sesiones_tus.pop(archivo.get("session_id"), bytearray())
+        nombre = archivo.get("name") or "upload"
+        extension = "fastqsanger" if nombre.endswith((".fastq", ".fq")) else "data"
+        dataset_id = self.estado.crear_dataset(datos["history_id"], nombre, bytes(contenido), extension)
+        self._responder({"outputs": [self.estado.vista_dataset(dataset_id)], "jobs": []})
+
+    def ver_herramienta(self, params, tool_id):
+        herramienta = nombre_corto(tool_id)
+        if herramienta not in ESQUEMAS_HERRAMIENTAS:
+            self._responder({"err_msg": f"Tool '{tool_id}' does not exist"}, 400)
+            return
+        respuesta = {"id": tool_id, "name": herramienta, "version": tool_id.rsplit("/", 1)[-1]}
+        if params.get("io_details", ["false"])[0].lower() == "true":
+            respuesta["inputs"] = ESQUEMAS_HERRAMIENTAS[herramienta]
+        self._responder(respuesta)
+
+    # Jobs
+
+    def listar_jobs(self, params):
+        jobs = [self.estado.vista_job(j) for j in list(self.estado.jobs)]
+        self._responder(_filtrar(jobs, params))
+
+    def ver_job(self, params, job_id):
+        self._responder(self.estado.vista_job(job_id))
+
+    def salidas_job(self, params, job_id):
+        self._responder([
+            {"name": nombre, "dataset": salida}
+            for nombre, salida in self.estado.jobs[job_id]["outputs"].items()
+        ])
+
+    def entradas_job(self, params, job_id):
+        self._responder([{"name": k, "dataset": v} for k, v in self.estado.jobs[job_id]["inputs"].items()
+                         if isinstance(v, dict)])
+
+    def usuario_actual(self, params):
+        self._responder({"id": "benchmark", "username": "benchmark", "email": "benchmark@localhost"})
+
+    # Subidas tus
+
+    def crear_sesion_tus(self, params):
+        self._cuerpo()
+        session_id = self.estado.nuevo_id()
+        self.estado.sesiones_tus[session_id] = bytearray()
+        self._responder(crudo=b"", estado=201, headers={
+            "Location": f"/api/upload/resumable_upload/{session_id}", "Tus-Resumable": "1.0.0",
+        })
+
+    def offset_tus(self, params, session_id):
+        offset = len(self.estado.sesiones_tus[session_id])
+        self._responder(crudo=b"", headers={"Upload-Offset": str(offset), "Tus-Resumable": "1.0.0"})
+
+    def enviar_tus(self, params, session_id):
+        datos = self.estado.sesiones_tus[session_id]
+        if int(self.headers.get("Upload-Offset", 0)) != len(datos):
+            self._cuerpo()
+            self._responder(crudo=b"", estado=409)
+            return
+        datos += self._cuerpo()
+        self._responder(crudo=b"", estado=204, headers={"Upload-Offset": str(len(datos)), "Tus-Resumable": "1.0.0"})
+
+
+class ServidorGalaxyFalso:
+    # Galaxy local en un hilo, con los endpoints que usa la aplicacion:
+    # historias, datasets, colecciones, run_tool, jobs, fetch y tus.
+    # duraciones: {herramienta: (cola, ejecucion)} en segundos; demora: latencia
+    # agregada a cada peticion
+
+    def __init__(self, duraciones=None, errores=(), demora=0.0, puerto=0):
+        self.estado = EstadoGalaxyFalso(duraciones, errores)
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _Manejador)
+        self.servidor.estado = self.estado
+        self.servidor.demora = demora
+        self.servidor.daemon_threads = True
+        self.hilo = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, name="galaxy-falso", daemon=True)
+        self.hilo.start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+    def llamadas(self):
+        with self.estado.lock:
+            return dict(self.estado.llamadas)
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# Un permiso en vuelo que no se libero (proceso muerto) vence solo
+VIGENCIA_EN_VUELO = 10 * 60
+# Espera entre intentos cuando ya hay demasiadas peticiones en vuelo
+ESPERA_EN_VUELO = 0.05
+
+
+class LimitadorGalaxy:
+    # Token bucket y tope de peticiones en vuelo por servidor y API key,
+    # compartido por todos los procesos de la maquina a traves de un archivo
+    # SQLite: cada worker y cada proceso web ve los mismos tokens.
+
+    def __init__(self, ruta, por_segundo, rafaga, en_vuelo):
+        self.ruta = ruta
+        self.por_segundo = por_segundo
+        self.rafaga = rafaga
+        self.en_vuelo = en_vuelo
+        self._local = threading.local()
+
+    def _conexion(self):
+        # Una conexion por hilo y por proceso (no se hereda en un fork)
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cubetas ("
+                "clave TEXT PRIMARY KEY, tokens REAL, actualizado REAL, pausa_hasta REAL DEFAULT 0)"
+            )
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS en_vuelo ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, clave TEXT, vence REAL)"
+            )
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def _intentar(self, clave):
+        # Devuelve (permiso, 0) o (None, segundos a esperar)
+        conexion = self._conexion()
+        ahora = time.time()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.execute("DELETE FROM en_vuelo WHERE vence < ?", (ahora,))
+            fila = conexion.execute(
+                "SELECT tokens, actualizado, pausa_hasta FROM cubetas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                tokens, pausa_hasta = float(self.rafaga), 0
+            else:
+                tokens = min(self.rafaga, fila[0] + (ahora - fila[1]) * self.por_segundo)
+                pausa_hasta = fila[2]
+
+            if pausa_hasta > ahora:
+                espera = pausa_hasta - ahora
+            elif tokens < 1:
+                espera = (1 - tokens) / self.por_segundo
+            else:
+                ocupados = conexion.execute(
+                    "SELECT COUNT(*) FROM en_vuelo WHERE clave = ?", (clave,)
+                ).fetchone()[0]
+                espera = ESPERA_EN_VUELO if ocupados >= self.en_vuelo else 0
+
+            permiso = None
+            if not espera:
+                tokens -= 1
+                permiso = conexion.execute(
+                    "INSERT INTO en_vuelo (clave, vence) VALUES (?, ?)", (clave, ahora + VIGENCIA_EN_VUELO)
+                ).lastrowid
+            conexion.execute(
+                "INSERT INTO cubetas (clave, tokens, actualizado, pausa_hasta) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET tokens = excluded.tokens, actualizado = excluded.actualizado",
+                (clave, tokens, ahora, pausa_hasta),
+            )
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        return permiso, espera
+
+    def adquirir(self, clave):
+        # Bloquea hasta tener un token y un lugar libre; devuelve el permiso
+        # que hay que pasar a liberar
+        while True:
+            permiso, espera = self._intentar(clave)
+            if permiso is not None:
+                return permiso
+            # Con jitter para que los procesos que esperan no despierten juntos
+            time.sleep(espera * random.uniform(1, 1.5))
+
+    def liberar(self, permiso):
+        self._conexion().execute("DELETE FROM en_vuelo WHERE id = ?", (permiso,))
+
+    def pausar(self, clave, segundos):
+        # Galaxy pidio esperar (429 o Retry-After): nadie envia nada a ese
+        # servidor con esa key hasta que pase la pausa
+        hasta = time.time() + segundos
+        self._conexion().execute(
+            "INSERT INTO cubetas (clave, tokens, actualizado, pausa_hasta) VALUES (?, 0, ?, ?) "
+            "ON CONFLICT(clave) DO UPDATE SET pausa_hasta = MAX(pausa_hasta, excluded.pausa_hasta)",
+            (clave, time.time(), hasta),
+        )
+
+
+def clave_limite(url, api_key):
+    return hashlib.sha256(f"{url}|{api_key}".encode()).hexdigest()[:16]
+
+def _segundos_retry_after(valor):
+    # Retry-After puede venir en segundos o como fecha HTTP
+    valor = valor.strip()
+    if valor.isdigit():
+        return float(valor)
+    try:
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def espera_reintento(intento, retry_after=None):
+    # Lo que pide Retry-After si Galaxy lo manda; si no, backoff exponencial
+    # con jitter completo
+    segundos = _segundos_retry_after(retry_after) if retry_after else None
+    if segundos is not None:
+        return min(segundos, settings.GALAXY_ESPERA_MAXIMA)
+    tope = min(settings.GALAXY_ESPERA_BASE * 2 ** intento, settings.GALAXY_ESPERA_MAXIMA)
+    return random.uniform(0, tope)
+
+
+_limitador = None
+_limitador_lock = threading.Lock()
+
+def obtener_limitador():
+    global _limitador
+    with _limitador_lock:
+        if _limitador is None:
+            _limitador = LimitadorGalaxy(
+                settings.GALAXY_LIMITE_DB,
+                por_segundo=settings.GALAXY_LIMITE_POR_SEGUNDO,
+                rafaga=settings.GALAXY_LIMITE_RAFAGA,
+                en_vuelo=settings.GALAXY_MAX_EN_VUELO,
+            )
+        return _limitador
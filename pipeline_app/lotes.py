@@ -0,0 +1,182 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db import transaction
+
+from .colecciones import crear_coleccion_pares
+from .eventos import registrar_evento
+from .models import PipelineBatch, PipelineRun
+
+# Nombres aceptados para cada columna de la hoja de muestras
+COLUMNAS = {
+    "muestra": ["sample", "muestra", "sample_id", "nombre", "name"],
+    "r1": ["r1", "read1", "fastq_1", "dataset_r1"],
+    "r2": ["r2", "read2", "fastq_2", "dataset_r2"],
+    "genoma": ["reference", "referencia", "genoma", "genome", "ref"],
+}
+
+
+class ErrorHojaMuestras(Exception):
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__("; ".join(errores))
+
+
+def _columnas(cabecera):
+    normalizada = {columna.strip().lower(): columna for columna in cabecera}
+    columnas = {}
+    faltantes = []
+    for campo, alias in COLUMNAS.items():
+        encontrada = next((normalizada[a] for a in alias if a in normalizada), None)
+        if encontrada is None:
+            faltantes.append(campo)
+        columnas[campo] = encontrada
+    if faltantes:
+        raise ErrorHojaMuestras([f"Faltan columnas: {', '.join(faltantes)}"])
+    return columnas
+
+def leer_hoja_muestras(contenido):
+    # CSV o TSV con una fila por muestra: [{"muestra", "r1", "r2", "genoma"}]
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode("utf-8-sig")
+    lineas = [linea for linea in contenido.splitlines() if linea.strip() and not linea.startswith("#")]
+    if not lineas:
+        raise ErrorHojaMuestras(["La hoja de muestras esta vacia"])
+
+    separador = "\t" if "\t" in lineas[0] else ","
+    lector = csv.DictReader(io.StringIO("\n".join(lineas)), delimiter=separador)
+    columnas = _columnas(lector.fieldnames)
+
+    filas = []
+    errores = []
+    for numero, fila in enumerate(lector, start=2):
+        valores = {campo: (fila.get(columna) or "").strip() for campo, columna in columnas.items()}
+        vacios = [campo for campo, valor in valores.items() if not valor]
+        if vacios:
+            errores.append(f"Linea {numero}: faltan {', '.join(vacios)}")
+            continue
+        filas.append(valores)
+
+    muestras = [fila["muestra"] for fila in filas]
+    repetidas = sorted({m for m in muestras if muestras.count(m) > 1})
+    if repetidas:
+        errores.append(f"Muestras repetidas: {', '.join(repetidas)}")
+    if errores:
+        raise ErrorHojaMuestras(errores)
+    return filas
+
+def resolver_datasets(filas, contenidos):
+    # Cada celda puede ser el id del dataset o su nombre en la historia
+    por_nombre = {}
+    for dataset in contenidos.datasets:
+        por_nombre.setdefault(dataset["name"], []).append(dataset["id"])
+
+    def resolver(valor):
+        if contenidos.buscar(valor):
+            return valor, None
+        ids = por_nombre.get(valor, [])
+        if len(ids) == 1:
+            return ids[0], None
+        if ids:
+            return None, f"'{valor}' coincide con {len(ids)} datasets"
+        return None, f"'{valor}' no esta en la historia"
+
+    resueltas = []
+    errores = []
+    for fila in filas:
+        inputs = {}
+        for campo, clave in (("r1", "dataset_r1"), ("r2", "dataset_r2"), ("genoma", "genoma")):
+            dataset_id, error = resolver(fila[campo])
+            if error:
+                errores.append(f"{fila['muestra']}: {error}")
+            inputs[clave] = dataset_id
+        resueltas.append((fila["muestra"], inputs))
+
+    if errores:
+        raise ErrorHojaMuestras(errores)
+    return resueltas
+
+def agrupar_en_colecciones(gi, muestras, history_id, nombre=""):
+    # Una list:paired por genoma de referencia: Bowtie2 mapea toda la
+    # coleccion contra un solo genoma. Devuelve [(muestra, inputs)] con una
+    # entrada por coleccion
+    por_genoma = {}
+    for muestra, inputs in muestras:
+        por_genoma.setdefault(inputs["genoma"], []).append(
+            (muestra, inputs["dataset_r1"], inputs["dataset_r2"])
+        )
+
+    agrupadas = []
+    for genoma, pares in por_genoma.items():
+        etiqueta = f"{nombre or 'lote'} ({len(pares)} muestras)"
+        agrupadas.append((etiqueta, {
+            "pares": crear_coleccion_pares(gi, history_id, pares, etiqueta),
+            "genoma": genoma,
+            "muestras": [muestra for muestra, _, _ in pares],
+        }))
+    return agrupadas
+
+def crear_lote(muestras, history_id, history_name="", nombre="", concurrencia=8, user=None,
+               colecciones=False, gi=None):
+    # Una ejecucion en cola por muestra; los workers las toman respetando la
+    # concurrencia del lote, asi las etapas de distintas muestras se solapan.
+    # Con colecciones hay una ejecucion por genoma y cada paso es un solo
+    # envio a Galaxy para todas sus muestras
+    if colecciones:
+        muestras = agrupar_en_colecciones(gi, muestras, history_id, nombre)
+
+    with transaction.atomic():
+        lote = PipelineBatch.objects.create(
+            user=user,
+            name=nombre,
+            history_id=history_id,
+            history_name=history_name,
+            concurrency=min(concurrencia, settings.PIPELINE_LOTE_MAX_CONCURRENCIA),
+        )
+        PipelineRun.objects.bulk_create([
+            PipelineRun(
+                user=user,
+                batch=lote,
+                sample=muestra,
+                history_id=history_id,
+                history_name=history_name,
+                inputs=inputs,
+            )
+            for muestra, inputs in muestras
+        ])
+
+    for run in PipelineRun.objects.filter(batch=lote):
+        registrar_evento(run.pk, "", PipelineRun.QUEUED)
+    return lote
+
+def resumen_lote(lote):
+    # Estado y ensamblaje ganador de cada muestra
+    muestras = []
+    conteo = {}
+    for run in lote.runs.order_by("id"):
+        seleccion = run.results.get("seleccion", {}) if run.state == PipelineRun.OK else {}
+        # Una ejecucion sobre una coleccion cubre varias muestras
+        por_muestra = seleccion.get("muestras") or {}
+        for muestra in run.inputs.get("muestras") or [run.sample]:
+            elegido = por_muestra.get(muestra, {}) if "muestras" in run.inputs else seleccion
+            conteo[run.state] = conteo.get(run.state, 0) + 1
+            muestras.append({
+                "run_id": run.pk,
+                "sample": muestra,
+                "state": run.state,
+                "error": run.error,
+                "winner": elegido.get("winner"),
+                "assembler": elegido.get("ensamblador"),
+                "N50": elegido.get("N50"),
+                "L50": elegido.get("L50"),
+            })
+    return {
+        "batch_id": lote.pk,
+        "name": lote.name,
+        "history_id": lote.history_id,
+        "concurrency": lote.concurrency,
+        "total": len(muestras),
+        "states": conteo,
+        "samples": muestras,
+    }
@@ -0,0 +1,193 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from pipeline_app.galaxy_falso import SALIDAS_HERRAMIENTAS, ServidorGalaxyFalso, generar_fasta, generar_fastq
+from pipeline_app.models import PipelineRun
+from pipeline_app.worker import bucle_worker
+
+PARTES = ("submit", "queue", "run", "poll_delay", "total")
+
+
+def _duracion_herramienta(valor):
+    # "shovill=5,30" -> ("shovill", (5.0, 30.0))
+    try:
+        nombre, tiempos = valor.split("=", 1)
+        cola, ejecucion = (float(t) for t in tiempos.split(","))
+    except ValueError:
+        raise CommandError(f"Duracion invalida: {valor} (se espera herramienta=cola,ejecucion)")
+    return nombre, (cola, ejecucion)
+
+
+class Command(BaseCommand):
+    help = (
+        "Corre el pipeline de punta a punta contra un Galaxy falso local e informa "
+        "tiempo total, llamadas a la API y tiempo ocioso de cada paso"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--muestras", type=int, default=3, help="Ejecuciones a lanzar")
+        parser.add_argument("--cola", type=float, default=1.0, help="Segundos de cada job en cola")
+        parser.add_argument("--duracion", type=float, default=2.0, help="Segundos de ejecucion de cada job")
+        parser.add_argument("--herramienta", action="append", default=[], type=_duracion_herramienta,
+                            help="Duracion de una herramienta: nombre=cola,ejecucion (repetible)")
+        parser.add_argument("--demora", type=float, default=0.0, help="Latencia agregada a cada peticion")
+        parser.add_argument("--hilos", type=int, default=4, help="Ejecuciones a la vez en el worker")
+        parser.add_argument("--json", action="store_true", help="Informe en JSON")
+        parser.add_argument("--max-ocioso", type=float, default=None,
+                            help="Falla si el tiempo ocioso medio de algun paso supera estos segundos")
+        parser.add_argument("--conservar", action="store_true", help="No borra las ejecuciones creadas")
+
+    def handle(self, *args, **options):
+        # El worker toma cualquier ejecucion en cola: no mezclar con las reales
+        if PipelineRun.objects.filter(state__in=[PipelineRun.QUEUED, PipelineRun.RUNNING]).exists():
+            raise CommandError("Hay ejecuciones en cola o corriendo; el benchmark necesita la cola vacia")
+
+        duraciones = {nombre: (options["cola"], options["duracion"]) for nombre in SALIDAS_HERRAMIENTAS}
+        duraciones.update(dict(options["herramienta"]))
+
+        directorio = tempfile.mkdtemp(prefix="benchmark_pipeline_")
+        with ServidorGalaxyFalso(duraciones, demora=options["demora"]) as servidor, override_settings(
+            GALAXY_URL=servidor.url,
+            GALAXY_API_KEY="benchmark",
+            PIPELINE_MODO="dag",
+            # Sin memo: cada ejecucion envia todos sus jobs
+            PIPELINE_MEMO=False,
+            # Limitador y metricas propios para no tocar los de produccion
+            GALAXY_LIMITE_DB=os.path.join(directorio, "limites.sqlite3"),
+            PIPELINE_METRICAS_DB=os.path.join(directorio, "metricas.sqlite3"),
+            ALLOWED_HOSTS=["testserver"],
+        ):
+            informe = self.correr(servidor, options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(informe, indent=2))
+        else:
+            self.imprimir(informe)
+
+        if options["max_ocioso"] is not None:
+            excedidos = {
+                paso: tiempos["idle"] for paso, tiempos in informe["steps"].items()
+                if tiempos["idle"] is not None and tiempos["idle"] > options["max_ocioso"]
+            }
+            if excedidos:
+                raise CommandError(f"Tiempo ocioso por encima de {options['max_ocioso']}s: {excedidos}")
+        if informe["states"].get(PipelineRun.OK, 0) != options["muestras"]:
+            raise CommandError(f"No todas las ejecuciones terminaron bien: {informe['states']}")
+
+    def sembrar(self, servidor, muestras):
+        # Historia con un par de lecturas por muestra y un genoma, creada
+        # directamente en el estado para no contar esas llamadas
+        estado = servidor.estado
+        historia = estado.crear_historia("benchmark")
+        genoma = estado.crear_dataset(historia["id"], "genoma.fasta", generar_fasta(0), "fasta")
+        pares = [
+            (
+                estado.crear_dataset(historia["id"], f"m{i}_R1.fastq", generar_fastq(2 * i), "fastqsanger"),
+                estado.crear_dataset(historia["id"], f"m{i}_R2.fastq", generar_fastq(2 * i + 1), "fastqsanger"),
+            )
+            for i in range(muestras)
+        ]
+        return historia, genoma, pares
+
+    def correr(self, servidor, options):
+        historia, genoma, pares = self.sembrar(servidor, options["muestras"])
+        cliente = Client()
+        vistas = {}
+
+        def medir(nombre, metodo, url, **datos):
+            inicio = time.perf_counter()
+            respuesta = getattr(cliente, metodo)(url, datos)
+            vistas.setdefault(nombre, []).append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                raise CommandError(f"{nombre} respondio {respuesta.status_code}")
+            return respuesta
+
+        inicio = time.perf_counter()
+        runs = []
+        for r1, r2 in pares:
+            respuesta = medir("ejecutar_workflow", "post", reverse("ejecutar_workflow"),
+                              nombre_historia=historia["name"], id_dataset=r1, id_dataset2=r2, id_genoma=genoma)
+            if respuesta.status_code != 302:
+                raise CommandError("ejecutar_workflow no encolo la ejecucion")
+            runs.append(int(respuesta["Location"].rstrip("/").split("/")[-1]))
+
+        bucle_worker(una_vez=True, hilos=options["hilos"])
+        wall = time.perf_counter() - inicio
+
+        # Vistas JSON sobre la historia ya llena
+        detalles = [
+            medir("estado_ejecucion_json", "get", reverse("estado_ejecucion_json", args=[run_id])).json()
+            for run_id in runs
+        ]
+        medir("listar_historias", "get", reverse("listar_historias"))
+        medir("get_jobs_history", "get", reverse("get_jobs_history", args=[historia["id"]]))
+        medir("show_dataset", "get", reverse("show_dataset", args=[genoma]))
+
+        pasos = {}
+        for detalle in detalles:
+            for paso in detalle["steps"]:
+                tiempos = pasos.setdefault(paso["name"], {parte: [] for parte in PARTES + ("idle",)})
+                timing = paso["timing"]
+                for parte in PARTES:
+                    if timing[parte] is not None:
+                        tiempos[parte].append(timing[parte])
+                # Ocioso: lo que no es cola ni ejecucion en Galaxy, es decir el
+                # envio y la demora del poller
+                if None not in (timing["submit"], timing["poll_delay"]):
+                    tiempos["idle"].append(timing["submit"] + timing["poll_delay"])
+
+        estados = {}
+        for detalle in detalles:
+            estados[detalle["state"]] = estados.get(detalle["state"], 0) + 1
+
+        if not options["conservar"]:
+            PipelineRun.objects.filter(pk__in=runs).delete()
+
+        llamadas = servidor.llamadas()
+        return {
+            "runs": len(runs),
+            "states": estados,
+            "wall_seconds": round(wall, 3),
+            "api_calls_total": sum(llamadas.values()),
+            "api_calls": dict(sorted(llamadas.items(), key=lambda item: -item[1])),
+            "views": {
+                nombre: {"count": len(tiempos), "mean": round(statistics.mean(tiempos), 4), "max": round(max(tiempos), 4)}
+                for nombre, tiempos in vistas.items()
+            },
+            "steps": {
+                nombre: {
+                    parte: round(statistics.mean(valores), 3) if valores else None
+                    for parte, valores in tiempos.items()
+                }
+                for nombre, tiempos in pasos.items()
+            },
+        }
+
+    def imprimir(self, informe):
+        self.stdout.write(
+            f"{informe['runs']} ejecuciones en {informe['wall_seconds']}s, estados: {informe['states']}"
+        )
+        self.stdout.write(f"\nLlamadas a la API: {informe['api_calls_total']}")
+        for ruta, cantidad in informe["api_calls"].items():
+            self.stdout.write(f"  {cantidad:6d}  {ruta}")
+
+        self.stdout.write("\nVistas (segundos):")
+        for nombre, tiempos in informe["views"].items():
+            self.stdout.write(f"  {nombre:24s} n={tiempos['count']:<4d} media={tiempos['mean']:.4f} max={tiempos['max']:.4f}")
+
+        self.stdout.write("\nPasos (segundos, media por ejecucion):")
+        columnas = PARTES + ("idle",)
+        self.stdout.write("  {:24s}".format("paso") + "".join(f"{c:>12s}" for c in columnas))
+        for nombre, tiempos in informe["steps"].items():
+            valores = "".join(
+                f"{tiempos[c]:12.3f}" if tiempos[c] is not None else f"{'-':>12s}" for c in columnas
+            )
+            self.stdout.write(f"  {nombre:24s}{valores}")
@@ -0,0 +1,45 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pipeline_app.worker import bucle_worker
+
+
+class Command(BaseCommand):
+    help = "Inicia un pool de procesos que ejecutan los pipelines en cola"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int, default=settings.PIPELINE_WORKERS)
+        parser.add_argument("--hilos", type=int, default=settings.PIPELINE_HILOS_POR_WORKER,
+                            help="Ejecuciones que lleva a la vez cada proceso")
+        parser.add_argument("--una-vez", action="store_true", help="Termina cuando no quedan ejecuciones en cola")
+
+    def handle(self, *args, **options):
+        procesos = options["procesos"]
+        hilos = options["hilos"]
+        una_vez = options["una_vez"]
+
+        if procesos <= 1:
+            bucle_worker(una_vez=una_vez, hilos=hilos)
+            return
+
+        # Cada proceso abre su propia conexion a la base de datos
+        connections.close_all()
+
+        hijos = [
+            multiprocessing.Process(target=bucle_worker, kwargs={"una_vez": una_vez, "hilos": hilos})
+            for _ in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+
+        self.stdout.write(f"{procesos} workers iniciados con {hilos} hilos cada uno")
+
+        try:
+            for hijo in hijos:
+                hijo.join()
+        except KeyboardInterrupt:
+            for hijo in hijos:
+                hijo.terminate()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from pipeline_app.galaxy_client import obtener_cliente
+from pipeline_app.memo import MemoHerramientas
+from user_app.models import GalaxyProfile
+
+
+class Command(BaseCommand):
+    help = "Borra los resultados memorizados cuyas salidas se borraron o purgaron en Galaxy"
+
+    def handle(self, *args, **options):
+        # Cada usuario solo puede consultar sus propios datasets: se poda con
+        # la API key de settings y con la de cada perfil
+        claves = {None} | set(
+            GalaxyProfile.objects.exclude(galaxy_api_key__isnull=True).exclude(galaxy_api_key="")
+            .values_list("galaxy_api_key", flat=True)
+        )
+        borradas = sum(MemoHerramientas(obtener_cliente(api_key=clave)).podar() for clave in claves)
+        self.stdout.write(f"{borradas} entradas borradas")
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+
+from bioblend import ConnectionError
+from django.core.cache import cache
+from django.db.models import F
+
+from .cache import huella_usuario
+from .models import ToolRunCache
+
+log = logging.getLogger(__name__)
+
+# Preferencia entre los hashes que Galaxy puede tener calculados
+FUNCIONES_HASH = ["SHA-256", "SHA-512", "SHA-1", "MD5"]
+
+
+def version_herramienta(gi, tool_id):
+    # Las herramientas del toolshed llevan la version al final del id
+    if "/repos/" in tool_id:
+        return tool_id.rsplit("/", 1)[1]
+
+    clave = f"version_herramienta:{gi.base_url}:{tool_id}"
+    version = cache.get(clave)
+    if version is None:
+        version = gi.tools.show_tool(tool_id).get("version", "")
+        cache.set(clave, version, 60 * 60)
+    return version
+
+def huella_dataset(gi, dataset_id):
+    # Identifica el contenido del dataset: un hash calculado por Galaxy si lo
+    # tiene, si no el uuid del dataset (compartido por sus copias)
+    clave = f"huella_dataset:{gi.base_url}:{dataset_id}"
+    huella = cache.get(clave)
+    if huella is not None:
+        return huella
+
+    dataset = gi.datasets.show_dataset(dataset_id)
+    hashes = {h["hash_function"]: h["hash_value"] for h in dataset.get("hashes") or []}
+    funcion = next((f for f in FUNCIONES_HASH if f in hashes), None)
+    if funcion:
+        huella = f"{funcion}:{hashes[funcion]}"
+    elif dataset.get("uuid"):
+        huella = f"uuid:{dataset['uuid']}"
+    else:
+        raise ValueError(f"El dataset {dataset_id} no tiene hash ni uuid")
+
+    # El contenido de un dataset terminado no cambia
+    if dataset.get("state") == "ok":
+        cache.set(clave, huella, None)
+    return huella
+
+def huella_coleccion(gi, hdca_id):
+    # Estructura de la coleccion con la huella de cada elemento: dos
+    # colecciones con los mismos datos y nombres firman igual
+    def elementos(coleccion):
+        huellas = []
+        for elemento in coleccion.get("elements", []):
+            objeto = elemento["object"]
+            if "elements" in objeto:
+                contenido = elementos(objeto)
+            else:
+                contenido = huella_dataset(gi, objeto["id"])
+            huellas.append([elemento["element_identifier"], contenido])
+        return huellas
+
+    coleccion = gi.dataset_collections.show_dataset_collection(hdca_id)
+    return {"tipo": coleccion.get("collection_type"), "elementos": elementos(coleccion)}
+
+def normalizar_inputs(gi, valor):
+    # Reemplaza cada referencia a un dataset o coleccion por la huella de su contenido
+    if isinstance(valor, dict):
+        if valor.get("src") in ("hda", "ldda") and "id" in valor:
+            return {"dataset": huella_dataset(gi, valor["id"])}
+        if valor.get("src") == "hdca" and "id" in valor:
+            extra = {clave: v for clave, v in valor.items() if clave not in ("src", "id")}
+            return {"coleccion": huella_coleccion(gi, valor["id"]), **extra}
+        return {clave: normalizar_inputs(gi, v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [normalizar_inputs(gi, v) for v in valor]
+    return valor
+
+
+class MemoHerramientas:
+    # Reutiliza las salidas de un job anterior cuando la misma herramienta ya
+    # corrio con las mismas entradas, en cualquier historia del usuario
+
+    def __init__(self, gi):
+        self.gi = gi
+        self.owner = huella_usuario(gi)
+
+    def firmar(self, tool_id, tool_inputs):
+        version = version_herramienta(self.gi, tool_id)
+        # Sin la version, que ya va aparte
+        herramienta = tool_id.rsplit("/", 1)[0] if "/repos/" in tool_id else tool_id
+        inputs = normalizar_inputs(self.gi, tool_inputs)
+        contenido = json.dumps(
+            {"owner": self.owner, "tool": herramienta, "version": version, "inputs": inputs},
+            sort_keys=True,
+        )
+        return {
+            "key": hashlib.sha256(contenido.encode()).hexdigest(),
+            "tool_id": tool_id,
+            "tool_version": version,
+            "inputs": inputs,
+        }
+
+    def dataset_vigente(self, dataset_id):
+        dataset = self.gi.datasets.show_dataset(dataset_id)
+        return not (dataset.get("deleted") or dataset.get("purged") or dataset.get("state") != "ok")
+
+    def salida_vigente(self, salida):
+        if salida.get("src") != "hdca":
+            return self.dataset_vigente(salida["id"])
+
+        coleccion = self.gi.dataset_collections.show_dataset_collection(salida["id"])
+        if coleccion.get("deleted") or coleccion.get("populated_state", "ok") != "ok":
+            return False
+
+        # Los elementos de una list:paired son colecciones anidadas
+        pendientes = list(coleccion.get("elements", []))
+        while pendientes:
+            objeto = pendientes.pop()["object"]
+            if "elements" in objeto:
+                pendientes.extend(objeto["elements"])
+            elif not self.dataset_vigente(objeto["id"]):
+                return False
+        return True
+
+    def salidas_vigentes(self, entrada):
+        # False si alguna salida (dataset o coleccion) se borro o purgo en Galaxy
+        for salida in entrada.outputs.values():
+            try:
+                if not self.salida_vigente(salida):
+                    return False
+            except ConnectionError as e:
+                if e.status_code in (400, 403, 404):
+                    return False
+                raise
+        return True
+
+    def buscar(self, firma):
+        entrada = ToolRunCache.objects.filter(key=firma["key"]).first()
+        if entrada is None:
+            return None
+
+        if not self.salidas_vigentes(entrada):
+            log.info("Descartando resultado memorizado de %s: sus salidas ya no existen", entrada.tool_id)
+            entrada.delete()
+            return None
+
+        ToolRunCache.objects.filter(pk=entrada.pk).update(hits=F("hits") + 1)
+        return entrada
+
+    def guardar(self, firma, job_id, outputs):
+        ToolRunCache.objects.update_or_create(
+            key=firma["key"],
+            defaults={
+                "owner": self.owner,
+                "tool_id": firma["tool_id"],
+                "tool_version": firma["tool_version"],
+                "inputs": firma["inputs"],
+                "job_id": job_id,
+                "outputs": outputs,
+            },
+        )
+
+    def podar(self):
+        # Borra las entradas del usuario cuyas salidas se purgaron
+        borradas = 0
+        for entrada in ToolRunCache.objects.filter(owner=self.owner).iterator():
+            if not self.salidas_vigentes(entrada):
+                entrada.delete()
+                borradas += 1
+        return borradas
@@ -0,0 +1,196 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+# Limites de las cubetas de los histogramas (segundos): desde una llamada a
+# la API hasta un job que espera horas en la cola de Galaxy
+CUBETAS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+
+# nombre -> (tipo, ayuda)
+METRICAS = {
+    "galaxy_api_request_duration_seconds": ("histogram", "Duracion de cada llamada a la API de Galaxy"),
+    "galaxy_api_limiter_wait_seconds": ("histogram", "Espera en el limitador antes de cada llamada"),
+    "galaxy_api_retries_total": ("counter", "Llamadas reintentadas por 429, 5xx o error de conexion"),
+    "galaxy_upload_duration_seconds": ("histogram", "Duracion de cada subida tus a Galaxy"),
+    "galaxy_upload_bytes_total": ("counter", "Bytes subidos a Galaxy"),
+    "pipeline_step_submit_seconds": ("histogram", "Desde el envio hasta que Galaxy crea el job"),
+    "pipeline_step_queue_seconds": ("histogram", "Tiempo del job en la cola de Galaxy"),
+    "pipeline_step_run_seconds": ("histogram", "Tiempo de ejecucion de la herramienta"),
+    "pipeline_step_poll_delay_seconds": ("histogram", "Desde que el job termina hasta que el poller lo ve"),
+    "pipeline_step_total_seconds": ("histogram", "Desde el envio hasta ver el job terminado"),
+}
+
+# Ids en las rutas de la API: codificados de Galaxy (16 hex), sesiones tus
+# (32 hex), UUIDs y numeros. Cada id distinto seria una serie nueva
+PATRON_ID = re.compile(
+    r"/(?:[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|\d+)(?=/|$)"
+)
+
+
+class RegistroMetricas:
+    # Histogramas y contadores de todos los procesos (web y workers). Cada
+    # proceso acumula en memoria y vuelca a un archivo SQLite compartido cada
+    # pocos segundos; /metrics lee el archivo.
+
+    def __init__(self, ruta, intervalo):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        # (nombre, etiquetas) -> {cubeta: valor}
+        self._pendiente = {}
+        self._ultimo_volcado = time.monotonic()
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS metricas ("
+                "nombre TEXT, etiquetas TEXT, cubeta TEXT, valor REAL, "
+                "PRIMARY KEY (nombre, etiquetas, cubeta))"
+            )
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def _sumar(self, nombre, etiquetas, cubetas):
+        clave = (nombre, json.dumps(etiquetas, sort_keys=True))
+        with self._lock:
+            acumulado = self._pendiente.setdefault(clave, {})
+            for cubeta, valor in cubetas.items():
+                acumulado[cubeta] = acumulado.get(cubeta, 0) + valor
+            vencido = time.monotonic() - self._ultimo_volcado > self.intervalo
+        if vencido:
+            self.volcar()
+
+    def observar(self, nombre, valor, **etiquetas):
+        # La cubeta guarda solo lo que cae en ella; la exposicion acumula
+        valor = max(valor, 0)
+        cubeta = next((str(limite) for limite in CUBETAS if valor <= limite), "+Inf")
+        self._sumar(nombre, etiquetas, {cubeta: 1, "sum": valor, "count": 1})
+
+    def contar(self, nombre, cantidad=1, **etiquetas):
+        self._sumar(nombre, etiquetas, {"count": cantidad})
+
+    def volcar(self):
+        with self._lock:
+            pendiente, self._pendiente = self._pendiente, {}
+            self._ultimo_volcado = time.monotonic()
+        if not pendiente:
+            return
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.executemany(
+                "INSERT INTO metricas (nombre, etiquetas, cubeta, valor) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(nombre, etiquetas, cubeta) DO UPDATE SET valor = valor + excluded.valor",
+                [
+                    (nombre, etiquetas, cubeta, valor)
+                    for (nombre, etiquetas), cubetas in pendiente.items()
+                    for cubeta, valor in cubetas.items()
+                ],
+            )
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+
+    def leer(self):
+        # {nombre: {etiquetas: {cubeta: valor}}}
+        self.volcar()
+        series = {}
+        for nombre, etiquetas, cubeta, valor in self._conexion().execute(
+            "SELECT nombre, etiquetas, cubeta, valor FROM metricas"
+        ):
+            series.setdefault(nombre, {}).setdefault(etiquetas, {})[cubeta] = valor
+        return series
+
+
+def _etiquetas(etiquetas, **extra):
+    todas = {**json.loads(etiquetas), **extra} if isinstance(etiquetas, str) else {**etiquetas, **extra}
+    if not todas:
+        return ""
+    pares = ",".join(
+        '{}="{}"'.format(clave, str(valor).replace("\\", "\\\\").replace('"', '\\"'))
+        for clave, valor in sorted(todas.items())
+    )
+    return "{" + pares + "}"
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+def exposicion(series, medidores=()):
+    # Formato de texto de Prometheus. medidores: [(nombre, ayuda, [(etiquetas, valor)])]
+    lineas = []
+    for nombre, (tipo, ayuda) in METRICAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        for etiquetas, cubetas in sorted(series.get(nombre, {}).items()):
+            if tipo == "counter":
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(cubetas.get('count', 0))}")
+                continue
+            acumulado = 0
+            for limite in [*map(str, CUBETAS), "+Inf"]:
+                acumulado += cubetas.get(limite, 0)
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le=limite)} {_numero(acumulado)}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(cubetas.get('sum', 0))}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {_numero(cubetas.get('count', 0))}")
+
+    for nombre, ayuda, valores in medidores:
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+        lineas += [f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}" for etiquetas, valor in valores]
+    return "\n".join(lineas) + "\n"
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+def obtener_registro():
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroMetricas(settings.PIPELINE_METRICAS_DB, settings.PIPELINE_METRICAS_VOLCADO)
+            # Lo acumulado desde el ultimo volcado no se pierde al salir
+            atexit.register(_registro.volcar)
+        return _registro
+
+def ruta_api(url):
+    # /api/jobs/f2db41e1fa331b3e/outputs -> /api/jobs/{id}/outputs
+    return PATRON_ID.sub("/{id}", urlsplit(url).path)
+
+# Tiempos de un paso
+
+def _segundos(desde, hasta):
+    if not (desde and hasta):
+        return None
+    if isinstance(desde, str):
+        desde = datetime.fromisoformat(desde)
+    if isinstance(hasta, str):
+        hasta = datetime.fromisoformat(hasta)
+    return max((hasta - desde).total_seconds(), 0)
+
+def desglose_tiempos(enviado, tiempos):
+    # Donde se fue el tiempo de un paso. submit y poll_delay mezclan el reloj
+    # de Galaxy con el local
+    return {
+        "submit": _segundos(enviado, tiempos.get("galaxy_created_at")),
+        "queue": _segundos(tiempos.get("galaxy_created_at"), tiempos.get("galaxy_started_at")),
+        "run": _segundos(tiempos.get("galaxy_started_at"), tiempos.get("galaxy_finished_at")),
+        "poll_delay": _segundos(tiempos.get("galaxy_finished_at"), tiempos.get("observed_at")),
+        "total": _segundos(enviado, tiempos.get("observed_at")),
+    }
+
+def observar_paso(paso, enviado, tiempos):
+    registro = obtener_registro()
+    for parte, segundos in desglose_tiempos(enviado, tiempos).items():
+        if segundos is not None:
+            registro.observar(f"pipeline_step_{parte}_seconds", segundos, step=paso)
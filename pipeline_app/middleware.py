@@ -0,0 +1,46 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .trazas import iniciar_traza, terminar_traza
+
+
+class TrazaGalaxyMiddleware:
+    # Registra las llamadas a Galaxy que hace cada vista, las resume en la
+    # cabecera Server-Timing y avisa en el log de las lentas y repetidas.
+    # Funciona en WSGI y en ASGI: bajo ASGI no obliga a Django a correr toda
+    # la pila en un hilo (las vistas async, como los eventos SSE, siguen async)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        inicio = time.monotonic()
+        traza, token = iniciar_traza()
+        try:
+            response = self.get_response(request)
+        finally:
+            terminar_traza(token)
+        return self._terminar(request, response, traza, inicio)
+
+    async def __acall__(self, request):
+        inicio = time.monotonic()
+        traza, token = iniciar_traza()
+        try:
+            response = await self.get_response(request)
+        finally:
+            terminar_traza(token)
+        return self._terminar(request, response, traza, inicio)
+
+    def _terminar(self, request, response, traza, inicio):
+        total = time.monotonic() - inicio
+        response["Server-Timing"] = traza.server_timing(total)
+        traza.informar(request.path, total)
+        return response
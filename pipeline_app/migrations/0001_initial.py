@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('history_id', models.CharField(max_length=64)),
+                ('history_name', models.CharField(blank=True, max_length=255)),
+                ('inputs', models.JSONField(default=dict)),
+                ('state', models.CharField(choices=[('queued', 'En cola'), ('running', 'Ejecutando'), ('ok', 'Terminado'), ('error', 'Error')], db_index=True, default='queued', max_length=16)),
+                ('results', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('worker_id', models.CharField(blank=True, max_length=128)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PipelineStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('state', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Ejecutando'), ('ok', 'Terminado'), ('error', 'Error')], default='pending', max_length=16)),
+                ('job_id', models.CharField(blank=True, max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='pipeline_app.pipelinerun')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('run', 'name')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pipelinestep',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('queued', 'En cola en Galaxy'), ('running', 'Ejecutando'), ('ok', 'Terminado'), ('error', 'Error')], default='pending', max_length=16),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0002_step_queued_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToolRunCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('owner', models.CharField(db_index=True, max_length=16)),
+                ('tool_id', models.CharField(max_length=255)),
+                ('tool_version', models.CharField(max_length=64)),
+                ('inputs', models.JSONField(default=dict)),
+                ('job_id', models.CharField(max_length=64)),
+                ('outputs', models.JSONField(default=dict)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-last_used_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+    ]
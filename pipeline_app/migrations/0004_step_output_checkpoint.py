@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0003_tool_run_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='output',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
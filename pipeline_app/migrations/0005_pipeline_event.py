@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0004_step_output_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(blank=True, max_length=64)),
+                ('state', models.CharField(max_length=16)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='pipeline_app.pipelinerun')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0005_pipeline_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='invocation_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
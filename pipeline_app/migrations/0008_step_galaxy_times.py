@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline_app', '0007_pipeline_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='galaxy_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='galaxy_finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='galaxy_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinestep',
+            name='observed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
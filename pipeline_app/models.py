@@ -0,0 +1,143 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class PipelineBatch(models.Model):
+    # Lote de ejecuciones creado desde una hoja de muestras, una por fila
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    history_id = models.CharField(max_length=64)
+    history_name = models.CharField(max_length=255, blank=True)
+    # Ejecuciones del lote que pueden correr a la vez
+    concurrency = models.PositiveIntegerField(default=8)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.pk} - {self.name or self.history_name}"
+
+
+class PipelineRun(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    OK = "ok"
+    ERROR = "error"
+    STATES = [
+        (QUEUED, "En cola"),
+        (RUNNING, "Ejecutando"),
+        (OK, "Terminado"),
+        (ERROR, "Error"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    batch = models.ForeignKey(PipelineBatch, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name="runs")
+    # Nombre de la muestra cuando la ejecucion es parte de un lote
+    sample = models.CharField(max_length=255, blank=True)
+    history_id = models.CharField(max_length=64)
+    history_name = models.CharField(max_length=255, blank=True)
+    # Datasets de entrada: {"dataset_r1": ..., "dataset_r2": ..., "genoma": ...}
+    inputs = models.JSONField(default=dict)
+    state = models.CharField(max_length=16, choices=STATES, default=QUEUED, db_index=True)
+    results = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    # Invocacion del workflow de Galaxy cuando PIPELINE_MODO = "workflow"
+    invocation_id = models.CharField(max_length=64, blank=True)
+
+    # Lease del worker que tiene reclamada la ejecucion
+    worker_id = models.CharField(max_length=128, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.pk} - {self.history_name} ({self.state})"
+
+
+class PipelineStep(models.Model):
+    PENDING = "pending"
+    QUEUED = "queued"
+    RUNNING = "running"
+    OK = "ok"
+    ERROR = "error"
+    STATES = [
+        (PENDING, "Pendiente"),
+        (QUEUED, "En cola en Galaxy"),
+        (RUNNING, "Ejecutando"),
+        (OK, "Terminado"),
+        (ERROR, "Error"),
+    ]
+
+    run = models.ForeignKey(PipelineRun, on_delete=models.CASCADE, related_name="steps")
+    name = models.CharField(max_length=64)
+    state = models.CharField(max_length=16, choices=STATES, default=PENDING)
+    job_id = models.CharField(max_length=64, blank=True)
+    # El resultado se tomo de ToolRunCache en lugar de enviar un job
+    cached = models.BooleanField(default=False)
+    # Checkpoint: salida del paso en el contexto del DAG, para reanudar la ejecucion
+    output = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Envio a Galaxy y fin del paso, segun el reloj local
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # create_time y update_time del job en Galaxy y cuando el poller lo vio
+    # terminado: separan cola, ejecucion y demora de la consulta
+    galaxy_created_at = models.DateTimeField(null=True, blank=True)
+    galaxy_started_at = models.DateTimeField(null=True, blank=True)
+    galaxy_finished_at = models.DateTimeField(null=True, blank=True)
+    observed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        unique_together = [("run", "name")]
+
+    def __str__(self):
+        return f"{self.run_id} - {self.name} ({self.state})"
+
+
+class PipelineEvent(models.Model):
+    # Transicion de estado de una ejecucion (step vacio) o de uno de sus pasos.
+    # Los workers las escriben y el difusor SSE las lee en orden de id.
+    run = models.ForeignKey(PipelineRun, on_delete=models.CASCADE, related_name="events")
+    step = models.CharField(max_length=64, blank=True)
+    state = models.CharField(max_length=16)
+    # job_id, error, tiempos, ...
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.run_id} - {self.step or 'run'} ({self.state})"
+
+
+class ToolRunCache(models.Model):
+    # Resultado de una herramienta de Galaxy direccionado por contenido:
+    # key = sha256(tool, version, inputs normalizados con el hash de cada dataset)
+    key = models.CharField(max_length=64, unique=True)
+    # Huella de servidor + API key; los datasets solo son visibles para su usuario
+    owner = models.CharField(max_length=16, db_index=True)
+    tool_id = models.CharField(max_length=255)
+    tool_version = models.CharField(max_length=64)
+    inputs = models.JSONField(default=dict)
+    job_id = models.CharField(max_length=64)
+    # {nombre de salida: {"id": ..., "src": "hda", ...}} tal como lo da show_job
+    outputs = models.JSONField(default=dict)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-last_used_at"]
+
+    def __str__(self):
+        return f"{self.tool_id} ({self.job_id})"
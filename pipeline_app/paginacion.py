@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def leer_pagina(request):
+    # limit y offset de la query string, acotados
+    try:
+        limite = int(request.GET.get("limit", settings.GALAXY_PAGINA_DEFECTO))
+        offset = int(request.GET.get("offset", 0))
+    except ValueError:
+        raise ParametroInvalido("limit y offset deben ser numeros enteros")
+    if limite < 1 or offset < 0:
+        raise ParametroInvalido("limit debe ser mayor que 0 y offset no puede ser negativo")
+    return min(limite, settings.GALAXY_PAGINA_MAXIMA), offset
+
+def etag_items(items, campos=("id", "update_time")):
+    # Huella de la pagina a partir de lo que cambia en cada item, sin
+    # serializarla entera
+    huella = hashlib.sha256()
+    for item in items:
+        huella.update(json.dumps([item.get(campo) for campo in campos], default=str).encode())
+    return quote_etag(huella.hexdigest()[:32])
+
+def _enlace_siguiente(request, limite, offset):
+    query = request.GET.copy()
+    query["limit"] = limite
+    query["offset"] = offset + limite
+    return f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"'
+
+def _serializar(items):
+    # Un item por vez: no se arma la respuesta completa en memoria
+    yield "["
+    for indice, item in enumerate(items):
+        if indice:
+            yield ","
+        yield json.dumps(item, cls=DjangoJSONEncoder)
+    yield "]"
+
+def respuesta_paginada(request, items, limite, offset, etag):
+    # Lista JSON en streaming. Sigue siendo un array (como antes); la
+    # siguiente pagina va en la cabecera Link. Con If-None-Match y la pagina
+    # sin cambios responde 304
+    no_modificada = get_conditional_response(request, etag=etag)
+    if no_modificada is not None:
+        no_modificada["ETag"] = etag
+        return no_modificada
+
+    response = StreamingHttpResponse(_serializar(items), content_type="application/json")
+    response["ETag"] = etag
+    # Cada cliente revalida antes de usar su copia
+    response["Cache-Control"] = "private, no-cache"
+    if len(items) == limite:
+        response["Link"] = _enlace_siguiente(request, limite, offset)
+    return response
@@ -0,0 +1,46 @@
+import re
+
+# Convenciones de nombre de lecturas pareadas, por ejemplo:
+#   muestra_S1_L001_R1_001.fastq.gz  (Illumina)
+#   muestra_R1.fastq / muestra.R1.fq
+#   muestra_1.fastq.gz
+PATRON_LECTURA = re.compile(
+    r"^(?P<muestra>.+?)(?P<sep>[._-])(?P<r>R?)(?P<lectura>[12])"
+    r"(?P<resto>(?:[._-]\d{3})?(?:\.[A-Za-z0-9]+)*)$",
+    re.IGNORECASE,
+)
+
+
+def clave_lectura(nombre):
+    # (clave de la pareja, 1 o 2) o None si el nombre no sigue la convencion
+    m = PATRON_LECTURA.match(nombre)
+    if not m:
+        return None
+    # R1 y R2 solo se emparejan entre si si coincide todo salvo el numero
+    clave = (m["muestra"], m["sep"], m["r"].upper(), m["resto"].lower())
+    return clave, int(m["lectura"])
+
+def emparejar_lecturas(datasets):
+    # datasets: diccionarios con al menos "name". Devuelve (pares, sueltos),
+    # donde cada par es {"muestra", "r1", "r2"} en el orden de entrada.
+    grupos = {}
+    sueltos = []
+    for dataset in datasets:
+        clave = clave_lectura(dataset["name"])
+        if clave is None:
+            sueltos.append(dataset)
+            continue
+        grupo = grupos.setdefault(clave[0], {})
+        if clave[1] in grupo:
+            # Nombre repetido: el primero queda en el par
+            sueltos.append(dataset)
+        else:
+            grupo[clave[1]] = dataset
+
+    pares = []
+    for (muestra, *_), grupo in grupos.items():
+        if 1 in grupo and 2 in grupo:
+            pares.append({"muestra": muestra, "r1": grupo[1], "r2": grupo[2]})
+        else:
+            sueltos.extend(grupo.values())
+    return pares, sueltos
@@ -0,0 +1,534 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .colecciones import (
+    crear_coleccion_lista,
+    elementos_coleccion,
+    es_coleccion,
+    referencia,
+    referencia_pares,
+)
+from .dag import EjecutorDag, Paso, PasoFallido
+from .ensamblajes import estadisticas_dataset
+from .eventos import registrar_evento
+from .galaxy_client import obtener_cliente_usuario
+from .memo import MemoHerramientas
+from .metricas import desglose_tiempos, observar_paso
+from .models import PipelineRun, PipelineStep
+from .poller import obtener_poller
+from .quast import metricas_reporte
+from .workflow import InvocacionPipeline, pasos_workflow
+
+log = logging.getLogger(__name__)
+
+TOOL_FASTQC = "toolshed.g2.bx.psu.edu/repos/devteam/fastqc/fastqc/0.72"
+TOOL_BOWTIE = "toolshed.g2.bx.psu.edu/repos/devteam/bowtie2/bowtie2/2.5.3+galaxy0"
+TOOL_TRIMMOMATIC = "toolshed.g2.bx.psu.edu/repos/pjbriggs/trimmomatic/trimmomatic/0.39+galaxy2"
+TOOL_SHOVILL = "toolshed.g2.bx.psu.edu/repos/iuc/shovill/shovill/1.1.0+galaxy2"
+TOOL_QUAST = "toolshed.g2.bx.psu.edu/repos/iuc/quast/quast/5.3.0+galaxy1"
+TOOL_AUGUSTUS = "toolshed.g2.bx.psu.edu/repos/bgruening/augustus/augustus/3.5.0+galaxy0"
+
+# Nombres de los pasos tal como se muestran en los mensajes de error
+ETIQUETAS_PASOS = {
+    "fastqc_inicial": "FastQC inicial",
+    "fastqc_inicial_r1": "FastQC inicial",
+    "fastqc_inicial_r2": "FastQC inicial",
+    "bowtie": "Bowtie2",
+    "trimmomatic": "Trimmomatic",
+    "fastqc_final_r1": "FastQC final",
+    "fastqc_final_r2": "FastQC final",
+    "spades": "SPAdes",
+    "velvet": "velvet",
+    "quast_spades": "Quast",
+    "quast_velvet": "Quast",
+    "estadisticas_spades": "Estadisticas de SPAdes",
+    "estadisticas_velvet": "Estadisticas de velvet",
+    "seleccion": "Quast",
+    "augustus": "Augustus",
+}
+
+class ErrorPaso(Exception):
+    def __init__(self, nombre, error):
+        self.nombre = nombre
+        super().__init__(f"Error al ejecutar {ETIQUETAS_PASOS.get(nombre, nombre)}: {error}")
+
+# Parametros de cada herramienta. Cada dataset puede ser un id (un job) o
+# una coleccion {"src": "hdca", "id"} (un job por muestra en un solo envio)
+
+def inputs_fastqc(dataset):
+    return {
+        "input_file": referencia(dataset)
+    }
+
+def inputs_trimmomatic(unaligned_R1, unaligned_R2):
+    # Dos listas con los mismos identificadores se mapean juntas, elemento a elemento
+    return {
+        "readtype|single_or_paired": "pair_of_files",
+        "readtype|fastq_r1_in": referencia(unaligned_R1),
+        "readtype|fastq_r2_in": referencia(unaligned_R2),
+        "illuminaclip|do_illuminaclip": "no",
+    }
+
+def inputs_bowtie(datasetID_R1, datasetID_R2, genomaId):
+    return {
+        "library|type": "paired",
+        "library|input_1": referencia(datasetID_R1),
+        "library|input_2": referencia(datasetID_R2),
+        "library|unaligned_file": "true",
+        "library|aligned_file": "true",
+
+        "library|paired_options|paired_options_selector": "no",
+
+        "reference_genome|source": "history",
+        "reference_genome|own_file": {"src": "hda", "id": genomaId},
+    }
+
+def inputs_bowtie_pares(pares, genomaId):
+    # Una list:paired completa: Galaxy corre un job por par
+    return {
+        "library|type": "paired_collection",
+        "library|input_1": referencia_pares(pares),
+        "library|unaligned_file": "true",
+        "library|aligned_file": "true",
+
+        "library|paired_options|paired_options_selector": "no",
+
+        "reference_genome|source": "history",
+        "reference_genome|own_file": {"src": "hda", "id": genomaId},
+    }
+
+def inputs_shovill(paired_R1, paired_R2, type_assembler):
+    return {
+        "library|lib_type": "paired",
+        "library|R1": referencia(paired_R1),
+        "library|R2": referencia(paired_R2),
+        "assembler": type_assembler
+    }
+
+def inputs_quast(contigId):
+    return {
+        "mode|mode": "individual",
+        "mode|in|custom": "false",
+        "mode|in|inputs": referencia(contigId),
+        "output_files": ["tabular"]
+    }
+
+def inputs_augustus(shovill):
+    return {
+        "input_genome" : referencia(shovill)
+    }
+
+# Ejecucion sincrona de una herramienta
+
+def esperar_finalizacion(gi, job_id, history_id=None):
+    # Bloquea hasta que el poller compartido ve el job en un estado terminal
+    return obtener_poller(gi).seguir(job_id, history_id).result()
+
+# Lectura de las salidas de cada herramienta
+
+def _salida(outputs, nombre):
+    # El id del dataset, o la referencia completa si la salida es una coleccion
+    salida = outputs.get(nombre, {})
+    return {"src": "hdca", "id": salida["id"]} if es_coleccion(salida) else salida.get("id")
+
+def salidas_bowtie(gi, outputs, ctx=None):
+    return {
+        "unaligned_R1": _salida(outputs, "output_unaligned_reads_r"),
+        "unaligned_R2": _salida(outputs, "output_unaligned_reads_l"),
+    }
+
+def salidas_trimmomatic(gi, outputs, ctx=None):
+    return {
+        "paired_R1": _salida(outputs, "fastq_out_r1_paired"),
+        "paired_R2": _salida(outputs, "fastq_out_r2_paired"),
+    }
+
+def salidas_shovill(gi, outputs, ctx=None):
+    return {"contigs": _salida(outputs, "contigs")}
+
+def _metricas_quast(gi, id_tsv):
+    # El reporte es pequeno: se lee en memoria, sin archivos compartidos en /tmp
+    metricas = metricas_reporte(gi.datasets.download_dataset(id_tsv))
+
+    return {'N50': metricas["N50"], 'L50': metricas["L50"], 'metricas': metricas}
+
+def calidad_quast(gi, outputs, ctx=None):
+    reporte = outputs['report_tabular']
+
+    if es_coleccion(reporte):
+        # Un reporte por muestra
+        return {"muestras": {
+            muestra: _metricas_quast(gi, id_tsv)
+            for muestra, id_tsv in elementos_coleccion(gi, reporte["id"]).items()
+        }}
+
+    return _metricas_quast(gi, reporte['id'])
+
+def _estadisticas_contigs(gi, contigs):
+    metricas = estadisticas_dataset(gi, contigs)
+
+    return {'N50': metricas["N50"], 'L50': metricas["L50"], 'metricas': metricas}
+
+def estadisticas_ensamblaje(ensamblador):
+    # Paso local: N50/L50 calculados aqui leyendo los contigs de Galaxy, con
+    # la misma forma que calidad_quast
+    def calcular(gi, ctx):
+        contigs = ctx[ensamblador]["contigs"]
+        if es_coleccion(contigs):
+            return {"muestras": {
+                muestra: _estadisticas_contigs(gi, dataset_id)
+                for muestra, dataset_id in elementos_coleccion(gi, contigs["id"]).items()
+            }}
+        return _estadisticas_contigs(gi, contigs)
+    return calcular
+
+def _calidad(ctx, ensamblador):
+    # Metricas con las que se eligio: las locales si se calcularon, si no QUAST
+    return ctx.get(f"estadisticas_{ensamblador}") or ctx[f"quast_{ensamblador}"]
+
+def elegir_ganador(contigs, datasets_calidad):
+    # Un ensamblaje sin contigs del largo minimo no tiene N50 ni L50: pierde
+    def metrica(contig, nombre, faltante):
+        valor = datasets_calidad[contig].get(nombre)
+        return faltante if valor is None else valor
+
+    n50 = [metrica(contig, 'N50', -1) for contig in contigs]
+    l50 = [metrica(contig, 'L50', float('inf')) for contig in contigs]
+
+    if n50[0] > n50[1] and l50[0] < l50[1]:
+        return contigs[0]
+
+    elif n50[0] > n50[1]:
+        return contigs[0]
+
+    return contigs[1]
+
+def seleccionar_ensamblaje(gi, ctx):
+    if es_coleccion(ctx["spades"]["contigs"]):
+        return seleccionar_ensamblajes(gi, ctx)
+
+    contigs = [ctx["spades"]["contigs"], ctx["velvet"]["contigs"]]
+    calidad = {
+        ctx["spades"]["contigs"]: _calidad(ctx, "spades"),
+        ctx["velvet"]["contigs"]: _calidad(ctx, "velvet"),
+    }
+    return {"winner": elegir_ganador(contigs, calidad)}
+
+def seleccionar_ensamblajes(gi, ctx):
+    # Pipeline sobre colecciones: se elige el ensamblaje de cada muestra y los
+    # ganadores se juntan en una lista para correr Augustus en un solo envio
+    coleccion = gi.dataset_collections.show_dataset_collection(ctx["spades"]["contigs"]["id"])
+    spades = {e["element_identifier"]: e["object"]["id"] for e in coleccion.get("elements", [])}
+    velvet = elementos_coleccion(gi, ctx["velvet"]["contigs"]["id"])
+
+    muestras = {}
+    for muestra, contigs_spades in spades.items():
+        calidad = {
+            contigs_spades: _calidad(ctx, "spades")["muestras"][muestra],
+            velvet[muestra]: _calidad(ctx, "velvet")["muestras"][muestra],
+        }
+        ganador = elegir_ganador([contigs_spades, velvet[muestra]], calidad)
+        ensamblador = "spades" if ganador == contigs_spades else "velvet"
+        muestras[muestra] = {
+            "winner": ganador,
+            "ensamblador": ensamblador,
+            "N50": calidad[ganador]["N50"],
+            "L50": calidad[ganador]["L50"],
+        }
+
+    ganadores = crear_coleccion_lista(
+        gi, coleccion["history_id"], {m: datos["winner"] for m, datos in muestras.items()},
+        "Ensamblajes elegidos",
+    )
+    return {"winner": ganadores, "muestras": muestras}
+
+# Grafo de dependencias del pipeline completo
+
+def pasos_pipeline(colecciones=False):
+    # Con colecciones las entradas son {"pares": list:paired, "genoma"} y cada
+    # paso es un solo run_tool mapeado sobre todas las muestras
+    if colecciones:
+        iniciales = [
+            Paso("fastqc_inicial",
+                 herramienta=lambda ctx: (TOOL_FASTQC, inputs_fastqc(ctx["entradas"]["pares"]))),
+            Paso("bowtie",
+                 herramienta=lambda ctx: (TOOL_BOWTIE, inputs_bowtie_pares(
+                     ctx["entradas"]["pares"], ctx["entradas"]["genoma"])),
+                 recoger=salidas_bowtie),
+        ]
+    else:
+        iniciales = [
+            Paso("fastqc_inicial_r1",
+                 herramienta=lambda ctx: (TOOL_FASTQC, inputs_fastqc(ctx["entradas"]["dataset_r1"]))),
+            Paso("fastqc_inicial_r2",
+                 herramienta=lambda ctx: (TOOL_FASTQC, inputs_fastqc(ctx["entradas"]["dataset_r2"]))),
+            Paso("bowtie",
+                 herramienta=lambda ctx: (TOOL_BOWTIE, inputs_bowtie(
+                     ctx["entradas"]["dataset_r1"], ctx["entradas"]["dataset_r2"], ctx["entradas"]["genoma"])),
+                 recoger=salidas_bowtie),
+        ]
+
+    return iniciales + [
+        Paso("trimmomatic", ["bowtie"],
+             herramienta=lambda ctx: (TOOL_TRIMMOMATIC, inputs_trimmomatic(
+                 ctx["bowtie"]["unaligned_R1"], ctx["bowtie"]["unaligned_R2"])),
+             recoger=salidas_trimmomatic),
+        Paso("fastqc_final_r1", ["trimmomatic"],
+             herramienta=lambda ctx: (TOOL_FASTQC, inputs_fastqc(ctx["trimmomatic"]["paired_R1"]))),
+        Paso("fastqc_final_r2", ["trimmomatic"],
+             herramienta=lambda ctx: (TOOL_FASTQC, inputs_fastqc(ctx["trimmomatic"]["paired_R2"]))),
+        Paso("spades", ["trimmomatic"],
+             herramienta=lambda ctx: (TOOL_SHOVILL, inputs_shovill(
+                 ctx["trimmomatic"]["paired_R1"], ctx["trimmomatic"]["paired_R2"], "spades")),
+             recoger=salidas_shovill),
+        Paso("velvet", ["trimmomatic"],
+             herramienta=lambda ctx: (TOOL_SHOVILL, inputs_shovill(
+                 ctx["trimmomatic"]["paired_R1"], ctx["trimmomatic"]["paired_R2"], "velvet")),
+             recoger=salidas_shovill),
+    ] + pasos_calidad() + [
+        Paso("augustus", ["seleccion"],
+             herramienta=lambda ctx: (TOOL_AUGUSTUS, inputs_augustus(ctx["seleccion"]["winner"]))),
+    ]
+
+def pasos_calidad():
+    # PIPELINE_QUAST: "antes" elige con QUAST (dos jobs en cola antes de
+    # Augustus); "despues" elige con las estadisticas locales y QUAST corre en
+    # paralelo sin frenar a Augustus; "no" no corre QUAST
+    modo = settings.PIPELINE_QUAST
+    pasos = []
+    if modo != "no":
+        pasos += [
+            Paso("quast_spades", ["spades"],
+                 herramienta=lambda ctx: (TOOL_QUAST, inputs_quast(ctx["spades"]["contigs"])),
+                 recoger=calidad_quast),
+            Paso("quast_velvet", ["velvet"],
+                 herramienta=lambda ctx: (TOOL_QUAST, inputs_quast(ctx["velvet"]["contigs"])),
+                 recoger=calidad_quast),
+        ]
+    if modo == "antes":
+        return pasos + [Paso("seleccion", ["quast_spades", "quast_velvet"], local=seleccionar_ensamblaje)]
+
+    return pasos + [
+        Paso("estadisticas_spades", ["spades"], local=estadisticas_ensamblaje("spades")),
+        Paso("estadisticas_velvet", ["velvet"], local=estadisticas_ensamblaje("velvet")),
+        Paso("seleccion", ["estadisticas_spades", "estadisticas_velvet"], local=seleccionar_ensamblaje),
+    ]
+
+def resumen_seleccion(ctx):
+    # Ensamblaje elegido y sus metricas principales
+    if "muestras" in ctx["seleccion"]:
+        return {"winner": ctx["seleccion"]["winner"], "muestras": ctx["seleccion"]["muestras"]}
+
+    ensamblador = "spades" if ctx["seleccion"]["winner"] == ctx["spades"]["contigs"] else "velvet"
+    calidad = _calidad(ctx, ensamblador)
+    return {
+        "winner": ctx["seleccion"]["winner"],
+        "ensamblador": ensamblador,
+        "N50": calidad.get("N50"),
+        "L50": calidad.get("L50"),
+    }
+
+def armar_resultados(ctx):
+    # Misma estructura que espera resultado_fastqc.html
+    if "fastqc_inicial" in ctx:
+        # Pipeline sobre colecciones: un envio para las dos lecturas de todas las muestras
+        fastqc_inicial = {
+            "fastqc_id" : ctx["fastqc_inicial"]["job_id"],
+            "fastqc_jobs" : ctx["fastqc_inicial"].get("jobs", []),
+            "fastqc_outputs" : ctx["fastqc_inicial"]["output_datasets"],
+        }
+    else:
+        fastqc_inicial = {
+            "fastqc_id1" : ctx["fastqc_inicial_r1"]["job_id"],
+            "fastqc_outputs1" : ctx["fastqc_inicial_r1"]["output_datasets"],
+            "fastqc_id2" : ctx["fastqc_inicial_r2"]["job_id"],
+            "fastqc_outputs2" : ctx["fastqc_inicial_r2"]["output_datasets"]
+        }
+
+    resultados = {
+        "fastqc_inicial": fastqc_inicial,
+        "bowtie": {
+            "bowtie_id": ctx["bowtie"]["job_id"],
+            "bowtie_outputs": ctx["bowtie"]["output_datasets"],
+        },
+        "trimmomatic": {
+            "trimmomatic_id": ctx["trimmomatic"]["job_id"],
+            "trimmomatic_output": ctx["trimmomatic"]["output_datasets"]
+        },
+        "fastqc_final": {
+            "fastqc_id1" : ctx["fastqc_final_r1"]["job_id"],
+            "fastqc_outputs1" : ctx["fastqc_final_r1"]["output_datasets"],
+            "fastqc_id2" : ctx["fastqc_final_r2"]["job_id"],
+            "fastqc_outputs2" : ctx["fastqc_final_r2"]["output_datasets"]
+        },
+        "spades": {
+            "spades_id": ctx["spades"]["job_id"],
+            "spades_outputs": ctx["spades"]["output_datasets"]
+        },
+        "velvet": {
+            "velvet_id": ctx["velvet"]["job_id"],
+            "velvet_outputs": ctx["velvet"]["output_datasets"]
+        },
+        "seleccion": resumen_seleccion(ctx),
+        "augustus": {
+            "augustus_id": ctx["augustus"]["job_id"],
+            "augustus_outputs": ctx["augustus"]["outputs"]
+        },
+    }
+
+    # QUAST es opcional (PIPELINE_QUAST = "no")
+    if "quast_spades" in ctx:
+        resultados["quast"] = {
+            "reporteSpades": {"spades_contigs": ctx["spades"]["contigs"],
+            "job_id": ctx["quast_spades"]["job_id"],
+            "output_datasets": ctx["quast_spades"]["output_datasets"]
+            },
+
+            "reporteVelvet": {"velvet_contigs": ctx["velvet"]["contigs"],
+            "job_id": ctx["quast_velvet"]["job_id"],
+            "output_datasets": ctx["quast_velvet"]["output_datasets"]
+            }
+        }
+    if "estadisticas_spades" in ctx:
+        resultados["estadisticas"] = {
+            "spades": ctx["estadisticas_spades"],
+            "velvet": ctx["estadisticas_velvet"],
+        }
+
+    return resultados
+
+# Registro de cada paso en la base de datos mientras el DAG avanza
+
+def _actualizar_paso(run, nombre, **campos):
+    # UPDATE de una sola sentencia: los callbacks llegan tambien desde el hilo
+    # del poller y una transaccion SELECT+UPDATE se bloquea con SQLite
+    PipelineStep.objects.filter(run=run, name=nombre).update(**campos)
+
+def _usar_workflow(run, pasos, hechos):
+    # El workflow toma tres datasets sueltos; las colecciones ya van en un
+    # solo envio por paso
+    if settings.PIPELINE_MODO != "workflow" or "pares" in run.inputs:
+        return False
+    # Invocacion ya enviada por un worker que perdio el lease
+    if run.invocation_id:
+        return True
+    # Una ejecucion reanudada continua paso a paso desde sus checkpoints
+    return not any(paso.nombre in hechos for paso in pasos_workflow(pasos))
+
+def ejecutar_pipeline(run, cancelado=None):
+
+    # Los jobs van a la cuenta de Galaxy de quien lanzo la ejecucion
+    gi = obtener_cliente_usuario(run.user)
+    pasos = pasos_pipeline(colecciones="pares" in run.inputs)
+
+    # Los pasos que terminaron en un intento anterior no se repiten
+    hechos = {
+        paso.name: paso.output
+        for paso in run.steps.filter(state=PipelineStep.OK, output__isnull=False)
+    }
+    if hechos:
+        log.info("Reanudando la ejecucion %s: %s pasos ya terminados", run.pk, len(hechos))
+
+    # El resto se registra como pendiente para mostrar el grafo completo
+    for paso in pasos:
+        if paso.nombre not in hechos:
+            PipelineStep.objects.update_or_create(run=run, name=paso.nombre, defaults={
+                "state": PipelineStep.PENDING, "job_id": "", "error": "", "cached": False,
+                "output": None, "started_at": None, "finished_at": None,
+                "galaxy_created_at": None, "galaxy_started_at": None, "galaxy_finished_at": None,
+                "observed_at": None,
+            })
+
+    # Inicio de cada paso para informar la duracion en los eventos
+    inicios = {}
+
+    def al_enviar(nombre, job_id, enviado=None):
+        # En modo workflow el job aparece al agendar la invocacion: sin la
+        # hora del envio se usa la de ahora
+        inicios[nombre] = ahora = enviado or timezone.now()
+        _actualizar_paso(run, nombre, state=PipelineStep.QUEUED, job_id=job_id, started_at=ahora)
+        registrar_evento(run.pk, nombre, PipelineStep.QUEUED, job_id=job_id,
+                         started_at=ahora.isoformat())
+
+    def al_reutilizar(nombre, job_id):
+        inicios[nombre] = ahora = timezone.now()
+        _actualizar_paso(run, nombre, state=PipelineStep.QUEUED, job_id=job_id, cached=True,
+                         started_at=ahora)
+        registrar_evento(run.pk, nombre, PipelineStep.QUEUED, job_id=job_id, cached=True,
+                         started_at=ahora.isoformat())
+
+    def al_estado(nombre, job_id, estado):
+        if estado == "running":
+            cambiados = PipelineStep.objects.filter(run=run, name=nombre, state=PipelineStep.QUEUED).update(
+                state=PipelineStep.RUNNING
+            )
+            if cambiados:
+                registrar_evento(run.pk, nombre, PipelineStep.RUNNING, job_id=job_id)
+
+    def al_finalizar(nombre, estado, **datos):
+        ahora = timezone.now()
+        inicio = inicios.get(nombre)
+        registrar_evento(
+            run.pk, nombre, estado, finished_at=ahora.isoformat(),
+            duration=(ahora - inicio).total_seconds() if inicio else None, **datos
+        )
+
+    def al_terminar(nombre, salida):
+        # Checkpoint en cuanto el paso termina, con los tiempos del job en Galaxy
+        tiempos = salida.get("tiempos") or {}
+        _actualizar_paso(
+            run, nombre, state=PipelineStep.OK, output=salida, finished_at=timezone.now(),
+            **{campo: parse_datetime(valor) for campo, valor in tiempos.items() if valor},
+        )
+        datos = {"job_id": salida.get("job_id", "")}
+        if tiempos and nombre in inicios:
+            observar_paso(nombre, inicios[nombre], tiempos)
+            datos["timing"] = desglose_tiempos(inicios[nombre], tiempos)
+        al_finalizar(nombre, PipelineStep.OK, **datos)
+
+    def al_fallar(nombre, error):
+        _actualizar_paso(run, nombre, state=PipelineStep.ERROR, error=str(error),
+                         finished_at=timezone.now())
+        al_finalizar(nombre, PipelineStep.ERROR, error=str(error))
+
+    callbacks = {
+        "al_enviar": al_enviar,
+        "al_estado": al_estado,
+        "al_terminar": al_terminar,
+        "al_fallar": al_fallar,
+        "cancelado": cancelado,
+    }
+    ctx = {"entradas": run.inputs}
+
+    if _usar_workflow(run, pasos, hechos):
+        def al_invocar(invocation_id):
+            PipelineRun.objects.filter(pk=run.pk).update(invocation_id=invocation_id)
+            registrar_evento(run.pk, "", PipelineRun.RUNNING, invocation_id=invocation_id)
+
+        invocacion = InvocacionPipeline(
+            gi, run.history_id, pasos, ctx, hechos=hechos, al_invocar=al_invocar, **callbacks
+        )
+        try:
+            hechos = {**hechos, **invocacion.ejecutar(run.invocation_id or None)}
+        except PasoFallido as e:
+            raise ErrorPaso(e.nombre, e.error) from e
+
+    # Lo que no corre dentro del workflow (seleccion y Augustus) sigue en el DAG
+    ejecutor = EjecutorDag(
+        gi, run.history_id, pasos,
+        ctx=ctx,
+        memo=MemoHerramientas(gi) if settings.PIPELINE_MEMO else None,
+        hechos=hechos,
+        al_reutilizar=al_reutilizar,
+        **callbacks,
+    )
+
+    try:
+        ctx = ejecutor.ejecutar()
+    except PasoFallido as e:
+        raise ErrorPaso(e.nombre, e.error) from e
+
+    return armar_resultados(ctx)
@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+from bioblend import ConnectionError
+
+log = logging.getLogger(__name__)
+
+# Estados en los que un job de Galaxy ya no va a cambiar
+ESTADOS_TERMINALES = {
+    "ok", "error", "failed", "deleted", "deleting", "deleted_new", "skipped", "stopped",
+}
+
+# Intervalo de consulta segun el estado actual del job (segundos). Ninguno
+# supera los 10 s del bucle de show_job que reemplaza: lo que se gana es una
+# sola consulta por ciclo para todos los jobs, no consultar menos seguido.
+INTERVALOS_ESTADO = {
+    "new": 2,
+    "upload": 2,
+    "waiting": 3,
+    "queued": 3,
+    "running": 3,
+    "paused": 10,
+}
+INTERVALO_DEFECTO = 5
+INTERVALO_MAXIMO = 10
+# Sin cambios de estado el intervalo crece de a poco hasta INTERVALO_MAXIMO,
+# salvo corriendo: ahi el job puede terminar en cualquier momento
+FACTOR_BACKOFF = 1.25
+SIN_BACKOFF = {"running"}
+
+
+class _Seguimiento:
+    def __init__(self, job_id, history_id, al_cambiar):
+        self.job_id = job_id
+        self.history_id = history_id
+        self.al_cambiar = al_cambiar
+        self.futuro = Future()
+        self.estado = None
+        self.intervalo = INTERVALOS_ESTADO["new"]
+        self.proximo = time.monotonic()
+        self.desde = datetime.now(timezone.utc)
+        # update_time del job la primera vez que se lo vio corriendo
+        self.ejecutando_desde = None
+
+
+class JobPoller:
+    # Sigue todos los jobs activos de una cuenta de Galaxy con una sola
+    # consulta por ciclo en lugar de un bucle de show_job por job.
+
+    def __init__(self, gi, limite_consulta=500):
+        self.gi = gi
+        self.limite_consulta = limite_consulta
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def seguir(self, job_id, history_id=None, al_cambiar=None):
+        # Devuelve un Future que se resuelve con el resumen del job cuando
+        # llega a un estado terminal. al_cambiar(job_id, estado) se llama en
+        # cada transicion observada.
+        with self._lock:
+            seguimiento = self._jobs.get(job_id)
+            if seguimiento is None:
+                seguimiento = _Seguimiento(job_id, history_id, al_cambiar)
+                self._jobs[job_id] = seguimiento
+            self._iniciar()
+        self._despertar.set()
+        return seguimiento.futuro
+
+    def activos(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name="job-poller", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            with self._lock:
+                if not self._jobs:
+                    self._hilo = None
+                    return
+                ahora = time.monotonic()
+                pendientes = [s for s in self._jobs.values() if s.proximo <= ahora]
+                espera = min(s.proximo for s in self._jobs.values()) - ahora
+
+            if pendientes:
+                try:
+                    self._consultar(pendientes)
+                except Exception:
+                    # Los errores de Galaxy se tratan por job en _consultar
+                    log.exception("Error consultando el estado de %s jobs", len(pendientes))
+                    for seguimiento in pendientes:
+                        if not seguimiento.futuro.done():
+                            self._reprogramar(seguimiento, cambio=False)
+                continue
+
+            self._despertar.wait(max(espera, 0))
+            self._despertar.clear()
+
+    def _consulta_masiva(self, pendientes):
+        # Una sola consulta sirve para todos los jobs seguidos, no solo los
+        # que tocaba revisar: los demas se actualizan sin costo extra
+        with self._lock:
+            seguidos = list(self._jobs.values())
+        historias = {s.history_id for s in seguidos}
+        if None in historias:
+            seguidos = [s for s in seguidos if s.history_id is not None]
+            historias.discard(None)
+        if not historias:
+            return {}, []
+
+        # Una sola historia: se filtra en Galaxy por historia. Varias: una
+        # consulta de todos los jobs del usuario actualizados desde el
+        # primer seguimiento.
+        filtros = {}
+        if len(historias) == 1:
+            filtros["history_id"] = next(iter(historias))
+        desde = min(s.desde for s in seguidos) - timedelta(days=1)
+        try:
+            jobs = self.gi.jobs.get_jobs(
+                date_range_min=desde.strftime("%Y-%m-%d"),
+                limit=self.limite_consulta,
+                **filtros,
+            )
+        except Exception as e:
+            # Se sigue con show_job para los que tocaba revisar
+            log.warning("Error consultando el estado de %s jobs: %s", len(seguidos), e)
+            return {}, []
+        return {job["id"]: job for job in jobs}, seguidos
+
+    def _consultar(self, pendientes):
+        vistos, seguidos = self._consulta_masiva(pendientes)
+        por_revisar = {s.job_id for s in pendientes}
+
+        for seguimiento in seguidos:
+            job = vistos.get(seguimiento.job_id)
+            if job is not None:
+                por_revisar.discard(seguimiento.job_id)
+                self._actualizar(seguimiento, job)
+
+        for seguimiento in pendientes:
+            if seguimiento.job_id not in por_revisar:
+                continue
+            # Sin historia conocida o fuera del limite de la consulta
+            try:
+                job = self.gi.jobs.show_job(seguimiento.job_id)
+            except ConnectionError as e:
+                if e.status_code and 400 <= e.status_code < 500 and e.status_code != 429:
+                    # El job no existe o no es accesible: no va a cambiar
+                    log.warning("No se puede consultar el job %s: %s", seguimiento.job_id, e)
+                    self._terminar(seguimiento, {"id": seguimiento.job_id, "state": "error", "error": str(e)})
+                else:
+                    log.warning("Error consultando el job %s, se reintenta: %s", seguimiento.job_id, e)
+                    self._reprogramar(seguimiento, cambio=False)
+            except Exception as e:
+                log.warning("Error consultando el job %s, se reintenta: %s", seguimiento.job_id, e)
+                self._reprogramar(seguimiento, cambio=False)
+            else:
+                self._actualizar(seguimiento, job)
+
+    def _actualizar(self, seguimiento, job):
+        estado = job.get("state")
+        cambio = estado != seguimiento.estado
+        seguimiento.estado = estado
+
+        if estado == "running" and seguimiento.ejecutando_desde is None:
+            seguimiento.ejecutando_desde = job.get("update_time")
+
+        if cambio and seguimiento.al_cambiar:
+            try:
+                seguimiento.al_cambiar(seguimiento.job_id, estado)
+            except Exception:
+                log.exception("Error notificando el estado del job %s", seguimiento.job_id)
+
+        if estado in ESTADOS_TERMINALES:
+            self._terminar(seguimiento, job)
+            return
+
+        self._reprogramar(seguimiento, cambio)
+
+    def _terminar(self, seguimiento, job):
+        with self._lock:
+            self._jobs.pop(seguimiento.job_id, None)
+        if seguimiento.futuro.done():
+            return
+        seguimiento.futuro.set_result({
+            **job,
+            "running_since": seguimiento.ejecutando_desde,
+            "observed_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    def _reprogramar(self, seguimiento, cambio):
+        if cambio or seguimiento.estado in SIN_BACKOFF:
+            seguimiento.intervalo = INTERVALOS_ESTADO.get(seguimiento.estado, INTERVALO_DEFECTO)
+        else:
+            seguimiento.intervalo = min(seguimiento.intervalo * FACTOR_BACKOFF, INTERVALO_MAXIMO)
+        seguimiento.proximo = time.monotonic() + seguimiento.intervalo
+
+
+def _utc(valor):
+    # Galaxy da las fechas en UTC sin zona horaria
+    if not valor:
+        return None
+    fecha = datetime.fromisoformat(valor)
+    return (fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)).isoformat()
+
+def tiempos_job(resumen):
+    # Marcas de tiempo de un job terminado: creado, corriendo y terminado
+    # segun Galaxy, y cuando lo vio terminado el poller
+    return {
+        "galaxy_created_at": _utc(resumen.get("create_time")),
+        "galaxy_started_at": _utc(resumen.get("running_since")),
+        "galaxy_finished_at": _utc(resumen.get("update_time")),
+        "observed_at": resumen.get("observed_at"),
+    }
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+def obtener_poller(gi):
+    # Un poller por servidor y API key, compartido por todo el proceso
+    clave = (gi.base_url, gi.key)
+    with _pollers_lock:
+        poller = _pollers.get(clave)
+        if poller is None:
+            poller = JobPoller(gi)
+            _pollers[clave] = poller
+        return poller
@@ -0,0 +1,48 @@
+import re
+
+# Lectura del report.tsv de QUAST: la primera fila es "Assembly" con el
+# nombre de cada ensamblaje y el resto son "metrica<TAB>valor<TAB>valor..."
+
+ENTERO = re.compile(r"^[+-]?\d+$")
+DECIMAL = re.compile(r"^[+-]?(\d+\.\d*|\.\d+)$")
+# Algunas metricas vienen como "1234 + 5 part"
+CON_PARTES = re.compile(r"^(\d+) \+ (\d+) part$")
+
+
+def convertir_valor(texto):
+    texto = texto.strip()
+    if texto in ("", "-"):
+        return None
+    if ENTERO.match(texto):
+        return int(texto)
+    if DECIMAL.match(texto):
+        return float(texto)
+    m = CON_PARTES.match(texto)
+    if m:
+        return int(m[1])
+    return texto
+
+def parsear_reporte(contenido):
+    # {ensamblaje: {metrica: valor}} con los valores ya convertidos
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode("utf-8")
+
+    lineas = (linea for linea in contenido.splitlines() if linea.strip())
+    cabecera = next(lineas, None)
+    if cabecera is None:
+        raise ValueError("El reporte de QUAST esta vacio")
+    ensamblajes = cabecera.split("\t")[1:]
+    if not ensamblajes:
+        raise ValueError("El reporte de QUAST no tiene ensamblajes")
+
+    reporte = {ensamblaje: {} for ensamblaje in ensamblajes}
+    for linea in lineas:
+        metrica, *valores = linea.split("\t")
+        for ensamblaje, valor in zip(ensamblajes, valores):
+            reporte[ensamblaje][metrica] = convertir_valor(valor)
+    return reporte
+
+def metricas_reporte(contenido):
+    # Metricas del primer ensamblaje, el unico cuando QUAST evalua un contigs
+    reporte = parsear_reporte(contenido)
+    return next(iter(reporte.values()))
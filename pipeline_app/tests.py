@@ -0,0 +1,294 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from bioblend import ConnectionError
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import esquemas, fastq
+from .quast import metricas_reporte, parsear_reporte
+
+from .ensamblajes import estadisticas_fasta
+from .metricas import desglose_tiempos, ruta_api
+from .paginacion import ParametroInvalido, etag_items, leer_pagina, respuesta_paginada
+from .pares import emparejar_lecturas
+from .pipeline import elegir_ganador
+from .poller import tiempos_job
+
+
+class RutaApiTests(SimpleTestCase):
+
+    def test_ids_de_galaxy(self):
+        self.assertEqual(
+            ruta_api("https://usegalaxy.eu/api/jobs/f2db41e1fa331b3e/outputs"),
+            "/api/jobs/{id}/outputs",
+        )
+
+    def test_sesion_tus_patch_y_head(self):
+        # PATCH y HEAD van a la URL de la sesion, con un id de 32 hex
+        url = "https://usegalaxy.eu/api/upload/resumable_upload/3f2a9c0d5e6b47a8b1c2d3e4f5a64a5b"
+        self.assertEqual(ruta_api(url), "/api/upload/resumable_upload/{id}")
+        self.assertEqual(ruta_api(url.replace("3f2a9c0d", "0000aaaa")), ruta_api(url))
+
+    def test_uuid(self):
+        self.assertEqual(
+            ruta_api("https://usegalaxy.eu/api/upload/resumable_upload/3f2a9c0d-5e6b-47a8-b1c2-d3e4f5a64a5b"),
+            "/api/upload/resumable_upload/{id}",
+        )
+
+    def test_nombres_no_se_tocan(self):
+        self.assertEqual(ruta_api("https://usegalaxy.eu/api/tools/fetch"), "/api/tools/fetch")
+
+
+class DesgloseTiemposTests(SimpleTestCase):
+
+    def test_submit_hasta_el_create_time(self):
+        # La hora de envio se toma antes de run_tool: Galaxy crea el job despues
+        enviado = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+        tiempos = tiempos_job({
+            "create_time": "2024-05-01T12:00:02",
+            "running_since": "2024-05-01T12:00:10",
+            "update_time": "2024-05-01T12:01:00",
+            "observed_at": (enviado + timedelta(seconds=63)).isoformat(),
+        })
+        desglose = desglose_tiempos(enviado, tiempos)
+        self.assertEqual(desglose["submit"], 2.0)
+        self.assertEqual(desglose["queue"], 8.0)
+        self.assertEqual(desglose["run"], 50.0)
+        self.assertEqual(desglose["poll_delay"], 3.0)
+        self.assertEqual(desglose["total"], 63.0)
+
+
+class ElegirGanadorTests(SimpleTestCase):
+
+    def test_mayor_n50(self):
+        calidad = {"spades": {"N50": 5000, "L50": 3}, "velvet": {"N50": 2000, "L50": 8}}
+        self.assertEqual(elegir_ganador(["spades", "velvet"], calidad), "spades")
+        self.assertEqual(elegir_ganador(["velvet", "spades"], calidad), "spades")
+
+    def test_sin_contigs_del_largo_minimo_pierde(self):
+        # Sin contigs de 500 bp o mas no hay N50 ni L50
+        calidad = {"spades": {"N50": None, "L50": None}, "velvet": {"N50": 800, "L50": 1}}
+        self.assertEqual(elegir_ganador(["spades", "velvet"], calidad), "velvet")
+        self.assertEqual(elegir_ganador(["velvet", "spades"], calidad), "velvet")
+
+
+class EstadisticasFastaTests(SimpleTestCase):
+
+    def test_contigs_cortos_no_cuentan(self):
+        fasta = b">largo\n" + b"GGGGCCCCAA" * 60 + b"\n>corto\n" + b"A" * 100 + b"\n"
+        metricas = estadisticas_fasta([fasta[:7], fasta[7:]], minimo=500)
+        self.assertEqual(metricas["# contigs"], 1)
+        self.assertEqual(metricas["N50"], 600)
+        # El GC es el del contig largo, sin las A del corto
+        self.assertEqual(metricas["GC (%)"], 80.0)
+
+    def test_sin_contigs_del_largo_minimo(self):
+        metricas = estadisticas_fasta([b">corto\nACGT\n"], minimo=500)
+        self.assertEqual(metricas["# contigs"], 0)
+        self.assertIsNone(metricas["N50"])
+        self.assertIsNone(metricas["GC (%)"])
+
+
+class AnalizadorFastqTests(SimpleTestCase):
+
+    def analizar(self, *trozos):
+        analizador = fastq.AnalizadorFastq()
+        for trozo in trozos:
+            analizador.agregar(trozo)
+        return analizador.terminar()
+
+    def test_registro_valido(self):
+        resumen = self.analizar(b"@r1 1:N:0:1\nACGTN\n+\nIIIII\n")
+        self.assertEqual(resumen["errors"], [])
+        self.assertEqual(resumen["reads"], 1)
+        self.assertEqual(resumen["bases"], 5)
+        self.assertEqual(resumen["mean_quality"], 40.0)
+
+    def test_registro_cortado_entre_trozos(self):
+        resumen = self.analizar(b"@r1\nAC", b"GT\n+\nII", b"II\n")
+        self.assertEqual(resumen["errors"], [])
+        self.assertEqual(resumen["length_distribution"], {"4": 1})
+
+    def test_registro_truncado(self):
+        resumen = self.analizar(b"@r1\nACGT\n+\nIIII\n@r2\nACGT\n")
+        self.assertEqual(resumen["reads"], 1)
+        self.assertEqual(resumen["errors"], ["El archivo termina a mitad de la lectura 2"])
+
+    def test_falta_la_linea_mas(self):
+        resumen = self.analizar(b"@r1\nACGT\n-\nIIII\n")
+        self.assertEqual(resumen["errors"], ["Lectura 1: falta la linea '+'"])
+
+    def test_secuencia_y_calidad_de_largos_distintos(self):
+        resumen = self.analizar(b"@r1\nACGT\n+\nIII\n")
+        self.assertEqual(resumen["errors"], ["Lectura 1: la secuencia y la calidad tienen largos distintos"])
+
+    def test_el_primer_error_corta_la_lectura(self):
+        resumen = self.analizar(b"@r1\nACGT\n+\nIII\n", b"sin formato\n" * 8)
+        self.assertEqual(resumen["error_count"], 1)
+
+    def test_linea_demasiado_larga(self):
+        with mock.patch.object(fastq, "LARGO_MAXIMO_LINEA", 16):
+            resumen = self.analizar(b"@r1\n", b"A" * 10, b"A" * 10)
+        self.assertEqual(resumen["error_count"], 1)
+        self.assertIn("de mas de 16 bytes", resumen["errors"][0])
+
+
+ESQUEMA_PRUEBA = {
+    "id": "prueba",
+    "version": "1.0",
+    "inputs": [
+        {"name": "input", "type": "data", "optional": False},
+        {"name": "modo", "type": "select", "value": "rapido",
+         "options": [["Rapido", "rapido", True], ["Lento", "lento", False]]},
+        {"name": "minimo", "type": "integer", "value": "10", "min": "1"},
+    ],
+}
+
+
+class ValidarInputsTests(SimpleTestCase):
+
+    def test_completa_los_valores_por_defecto(self):
+        completos = esquemas.validar_inputs(ESQUEMA_PRUEBA, {"input": {"src": "hda", "id": "abc"}})
+        self.assertEqual(completos["modo"], "rapido")
+        self.assertEqual(completos["minimo"], "10")
+
+    def test_parametro_desconocido(self):
+        with self.assertRaises(esquemas.EntradasInvalidas) as error:
+            esquemas.validar_inputs(ESQUEMA_PRUEBA, {"input": {"src": "hda", "id": "abc"}, "mdoo": "lento"})
+        self.assertEqual(error.exception.errores, ["mdoo: no existe en la version 1.0 de la herramienta"])
+
+    def test_opcion_invalida(self):
+        with self.assertRaises(esquemas.EntradasInvalidas) as error:
+            esquemas.validar_inputs(ESQUEMA_PRUEBA, {"input": {"src": "hda", "id": "abc"}, "modo": "turbo"})
+        self.assertIn("modo: ['turbo'] no esta entre", error.exception.errores[0])
+
+    def test_falta_el_dataset(self):
+        with self.assertRaises(esquemas.EntradasInvalidas) as error:
+            esquemas.validar_inputs(ESQUEMA_PRUEBA, {"modo": "lento"})
+        self.assertEqual(error.exception.errores, ["input: falta el dataset"])
+
+
+@override_settings(GALAXY_VALIDAR_INPUTS=True)
+class PrepararInputsTests(SimpleTestCase):
+    inputs = {"input": {"src": "hda", "id": "abc"}, "mdoo": "lento"}
+
+    def preparar(self, error):
+        gi = mock.Mock(base_url="https://galaxy.example")
+        with mock.patch.object(esquemas, "obtener_esquema", side_effect=error):
+            return esquemas.preparar_inputs(gi, "prueba", self.inputs)
+
+    def test_sin_red_se_envia_sin_validar(self):
+        with self.assertLogs("pipeline_app.esquemas", "WARNING"):
+            inputs = self.preparar(ConnectionError("Galaxy no responde", status_code=502))
+        self.assertEqual(inputs, self.inputs)
+
+    def test_sin_disco_se_envia_sin_validar(self):
+        with self.assertLogs("pipeline_app.esquemas", "WARNING"):
+            inputs = self.preparar(OSError(28, "No space left on device"))
+        self.assertEqual(inputs, self.inputs)
+
+    def test_herramienta_no_instalada(self):
+        with self.assertRaises(esquemas.EntradasInvalidas):
+            self.preparar(ConnectionError("Not found", status_code=404))
+
+
+# report.tsv de QUAST con dos ensamblajes
+REPORTE_QUAST = (
+    "Assembly\tspades_contigs\tvelvet_contigs\n"
+    "# contigs (>= 0 bp)\t12\t40\n"
+    "Total length\t2012345\t1890000\n"
+    "GC (%)\t50.12\t49.8\n"
+    "N50\t250000\t-\n"
+    "L50\t3\t-\n"
+    "# misassemblies\t2 + 1 part\t-\n"
+)
+
+
+class ReporteQuastTests(SimpleTestCase):
+
+    def test_dos_ensamblajes(self):
+        reporte = parsear_reporte(REPORTE_QUAST.encode())
+        self.assertEqual(list(reporte), ["spades_contigs", "velvet_contigs"])
+        self.assertEqual(reporte["spades_contigs"]["N50"], 250000)
+        self.assertEqual(reporte["spades_contigs"]["L50"], 3)
+        self.assertEqual(reporte["spades_contigs"]["GC (%)"], 50.12)
+        self.assertEqual(reporte["spades_contigs"]["# misassemblies"], 2)
+        self.assertEqual(reporte["velvet_contigs"]["Total length"], 1890000)
+
+    def test_guion_es_none(self):
+        # Sin contigs de 500 bp o mas QUAST no calcula N50 ni L50
+        reporte = parsear_reporte(REPORTE_QUAST)
+        self.assertIsNone(reporte["velvet_contigs"]["N50"])
+        self.assertIsNone(reporte["velvet_contigs"]["L50"])
+
+    def test_metricas_del_primer_ensamblaje(self):
+        self.assertEqual(metricas_reporte(REPORTE_QUAST)["# contigs (>= 0 bp)"], 12)
+
+    def test_reporte_vacio(self):
+        with self.assertRaises(ValueError):
+            parsear_reporte("")
+
+
+def _datasets(*nombres):
+    return [{"id": f"d{i}", "name": nombre} for i, nombre in enumerate(nombres)]
+
+
+class EmparejarLecturasTests(SimpleTestCase):
+
+    def test_convenciones_de_nombre(self):
+        pares, sueltos = emparejar_lecturas(_datasets(
+            "m_S1_L001_R2_001.fastq.gz", "m_S1_L001_R1_001.fastq.gz",
+            "x_1.fq.gz", "x_2.fq.gz",
+            "y.R1.fq", "y.R2.fq",
+        ))
+        self.assertEqual(
+            [(par["muestra"], par["r1"]["id"], par["r2"]["id"]) for par in pares],
+            [("m_S1_L001", "d1", "d0"), ("x", "d2", "d3"), ("y", "d4", "d5")],
+        )
+        self.assertEqual(sueltos, [])
+
+    def test_lectura_sin_pareja(self):
+        pares, sueltos = emparejar_lecturas(_datasets("z_R1.fastq", "notas.txt", "w_R1.fq", "w_2.fq"))
+        self.assertEqual(pares, [])
+        # R1 y 2 son convenciones distintas: no se emparejan
+        self.assertEqual(sorted(d["name"] for d in sueltos), ["notas.txt", "w_2.fq", "w_R1.fq", "z_R1.fastq"])
+
+    def test_nombre_repetido(self):
+        pares, sueltos = emparejar_lecturas(_datasets("a_R1.fq", "a_R2.fq", "a_R1.fq"))
+        self.assertEqual([(par["r1"]["id"], par["r2"]["id"]) for par in pares], [("d0", "d1")])
+        self.assertEqual([d["id"] for d in sueltos], ["d2"])
+
+
+@override_settings(GALAXY_PAGINA_DEFECTO=20, GALAXY_PAGINA_MAXIMA=50)
+class PaginacionTests(SimpleTestCase):
+    items = [{"id": f"h{i}", "update_time": "2024-05-01T12:00:00"} for i in range(2)]
+
+    def test_limites(self):
+        fabrica = RequestFactory()
+        self.assertEqual(leer_pagina(fabrica.get("/")), (20, 0))
+        self.assertEqual(leer_pagina(fabrica.get("/", {"limit": 500, "offset": 40})), (50, 40))
+        for query in ({"limit": 0}, {"offset": -1}, {"limit": "diez"}):
+            with self.assertRaises(ParametroInvalido):
+                leer_pagina(fabrica.get("/", query))
+
+    def test_enlace_a_la_siguiente_pagina(self):
+        request = RequestFactory().get("/historias/", {"limit": 2})
+        response = respuesta_paginada(request, self.items, 2, 0, etag_items(self.items))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("offset=2", response["Link"])
+        self.assertEqual(b"".join(response.streaming_content).decode()[:10], '[{"id": "h')
+
+    def test_etag_igual_responde_304(self):
+        etag = etag_items(self.items)
+        request = RequestFactory().get("/historias/", headers={"If-None-Match": etag})
+        response = respuesta_paginada(request, self.items, 20, 0, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_etag_distinto_responde_la_pagina(self):
+        etag = etag_items(self.items)
+        request = RequestFactory().get("/historias/", headers={"If-None-Match": etag})
+        cambiados = [{**self.items[0], "update_time": "2024-05-02T08:00:00"}, self.items[1]]
+        response = respuesta_paginada(request, cambiados, 20, 0, etag_items(cambiados))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Link", response)
@@ -0,0 +1,97 @@
+import contextvars
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# Traza de la peticion de Django en curso; None fuera de una peticion (workers)
+_traza_actual = contextvars.ContextVar("traza_galaxy", default=None)
+
+
+class TrazaGalaxy:
+    # Llamadas a la API de Galaxy hechas mientras se atiende una peticion
+
+    def __init__(self):
+        self.llamadas = []
+        self._lock = threading.Lock()
+
+    def registrar(self, metodo, ruta, segundos, espera, enviados, recibidos, estado):
+        with self._lock:
+            self.llamadas.append({
+                "method": metodo,
+                "endpoint": ruta,
+                "seconds": segundos,
+                "limiter_wait": espera,
+                "request_bytes": enviados,
+                "response_bytes": recibidos,
+                "status": estado,
+            })
+
+    @property
+    def segundos(self):
+        return sum(llamada["seconds"] for llamada in self.llamadas)
+
+    @property
+    def espera(self):
+        return sum(llamada["limiter_wait"] for llamada in self.llamadas)
+
+    @property
+    def bytes(self):
+        return sum(llamada["request_bytes"] + llamada["response_bytes"] for llamada in self.llamadas)
+
+    def repetidas(self, minimo):
+        # Endpoints llamados muchas veces en la misma peticion (patron N+1)
+        conteo = Counter(f"{llamada['method']} {llamada['endpoint']}" for llamada in self.llamadas)
+        return {endpoint: veces for endpoint, veces in conteo.most_common() if veces >= minimo}
+
+    def server_timing(self, total):
+        # Cabecera Server-Timing: duraciones en milisegundos
+        partes = [
+            'galaxy;dur={:.1f};desc="{} llamadas, {} bytes"'.format(
+                self.segundos * 1000, len(self.llamadas), self.bytes
+            ),
+            "galaxy-limiter;dur={:.1f}".format(self.espera * 1000),
+            "total;dur={:.1f}".format(total * 1000),
+        ]
+        return ", ".join(partes)
+
+    def informar(self, ruta, total):
+        lenta = settings.GALAXY_TRAZA_LENTA
+        for llamada in self.llamadas:
+            if llamada["seconds"] >= lenta:
+                log.warning(
+                    "%s: %s %s tardo %.2f s (%s, %s bytes)", ruta, llamada["method"], llamada["endpoint"],
+                    llamada["seconds"], llamada["status"], llamada["response_bytes"],
+                )
+        for endpoint, veces in self.repetidas(settings.GALAXY_TRAZA_REPETIDAS).items():
+            log.warning("%s: %s llamado %s veces en la misma peticion", ruta, endpoint, veces)
+        if self.llamadas:
+            log.debug(
+                "%s: %s llamadas a Galaxy, %.3f s de %.3f s", ruta, len(self.llamadas), self.segundos, total
+            )
+
+
+def iniciar_traza():
+    traza = TrazaGalaxy()
+    return traza, _traza_actual.set(traza)
+
+def terminar_traza(token):
+    _traza_actual.reset(token)
+
+def registrar_llamada(metodo, ruta, segundos, espera=0, enviados=0, recibidos=0, estado=""):
+    traza = _traza_actual.get()
+    if traza is not None:
+        traza.registrar(metodo, ruta, segundos, espera, enviados, recibidos, estado)
+
+def tamano_cuerpo(data):
+    # Bytes de lo que se envia: json, bytes o un MultipartEncoder
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode())
+    return getattr(data, "len", 0) or 0
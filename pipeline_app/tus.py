@@ -0,0 +1,105 @@
+import logging
+import time
+from base64 import b64encode
+from urllib.parse import urljoin
+
+from bioblend import ConnectionError
+
+log = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+
+
+class SesionTus:
+    # Cliente tus minimo que recibe los datos por partes, a medida que
+    # llegan, en lugar de leerlos de un archivo en disco como tuspy.
+
+    def __init__(self, gi, longitud=None, metadata=None, url=None, reintentos=5, espera=2):
+        self.gi = gi
+        self.longitud = longitud
+        self.metadata = metadata or {}
+        self.url = url
+        self.offset = 0
+        self.reintentos = reintentos
+        self.espera = espera
+
+    @property
+    def session_id(self):
+        return self.url.rsplit("/", 1)[1]
+
+    def _headers(self, **extra):
+        headers = {"Tus-Resumable": TUS_VERSION, "x-api-key": self.gi.key}
+        headers.update(extra)
+        return headers
+
+    def _metadata(self):
+        return ",".join(
+            f"{clave} {b64encode(str(valor).encode()).decode('ascii')}"
+            for clave, valor in self.metadata.items()
+        )
+
+    def crear(self):
+        endpoint = f"{self.gi.url}/upload/resumable_upload/"
+        headers = self._headers()
+        if self.longitud is not None:
+            headers["Upload-Length"] = str(self.longitud)
+        else:
+            headers["Upload-Defer-Length"] = "1"
+        if self.metadata:
+            headers["Upload-Metadata"] = self._metadata()
+
+        r = self.gi.peticion("POST", endpoint, headers=headers)
+        ubicacion = r.headers.get("Location")
+        if r.status_code != 201 or not ubicacion:
+            raise ConnectionError(
+                f"No se pudo crear la sesion tus: {r.status_code}", body=r.text, status_code=r.status_code
+            )
+        self.url = urljoin(endpoint, ubicacion)
+        self.offset = 0
+        return self
+
+    def consultar_offset(self):
+        r = self.gi.peticion("HEAD", self.url, headers=self._headers())
+        if r.status_code not in (200, 204) or "Upload-Offset" not in r.headers:
+            raise ConnectionError(
+                f"No se pudo consultar la sesion tus: {r.status_code}", body=r.text, status_code=r.status_code
+            )
+        self.offset = int(r.headers["Upload-Offset"])
+        return self.offset
+
+    def enviar(self, datos, final=False):
+        # datos empieza en self.offset. Si la conexion se corta se pregunta al
+        # servidor hasta donde llego y se reenvia solo lo que falta.
+        inicio = self.offset
+        fin = inicio + len(datos)
+        intentos = 0
+
+        while self.offset < fin or (final and self.longitud is None):
+            headers = self._headers(**{
+                "Upload-Offset": str(self.offset),
+                "Content-Type": "application/offset+octet-stream",
+            })
+            if final and self.longitud is None:
+                # Con longitud diferida se informa en el ultimo PATCH
+                headers["Upload-Length"] = str(fin)
+
+            try:
+                r = self.gi.peticion("PATCH", self.url, data=datos[self.offset - inicio:], headers=headers)
+                if r.status_code != 204:
+                    raise ConnectionError(
+                        f"Respuesta inesperada del servidor tus: {r.status_code}",
+                        body=r.text, status_code=r.status_code,
+                    )
+                self.offset = int(r.headers.get("Upload-Offset", fin))
+                if final and self.longitud is None:
+                    self.longitud = fin
+            except Exception as e:
+                intentos += 1
+                if intentos > self.reintentos:
+                    raise
+                log.warning("Fallo el envio tus en el offset %s (%s), reintentando", self.offset, e)
+                time.sleep(self.espera * intentos)
+                if self.consultar_offset() < inicio:
+                    raise ConnectionError("El servidor tus perdio datos ya confirmados") from e
+
+        return self.offset
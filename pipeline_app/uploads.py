@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .fastq import AnalizadorFastq, es_fastq
+from .galaxy_client import obtener_cliente, obtener_cliente_sesion
+from .metricas import obtener_registro
+from .tus import SesionTus
+
+log = logging.getLogger(__name__)
+
+# Tiempo que se recuerda una sesion tus incompleta para poder retomarla
+VIGENCIA_SESION_TUS = 24 * 60 * 60
+# Marca de una sesion que esta recibiendo datos; se renueva con cada PATCH y
+# vence sola si el proceso muere a mitad de la subida
+VIGENCIA_EN_USO = 10 * 60
+
+
+class ArchivoEnGalaxy(UploadedFile):
+    # Archivo que ya quedo en una sesion tus de Galaxy; no tiene contenido local
+
+    def __init__(self, name, content_type, size, charset, session_id, calidad=None):
+        super().__init__(file=None, name=name, content_type=content_type, size=size, charset=charset)
+        self.session_id = session_id
+        # Resumen de AnalizadorFastq si el archivo es un FASTQ
+        self.calidad = calidad
+
+    @property
+    def errores(self):
+        return self.calidad["errors"] if self.calidad else []
+
+    def __repr__(self):
+        return f"<ArchivoEnGalaxy: {self.name} ({self.session_id})>"
+
+
+class GalaxyTusUploadHandler(FileUploadHandler):
+    # Envia cada archivo del formulario a Galaxy por tus a medida que llega
+    # en el cuerpo de la peticion, sin guardarlo en memoria ni en disco.
+    #
+    # Si el navegador indica el tamano en ?tamano=<bytes>, la sesion se
+    # recuerda por nombre, tamano, el id de subida opcional ?subida=<id> y una
+    # huella del primer trozo del contenido: al reintentar una subida cortada
+    # se descarta lo que Galaxy ya confirmo y se continua desde ese offset. Un
+    # archivo distinto con el mismo nombre y tamano no retoma una sesion ajena,
+    # y dos subidas simultaneas del mismo archivo usan sesiones distintas.
+    #
+    # Los FASTQ se revisan en la misma pasada; si estan danados se deja de
+    # enviar y la sesion no se completa, asi nunca llegan a la historia.
+
+    def __init__(self, request=None, gi=None):
+        super().__init__(request)
+        self.gi = gi or (obtener_cliente_sesion(request) if request else obtener_cliente())
+        self.tamano_parte = settings.GALAXY_TUS_CHUNK
+
+    def _longitud_declarada(self):
+        tamano = self.request.GET.get("tamano") if self.request else None
+        return int(tamano) if tamano and tamano.isdigit() else None
+
+    def _id_declarado(self):
+        subida = self.request.GET.get("subida", "") if self.request else ""
+        return subida if subida.isalnum() and len(subida) <= 64 else ""
+
+    def _clave_sesion(self, longitud, primer_trozo):
+        if longitud is None:
+            return None
+        contenido = hashlib.sha256(primer_trozo).hexdigest()
+        huella = hashlib.sha256(
+            f"{self.gi.base_url}|{self.gi.key}|{self.file_name}|{longitud}|{self._id_declarado()}|{contenido}".encode()
+        ).hexdigest()
+        return f"tus:{huella}"
+
+    def _abrir_sesion(self, longitud, primer_trozo):
+        self.clave = self._clave_sesion(longitud, primer_trozo)
+        if self.clave and not cache.add(f"{self.clave}:en_uso", True, VIGENCIA_EN_USO):
+            # Otra peticion esta subiendo el mismo archivo: sesion propia y sin retomar
+            log.info("%s ya se esta subiendo en otra peticion, se usa una sesion nueva", self.file_name)
+            self.clave = None
+
+        url = cache.get(self.clave) if self.clave else None
+        if url:
+            sesion = SesionTus(self.gi, longitud, url=url)
+            try:
+                sesion.consultar_offset()
+                log.info("Retomando la subida de %s desde el byte %s", self.file_name, sesion.offset)
+                return sesion
+            except Exception:
+                log.info("La sesion tus de %s ya no existe, se crea una nueva", self.file_name)
+
+        sesion = SesionTus(self.gi, longitud, metadata={"filename": self.file_name}).crear()
+        if self.clave:
+            cache.set(self.clave, sesion.url, VIGENCIA_SESION_TUS)
+        return sesion
+
+    def _liberar(self, olvidar):
+        if self.clave:
+            cache.delete(f"{self.clave}:en_uso")
+            if olvidar:
+                cache.delete(self.clave)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.longitud = content_length or self._longitud_declarada()
+        # La sesion se abre con el primer trozo, que entra en la clave
+        self.clave = None
+        self.sesion = None
+        self.buffer = bytearray()
+        self.inicio = time.monotonic()
+        self.offset_inicial = 0
+        self.analizador = AnalizadorFastq() if es_fastq(file_name) else None
+
+    def _preparar_sesion(self, primer_trozo):
+        self.sesion = self._abrir_sesion(self.longitud, primer_trozo)
+        self.offset_inicial = self.sesion.offset
+
+    def _enviar(self, final=False):
+        self.sesion.enviar(bytes(self.buffer), final=final)
+        self.buffer.clear()
+        if self.clave and not final:
+            cache.touch(f"{self.clave}:en_uso", VIGENCIA_EN_USO)
+
+    def receive_data_chunk(self, raw_data, start):
+        # El analizador ve el archivo entero, tambien lo que no se reenvia
+        if self.analizador is not None:
+            if not self.analizador.fatal:
+                self.analizador.agregar(raw_data)
+            if self.analizador.fatal:
+                self.buffer.clear()
+                return None
+
+        if self.sesion is None:
+            self._preparar_sesion(raw_data)
+
+        # Lo que Galaxy ya tiene de un intento anterior no se reenvia
+        confirmado = self.sesion.offset + len(self.buffer)
+        if start + len(raw_data) <= confirmado:
+            return None
+        if start < confirmado:
+            raw_data = raw_data[confirmado - start:]
+
+        self.buffer += raw_data
+        if len(self.buffer) >= self.tamano_parte:
+            self._enviar()
+        return None
+
+    def file_complete(self, file_size):
+        calidad = self.analizador.terminar() if self.analizador is not None else None
+        if calidad and calidad["errors"]:
+            log.warning("%s rechazado: %s", self.file_name, "; ".join(calidad["errors"]))
+            self.buffer.clear()
+            self._liberar(olvidar=True)
+            return ArchivoEnGalaxy(
+                name=self.file_name,
+                content_type=self.content_type,
+                size=file_size,
+                charset=self.charset,
+                session_id=None,
+                calidad=calidad,
+            )
+
+        if self.sesion is None:
+            # Archivo vacio: no llego ningun trozo
+            self._preparar_sesion(b"")
+        self._enviar(final=True)
+        self._liberar(olvidar=True)
+
+        registro = obtener_registro()
+        registro.observar("galaxy_upload_duration_seconds", time.monotonic() - self.inicio)
+        registro.contar("galaxy_upload_bytes_total", self.sesion.offset - self.offset_inicial)
+
+        return ArchivoEnGalaxy(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            session_id=self.sesion.session_id,
+            calidad=calidad,
+        )
+
+    def upload_interrupted(self):
+        # La sesion queda en Galaxy para retomarla en el siguiente intento
+        sesion = getattr(self, "sesion", None)
+        if sesion is not None:
+            log.info("Subida de %s interrumpida en el byte %s", self.file_name, sesion.offset)
+            self._liberar(olvidar=False)
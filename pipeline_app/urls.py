@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("ejecucion/<int:run_id>/", views.estado_ejecucion, name="estado_ejecucion"),
+    path("ejecucion/<int:run_id>/json/", views.estado_ejecucion_json, name="estado_ejecucion_json"),
+    path("ejecucion/<int:run_id>/reanudar/", views.reanudar, name="reanudar_ejecucion"),
+    path("ejecucion/<int:run_id>/eventos/", views.eventos_ejecucion, name="eventos_ejecucion"),
+    path("lote/", views.ejecutar_lote, name="ejecutar_lote"),
+    path("lote/<int:batch_id>/", views.estado_lote, name="estado_lote"),
+    path("lote/<int:batch_id>/json/", views.estado_lote_json, name="estado_lote_json"),
+]
@@ -0,0 +1,197 @@
+from bioblend import ConnectionError
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from . import cache as galaxy_cache
+from .eventos import flujo_eventos, flujo_eventos_wsgi
+from .galaxy_client import obtener_cliente_sesion
+from .lotes import ErrorHojaMuestras, crear_lote, leer_hoja_muestras, resolver_datasets, resumen_lote
+from .metricas import desglose_tiempos, exposicion, obtener_registro
+from .models import PipelineBatch, PipelineRun, PipelineStep
+from .worker import reanudar_ejecucion
+
+
+def _propios(modelo, user):
+    # Ejecuciones y lotes del usuario: corren con su API key de Galaxy y nadie
+    # mas los ve. Los anonimos usan la API key del servidor
+    if user.is_authenticated:
+        return modelo.objects.filter(user=user)
+    return modelo.objects.filter(user__isnull=True)
+
+def estado_ejecucion(request, run_id):
+    run = get_object_or_404(_propios(PipelineRun, request.user), pk=run_id)
+
+    if run.state == PipelineRun.OK:
+        return render(request, "resultado_fastqc.html", {
+            "history_id": run.history_id,
+            "job_results": run.results
+        })
+
+    if run.state == PipelineRun.ERROR:
+        return render(request, "error.html", {
+            "mensaje": run.error,
+            "reanudar_url": reverse("reanudar_ejecucion", args=[run.pk]) if request.user.is_authenticated else None,
+        })
+
+    return render(request, "estado_ejecucion.html", {
+        "run": run,
+        "pasos": run.steps.all(),
+        "ultimo_evento": run.events.order_by("-id").values_list("id", flat=True).first() or 0,
+        "keepalive": settings.PIPELINE_SSE_KEEPALIVE,
+    })
+
+def _tiempos_paso(paso):
+    return {
+        "galaxy_created_at": paso.galaxy_created_at,
+        "galaxy_started_at": paso.galaxy_started_at,
+        "galaxy_finished_at": paso.galaxy_finished_at,
+        "observed_at": paso.observed_at,
+    }
+
+def estado_ejecucion_json(request, run_id):
+    run = get_object_or_404(_propios(PipelineRun, request.user), pk=run_id)
+
+    pasos = [
+        {
+            "name": paso.name,
+            "state": paso.state,
+            "job_id": paso.job_id,
+            "cached": paso.cached,
+            "checkpoint": paso.output is not None,
+            "error": paso.error,
+            "started_at": paso.started_at,
+            "finished_at": paso.finished_at,
+            **_tiempos_paso(paso),
+            # Segundos de envio, cola, ejecucion y demora del poller
+            "timing": desglose_tiempos(paso.started_at, _tiempos_paso(paso)),
+        }
+        for paso in run.steps.all()
+    ]
+
+    # Suma de cada parte en todos los pasos; los pasos en paralelo se solapan,
+    # por eso wall puede ser menor que la suma
+    totales = {
+        parte: sum(paso["timing"][parte] or 0 for paso in pasos)
+        for parte in ("submit", "queue", "run", "poll_delay")
+    }
+    if run.started_at and run.finished_at:
+        totales["wall"] = (run.finished_at - run.started_at).total_seconds()
+
+    return JsonResponse({
+        "run_id": run.pk,
+        "state": run.state,
+        "history_id": run.history_id,
+        "error": run.error,
+        "timing": totales,
+        "steps": pasos,
+        "results": run.results,
+    })
+
+def metricas(request):
+    # Formato de texto de Prometheus: histogramas de todos los procesos y el
+    # estado actual de la cola
+    ejecuciones = PipelineRun.objects.values_list("state").annotate(total=Count("id")).order_by()
+    pasos = PipelineStep.objects.values_list("name", "state").annotate(total=Count("id")).order_by()
+    medidores = [
+        ("pipeline_runs", "Ejecuciones por estado",
+         [({"state": estado}, total) for estado, total in ejecuciones]),
+        ("pipeline_steps", "Pasos por nombre y estado",
+         [({"step": nombre, "state": estado}, total) for nombre, estado, total in pasos]),
+    ]
+    return HttpResponse(
+        exposicion(obtener_registro().leer(), medidores),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+@login_required
+@require_POST
+def reanudar(request, run_id):
+    # Reenvia jobs con la cuota de Galaxy del dueno: solo el puede hacerlo
+    run = get_object_or_404(_propios(PipelineRun, request.user), pk=run_id)
+    reanudar_ejecucion(run.pk)
+    return redirect("estado_ejecucion", run_id=run.pk)
+
+async def eventos_ejecucion(request, run_id):
+    # Server-Sent Events con cada cambio de estado de la ejecucion y sus pasos
+    user = await request.auser()
+    if not await _propios(PipelineRun, user).filter(pk=run_id).aexists():
+        raise Http404("Ejecucion no encontrada")
+
+    # El navegador manda Last-Event-ID al reconectarse
+    desde = request.headers.get("Last-Event-ID") or request.GET.get("desde") or "0"
+    desde = int(desde) if desde.isdigit() else 0
+
+    # Bajo WSGI un generador async se consume entero antes de responder
+    flujo = flujo_eventos(run_id, desde) if isinstance(request, ASGIRequest) else flujo_eventos_wsgi(run_id, desde)
+    response = StreamingHttpResponse(flujo, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def ejecutar_lote(request):
+    # Corre el pipeline para cada fila de una hoja de muestras (CSV o TSV con
+    # muestra, R1, R2 y referencia, por id o nombre de dataset)
+    gi = obtener_cliente_sesion(request)
+    historias = galaxy_cache.obtener_historias(gi)
+    context = {
+        "historias": historias,
+        "concurrencia": settings.PIPELINE_LOTE_CONCURRENCIA,
+        "concurrencia_maxima": settings.PIPELINE_LOTE_MAX_CONCURRENCIA,
+    }
+
+    if request.method == "POST":
+        history_id = request.POST.get("history_id")
+        hoja = request.FILES.get("hoja_muestras")
+        concurrencia = request.POST.get("concurrencia", "")
+        concurrencia = int(concurrencia) if concurrencia.isdigit() and int(concurrencia) > 0 \
+            else settings.PIPELINE_LOTE_CONCURRENCIA
+
+        historia = next((h for h in historias if h["id"] == history_id), None)
+        if historia is None or hoja is None:
+            context["errores"] = ["Selecciona una historia y una hoja de muestras."]
+            return render(request, "ejecutar_lote.html", context)
+        if concurrencia > settings.PIPELINE_LOTE_MAX_CONCURRENCIA:
+            context["errores"] = [
+                f"Se pueden correr como maximo {settings.PIPELINE_LOTE_MAX_CONCURRENCIA} muestras a la vez."
+            ]
+            return render(request, "ejecutar_lote.html", context)
+
+        try:
+            filas = leer_hoja_muestras(hoja.read())
+            muestras = resolver_datasets(filas, galaxy_cache.obtener_contenidos(gi, history_id))
+        except ErrorHojaMuestras as e:
+            context["errores"] = e.errores
+            return render(request, "ejecutar_lote.html", context)
+
+        try:
+            lote = crear_lote(
+                muestras,
+                history_id,
+                history_name=historia["name"],
+                nombre=hoja.name,
+                concurrencia=concurrencia,
+                user=request.user if request.user.is_authenticated else None,
+                colecciones=request.POST.get("colecciones") == "on",
+                gi=gi,
+            )
+        except ConnectionError as e:
+            # Galaxy rechazo la creacion de alguna coleccion
+            context["errores"] = [f"No se pudo crear la coleccion en Galaxy: {e}"]
+            return render(request, "ejecutar_lote.html", context)
+        return redirect("estado_lote", batch_id=lote.pk)
+
+    return render(request, "ejecutar_lote.html", context)
+
+def estado_lote(request, batch_id):
+    lote = get_object_or_404(_propios(PipelineBatch, request.user), pk=batch_id)
+    return render(request, "estado_lote.html", {"lote": lote, "resumen": resumen_lote(lote)})
+
+def estado_lote_json(request, batch_id):
+    lote = get_object_or_404(_propios(PipelineBatch, request.user), pk=batch_id)
+    return JsonResponse(resumen_lote(lote))
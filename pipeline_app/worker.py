@@ -0,0 +1,200 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .dag import EjecucionCancelada
+from .eventos import registrar_evento
+from .models import PipelineBatch, PipelineRun
+from .pipeline import ejecutar_pipeline
+
+log = logging.getLogger(__name__)
+
+
+def nuevo_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _disponibles(ahora):
+    # En cola, o reclamadas por un worker cuyo lease ya vencio
+    return Q(state=PipelineRun.QUEUED) | Q(state=PipelineRun.RUNNING, lease_expires_at__lt=ahora)
+
+def _lotes_llenos(ahora):
+    # Lotes que ya tienen tantas ejecuciones vivas como su concurrencia
+    return (
+        PipelineBatch.objects.annotate(
+            activas=Count("runs", filter=Q(runs__state=PipelineRun.RUNNING, runs__lease_expires_at__gte=ahora))
+        )
+        .filter(activas__gte=F("concurrency"))
+        .values("id")
+    )
+
+def reclamar_ejecucion(worker_id):
+    ahora = timezone.now()
+    lease = timedelta(seconds=settings.PIPELINE_LEASE_SEGUNDOS)
+
+    candidatos = list(
+        PipelineRun.objects.filter(_disponibles(ahora))
+        .exclude(batch__in=_lotes_llenos(ahora))
+        .order_by("created_at")
+        .values_list("id", flat=True)[:10]
+    )
+
+    for run_id in candidatos:
+        # El UPDATE condicional es atomico: solo un worker puede ganar la ejecucion,
+        # y el lote se vuelve a comprobar en la misma sentencia
+        reclamadas = PipelineRun.objects.filter(_disponibles(ahora), pk=run_id).exclude(
+            batch__in=_lotes_llenos(ahora)
+        ).update(
+            state=PipelineRun.RUNNING,
+            worker_id=worker_id,
+            lease_expires_at=ahora + lease,
+            attempts=F("attempts") + 1,
+        )
+        if reclamadas:
+            return PipelineRun.objects.get(pk=run_id)
+
+    return None
+
+def renovar_lease(run_id, worker_id):
+    lease = timedelta(seconds=settings.PIPELINE_LEASE_SEGUNDOS)
+    renovadas = PipelineRun.objects.filter(
+        pk=run_id, worker_id=worker_id, state=PipelineRun.RUNNING
+    ).update(lease_expires_at=timezone.now() + lease)
+    return renovadas == 1
+
+class Heartbeat(threading.Thread):
+    # Renueva el lease mientras el pipeline sigue corriendo. Si lo pierde
+    # (otro worker reclamo la ejecucion) avisa con `perdido` para que el
+    # pipeline deje de enviar jobs y no corra dos veces
+
+    def __init__(self, run_id, worker_id):
+        super().__init__(daemon=True)
+        self.run_id = run_id
+        self.worker_id = worker_id
+        self.detener = threading.Event()
+        self.perdido = threading.Event()
+
+    def run(self):
+        intervalo = settings.PIPELINE_LEASE_SEGUNDOS / 3
+        try:
+            while not self.detener.wait(intervalo):
+                try:
+                    renovado = renovar_lease(self.run_id, self.worker_id)
+                except Exception:
+                    # Un error de la base no es perder el lease: se reintenta
+                    log.exception("No se pudo renovar el lease de la ejecucion %s", self.run_id)
+                    continue
+                if not renovado:
+                    log.warning("Se perdio el lease de la ejecucion %s", self.run_id)
+                    self.perdido.set()
+                    break
+        finally:
+            close_old_connections()
+
+def procesar_ejecucion(run, worker_id):
+    if run.attempts > settings.PIPELINE_MAX_INTENTOS:
+        error = "Se supero el numero maximo de intentos."
+        PipelineRun.objects.filter(pk=run.pk, worker_id=worker_id).update(
+            state=PipelineRun.ERROR,
+            error=error,
+            finished_at=timezone.now(),
+        )
+        registrar_evento(run.pk, "", PipelineRun.ERROR, error=error)
+        return
+
+    if run.started_at is None:
+        run.started_at = timezone.now()
+        run.save(update_fields=["started_at"])
+
+    registrar_evento(run.pk, "", PipelineRun.RUNNING, worker_id=worker_id, attempt=run.attempts,
+                     started_at=run.started_at.isoformat())
+
+    heartbeat = Heartbeat(run.pk, worker_id)
+    heartbeat.start()
+    try:
+        results = ejecutar_pipeline(run, cancelado=heartbeat.perdido)
+    except EjecucionCancelada:
+        # La ejecucion ya es de otro worker: el estado final lo escribe el
+        log.warning("Ejecucion %s abandonada por %s", run.pk, worker_id)
+        return
+    except Exception as e:
+        log.exception("Fallo la ejecucion %s", run.pk)
+        estado, error, results = PipelineRun.ERROR, str(e), {}
+    else:
+        estado, error = PipelineRun.OK, ""
+    finally:
+        heartbeat.detener.set()
+        heartbeat.join()
+
+    ahora = timezone.now()
+    actualizadas = PipelineRun.objects.filter(pk=run.pk, worker_id=worker_id).update(
+        state=estado,
+        error=error,
+        results=results,
+        lease_expires_at=None,
+        finished_at=ahora,
+    )
+    # Si otro worker reclamo la ejecucion, el evento final es suyo
+    if actualizadas:
+        registrar_evento(run.pk, "", estado, error=error, finished_at=ahora.isoformat(),
+                         duration=(ahora - run.started_at).total_seconds())
+
+def reanudar_ejecucion(run_id):
+    # Vuelve a poner en cola una ejecucion fallida; el worker que la tome
+    # parte de los checkpoints de los pasos que ya terminaron
+    reanudadas = PipelineRun.objects.filter(pk=run_id, state=PipelineRun.ERROR).update(
+        state=PipelineRun.QUEUED,
+        error="",
+        # La invocacion fallida no se retoma; lo que falta corre paso a paso
+        invocation_id="",
+        worker_id="",
+        lease_expires_at=None,
+        attempts=0,
+        finished_at=None,
+    )
+    if reanudadas:
+        registrar_evento(run_id, "", PipelineRun.QUEUED, resumed=True)
+    return reanudadas == 1
+
+def bucle_worker(worker_id=None, una_vez=False, hilos=1):
+    # Con varios hilos un mismo proceso lleva varias ejecuciones a la vez; casi
+    # todo el tiempo se espera a Galaxy y el poller del proceso es compartido
+    worker_id = worker_id or nuevo_worker_id()
+    if hilos <= 1:
+        _bucle(worker_id, una_vez)
+        return
+
+    threads = [
+        threading.Thread(target=_bucle, args=(f"{worker_id}/{i}", una_vez), daemon=True)
+        for i in range(hilos)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def _bucle(worker_id, una_vez):
+    log.info("Worker %s iniciado", worker_id)
+
+    try:
+        while True:
+            close_old_connections()
+            run = reclamar_ejecucion(worker_id)
+
+            if run is None:
+                if una_vez:
+                    return
+                time.sleep(settings.PIPELINE_INTERVALO_SONDEO)
+                continue
+
+            log.info("Worker %s ejecutando %s", worker_id, run.pk)
+            procesar_ejecucion(run, worker_id)
+    finally:
+        close_old_connections()
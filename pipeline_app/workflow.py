@@ -0,0 +1,296 @@
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from bioblend import ConnectionError
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import huella_usuario
+from .dag import INTERVALO_CANCELACION, EjecucionCancelada, PasoFallido
+from .poller import obtener_poller, tiempos_job
+
+log = logging.getLogger(__name__)
+
+NOMBRE_WORKFLOW = "galaxy_test pipeline"
+# Entradas del workflow, en el orden de sus pasos 0, 1 y 2
+ENTRADAS = ["dataset_r1", "dataset_r2", "genoma"]
+ESTADOS_INVOCACION_FALLIDA = {"failed", "cancelled", "cancelling"}
+
+
+class Conexion:
+    # Valor simbolico: la salida `salida` del paso `indice` del workflow
+    def __init__(self, indice, salida):
+        self.indice = indice
+        self.salida = salida
+
+
+class _SalidasSimbolicas(dict):
+    # outputs de show_job para un paso que todavia no corrio: cada salida
+    # pedida por los recoger es una Conexion a ese paso
+    def __init__(self, indice):
+        super().__init__()
+        self.indice = indice
+
+    def get(self, nombre, default=None):
+        return {"id": Conexion(self.indice, nombre)}
+
+    def __getitem__(self, nombre):
+        return self.get(nombre)
+
+
+def _fuera_del_workflow(paso):
+    # Salvo con PIPELINE_QUAST = "antes" nadie espera a QUAST: dentro del
+    # workflow la invocacion no terminaria hasta que termine y frenaria a
+    # la seleccion y a Augustus. El DAG lo envia despues, en paralelo
+    return paso.nombre.startswith("quast_") and settings.PIPELINE_QUAST != "antes"
+
+def pasos_workflow(pasos):
+    # Pasos de herramienta que Galaxy puede encadenar solo: los que no
+    # dependen, ni siquiera indirectamente, de un paso local
+    fuera = set()
+    incluidos = []
+    for paso in pasos:
+        if paso.local or _fuera_del_workflow(paso) or fuera.intersection(paso.dependencias):
+            fuera.add(paso.nombre)
+        else:
+            incluidos.append(paso)
+    return incluidos
+
+def _estado_herramienta(tool_inputs):
+    # "a|b": valor -> {"a": {"b": valor}}; los datasets pasan a ser conexiones
+    estado = {}
+    conexiones = {}
+    for clave, valor in tool_inputs.items():
+        if isinstance(valor, dict) and isinstance(valor.get("id"), Conexion):
+            conexiones[clave] = {"id": valor["id"].indice, "output_name": valor["id"].salida}
+            valor = {"__class__": "ConnectedValue"}
+        *ramas, hoja = clave.split("|")
+        nodo = estado
+        for rama in ramas:
+            nodo = nodo.setdefault(rama, {})
+        nodo[hoja] = valor
+    return estado, conexiones
+
+def definicion_workflow(pasos):
+    # Arma el .ga a partir de los mismos Paso que usa el DAG, evaluando cada
+    # herramienta con un contexto simbolico. Devuelve (definicion, {nombre: indice})
+    incluidos = pasos_workflow(pasos)
+    con_dependientes = {dep for paso in incluidos for dep in paso.dependencias}
+
+    steps = {}
+    ctx = {"entradas": {}}
+    for indice, entrada in enumerate(ENTRADAS):
+        steps[str(indice)] = {
+            "id": indice,
+            "type": "data_input",
+            "label": entrada,
+            "tool_id": None,
+            "tool_state": json.dumps({"optional": False}),
+            "inputs": [{"name": entrada, "description": ""}],
+            "input_connections": {},
+            "outputs": [],
+            "position": {"left": 0, "top": 200 * indice},
+            "annotation": "",
+            "workflow_outputs": [],
+        }
+        ctx["entradas"][entrada] = Conexion(indice, "output")
+
+    indices = {}
+    for paso in incluidos:
+        indice = len(steps)
+        tool_id, tool_inputs = paso.herramienta(ctx)
+        estado, conexiones = _estado_herramienta(tool_inputs)
+        steps[str(indice)] = {
+            "id": indice,
+            "type": "tool",
+            "label": paso.nombre,
+            "tool_id": tool_id,
+            "tool_version": tool_id.rsplit("/", 1)[1] if "/repos/" in tool_id else None,
+            "tool_state": json.dumps(estado, sort_keys=True),
+            "input_connections": conexiones,
+            "inputs": [],
+            "outputs": [],
+            "position": {"left": 250 * indice, "top": 0},
+            "annotation": "",
+            "post_job_actions": {},
+            "workflow_outputs": [],
+        }
+        indices[paso.nombre] = indice
+        # Solo hace falta el recoger de los pasos cuyas salidas usa otro paso del workflow
+        if paso.recoger and paso.nombre in con_dependientes:
+            ctx[paso.nombre] = paso.recoger(None, _SalidasSimbolicas(indice), ctx)
+
+    definicion = {
+        "a_galaxy_workflow": "true",
+        "format-version": "0.1",
+        "annotation": "FastQC, Bowtie2, Trimmomatic, Shovill y QUAST",
+        "steps": steps,
+    }
+    return definicion, indices
+
+def obtener_workflow(gi, definicion, renovar=False):
+    # El workflow se crea una sola vez por usuario y contenido: el nombre
+    # lleva el hash de la definicion
+    huella = hashlib.sha256(json.dumps(definicion, sort_keys=True).encode()).hexdigest()
+    nombre = f"{NOMBRE_WORKFLOW} {huella[:12]}"
+    clave = f"workflow:{huella_usuario(gi)}:{huella}"
+
+    workflow_id = None if renovar else cache.get(clave)
+    if workflow_id is None:
+        existentes = gi.workflows.get_workflows(name=nombre)
+        if existentes and not renovar:
+            workflow_id = existentes[0]["id"]
+        else:
+            workflow_id = gi.workflows.import_workflow_dict({**definicion, "name": nombre})["id"]
+            log.info("Workflow %s registrado en Galaxy como %s", nombre, workflow_id)
+        cache.set(clave, workflow_id, None)
+    return workflow_id
+
+
+class InvocacionPipeline:
+    # Corre los pasos encadenables como una sola invocacion de workflow:
+    # Galaxy agenda cada paso apenas termina el anterior, sin pasar por el
+    # servidor. Aca solo se siguen los jobs de cada paso con el poller
+    # compartido y se recogen sus salidas como en EjecutorDag.
+
+    def __init__(self, gi, history_id, pasos, ctx, hechos=None, poller=None, al_invocar=None,
+                 al_enviar=None, al_estado=None, al_terminar=None, al_fallar=None, cancelado=None):
+        self.gi = gi
+        self.history_id = history_id
+        self.pasos = {paso.nombre: paso for paso in pasos}
+        self.definicion, self.indices = definicion_workflow(pasos)
+        self.ctx = ctx
+        self.hechos = hechos or {}
+        self.poller = poller or obtener_poller(gi)
+        self.al_invocar = al_invocar
+        self.al_enviar = al_enviar
+        self.al_estado = al_estado
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.cancelado = cancelado
+        self.invocation_id = None
+
+    def invocar(self):
+        inputs = {
+            str(indice): {"src": "hda", "id": self.ctx["entradas"][entrada]}
+            for indice, entrada in enumerate(ENTRADAS)
+        }
+        for intento in range(2):
+            workflow_id = obtener_workflow(self.gi, self.definicion, renovar=intento > 0)
+            try:
+                invocacion = self.gi.workflows.invoke_workflow(
+                    workflow_id,
+                    inputs=inputs,
+                    history_id=self.history_id,
+                    inputs_by="step_index",
+                    allow_tool_state_corrections=True,
+                )
+                break
+            except ConnectionError as e:
+                # El workflow cacheado pudo haberse borrado en Galaxy
+                if intento or e.status_code not in (400, 403, 404):
+                    raise
+                log.warning("No se pudo invocar el workflow %s, se registra de nuevo: %s", workflow_id, e)
+
+        self.invocation_id = invocacion["id"]
+        log.info("Workflow invocado como %s", self.invocation_id)
+        if self.al_invocar:
+            self.al_invocar(self.invocation_id)
+
+    def cancelar(self):
+        try:
+            self.gi.invocations.cancel_invocation(self.invocation_id)
+        except Exception as e:
+            log.warning("No se pudo cancelar la invocacion %s: %s", self.invocation_id, e)
+
+    def fallar(self, nombre, error):
+        # Los pasos siguientes quedarian pausados en Galaxy: se cancela todo
+        if self.al_fallar:
+            self.al_fallar(nombre, error)
+        self.cancelar()
+        raise PasoFallido(nombre, error)
+
+    def seguir(self, nombre, job_id):
+        if self.al_enviar:
+            self.al_enviar(nombre, job_id)
+        al_cambiar = None
+        if self.al_estado:
+            al_cambiar = lambda job_id, estado, nombre=nombre: self.al_estado(nombre, job_id, estado)
+        return self.poller.seguir(job_id, self.history_id, al_cambiar=al_cambiar)
+
+    def job_terminado(self, nombre, job_id, resumen):
+        if resumen.get("state") != "ok":
+            mensaje = f"El job {job_id} termino en estado {resumen.get('state')}"
+            if resumen.get("error"):
+                # El poller no pudo consultarlo (por ejemplo, un job purgado)
+                mensaje += f": {resumen['error']}"
+            self.fallar(nombre, Exception(mensaje))
+
+        outputs = self.gi.jobs.show_job(job_id).get("outputs", {})
+        salida = {
+            "job_id": job_id,
+            "outputs": outputs,
+            "output_datasets": list(outputs.values()),
+            "tiempos": tiempos_job(resumen),
+        }
+        paso = self.pasos[nombre]
+        try:
+            if paso.recoger:
+                salida.update(paso.recoger(self.gi, outputs, self.ctx))
+        except Exception as e:
+            self.fallar(nombre, e)
+
+        self.ctx[nombre] = salida
+        if self.al_terminar:
+            self.al_terminar(nombre, salida)
+
+    def ejecutar(self, invocation_id=None):
+        # Con invocation_id se retoma una invocacion ya enviada (por ejemplo
+        # cuando otro worker perdio el lease) en lugar de invocar de nuevo
+        for nombre, salida in self.hechos.items():
+            self.ctx[nombre] = salida
+        if invocation_id:
+            self.invocation_id = invocation_id
+        else:
+            self.invocar()
+
+        por_indice = {indice: nombre for nombre, indice in self.indices.items()}
+        sin_job = set(self.indices) - set(self.hechos)
+        futuros = {}
+        intervalo = settings.PIPELINE_INVOCACION_SONDEO
+
+        while sin_job or futuros:
+            # Otro worker retoma la invocacion con su invocation_id
+            if self.cancelado is not None and self.cancelado.is_set():
+                raise EjecucionCancelada()
+            if sin_job:
+                # Galaxy crea los jobs de cada paso a medida que agenda la invocacion
+                invocacion = self.gi.invocations.show_invocation(self.invocation_id)
+                if invocacion.get("state") in ESTADOS_INVOCACION_FALLIDA:
+                    nombre = min(sin_job, key=self.indices.get)
+                    self.fallar(nombre, Exception(
+                        f"La invocacion {self.invocation_id} termino en estado {invocacion.get('state')}"
+                    ))
+                for paso in invocacion.get("steps", []):
+                    nombre = por_indice.get(paso.get("order_index"))
+                    if nombre in sin_job and paso.get("job_id"):
+                        sin_job.discard(nombre)
+                        futuros[self.seguir(nombre, paso["job_id"])] = (nombre, paso["job_id"])
+
+            if not futuros:
+                time.sleep(intervalo)
+                continue
+
+            if sin_job:
+                timeout = intervalo
+            else:
+                timeout = INTERVALO_CANCELACION if self.cancelado is not None else None
+            terminados, _ = wait(list(futuros), timeout=timeout, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre, job_id = futuros.pop(futuro)
+                self.job_terminado(nombre, job_id, futuro.result())
+
+        return {nombre: self.ctx[nombre] for nombre in self.indices}
@@ -1,9 +1,16 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from pipeline_app.galaxy_client import CLAVE_SESION_API_KEY
 from .models import GalaxyProfile
 
 @receiver(post_save, sender=User)
 def crear_perfil(sender, instance, created, **kwargs):
     if created:
         GalaxyProfile.objects.create(user=instance)
+
+@receiver(user_logged_in)
+def olvidar_api_key(sender, request, user, **kwargs):
+    # La API key cacheada en la sesion se vuelve a resolver en cada login
+    request.session.pop(CLAVE_SESION_API_KEY, None)
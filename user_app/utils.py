@@ -1,9 +1,8 @@
-from bioblend.galaxy import GalaxyInstance
-from django.conf import settings
+from pipeline_app.galaxy_client import obtener_cliente
 
 def validar_api_key(api_key: str) -> bool:
     try:
-        gi = GalaxyInstance(url=settings.GALAXY_URL, key=api_key)
+        gi = obtener_cliente(api_key=api_key)
         gi.users.get_current_user()
         return True
     except Exception: